@@ -0,0 +1,296 @@
+# agreement.py
+"""
+Inter-annotator agreement over stored annotations.
+
+A unit is one note (pid, note date). Each annotator's label for a unit is their latest
+annotation of it (by ts). Three labels are compared:
+  bioUse   yes/no
+  bioCand  yes/no, only between annotators who both said bioUse = no
+  status   use / candidate / none (the two above combined)
+and, for annotators who both said bioUse = yes, the overlap (Jaccard, in days) of their
+biologic start/end windows.
+
+Agreement keeps running totals (Fleiss' per-item terms, one Cohen confusion matrix per
+annotator pair, overlap sums) and updates them one unit at a time. A report therefore
+costs O(pairs), not O(annotations). AgreementIndex keeps it in sync with an
+AnnotationStore through the store's change log, so every worker stays current; each
+index reports how far it has read, and the store prunes what every reader has seen.
+"""
+import itertools
+import os
+import threading
+import time
+from datetime import date as _date
+
+import numpy as np
+
+READ_MARK_EVERY = 600  # seconds; re-report an unchanged position this often, so the store keeps us live
+
+METRICS = {"bioUse": ("no", "yes"), "bioCand": ("no", "yes"), "status": ("none", "candidate", "use")}
+
+
+# ---------- kappa ----------
+def fleiss_kappa(counts):
+    """Fleiss' kappa from an items x categories matrix of rating counts (raters may vary per item)."""
+    counts = np.asarray(counts, dtype=np.float64)
+    n = counts.sum(axis=1)
+    counts = counts[n >= 2]
+    n = n[n >= 2]
+    if not len(n):
+        return None
+    p_i = ((counts * counts).sum(axis=1) - n) / (n * (n - 1))
+    p_j = counts.sum(axis=0) / n.sum()
+    return _kappa(p_i.mean(), (p_j * p_j).sum())
+
+
+def cohen_kappa(confusion):
+    """Cohen's kappa from a square confusion matrix (rows: rater A, columns: rater B)."""
+    m = np.asarray(confusion, dtype=np.float64)
+    total = m.sum()
+    if not total:
+        return None
+    p_o = np.trace(m) / total
+    p_e = (m.sum(axis=0) * m.sum(axis=1)).sum() / (total * total)
+    return _kappa(p_o, p_e)
+
+
+def _kappa(p_o, p_e):
+    if p_e >= 1:
+        return 1.0 if p_o >= 1 else None  # every rating in one category: kappa is undefined
+    return float((p_o - p_e) / (1 - p_e))
+
+
+# ---------- labels ----------
+def _day(s):
+    try:
+        return _date.fromisoformat(str(s).strip()).toordinal()
+    except ValueError:
+        return None
+
+
+def window(rec):
+    """(first, last) day ordinals of a bioUse window; a missing end means a single day."""
+    a, b = _day(rec.get("bioStart") or ""), _day(rec.get("bioEnd") or "")
+    if a is None and b is None:
+        return None
+    a, b = a if a is not None else b, b if b is not None else a
+    return (a, b) if a <= b else (b, a)
+
+
+def window_jaccard(w1, w2):
+    inter = min(w1[1], w2[1]) - max(w1[0], w2[0]) + 1
+    union = max(w1[1], w2[1]) - min(w1[0], w2[0]) + 1
+    return max(inter, 0) / union
+
+
+def categories(rec):
+    use = bool(rec.get("bioUse"))
+    cand = None if use else bool(rec.get("bioCand"))
+    return {"bioUse": int(use), "bioCand": None if cand is None else int(cand),
+            "status": 2 if use else int(cand)}
+
+
+def latest_by_annotator(records):
+    latest = {}
+    for r in records:
+        who = r.get("annotator") or ""
+        if who not in latest or (r.get("ts") or 0) >= (latest[who].get("ts") or 0):
+            latest[who] = r
+    return latest
+
+
+class Unit:
+    """One note's labels and its contribution to the running totals."""
+    __slots__ = ("labels", "cats", "counts", "pairs", "overlaps", "disagree")
+
+    def __init__(self, records):
+        self.labels = latest_by_annotator(records)
+        who = sorted(self.labels)
+        self.cats = {a: categories(self.labels[a]) for a in who}
+        self.counts = {}
+        for m, names in METRICS.items():
+            c = np.zeros(len(names), dtype=np.int64)
+            for a in who:
+                if self.cats[a][m] is not None:
+                    c[self.cats[a][m]] += 1
+            self.counts[m] = c
+        self.pairs = {}     # (a, b) -> {metric: (cat_a, cat_b)}
+        self.overlaps = []  # Jaccard per pair that both marked bioUse with a window
+        for a, b in itertools.combinations(who, 2):
+            ca, cb = self.cats[a], self.cats[b]
+            self.pairs[(a, b)] = {m: (ca[m], cb[m]) for m in METRICS if ca[m] is not None and cb[m] is not None}
+            if ca["bioUse"] and cb["bioUse"]:
+                wa, wb = window(self.labels[a]), window(self.labels[b])
+                if wa and wb:
+                    self.overlaps.append(window_jaccard(wa, wb))
+        self.disagree = len(who) >= 2 and (
+            len({self.cats[a]["status"] for a in who}) > 1 or any(j < 1 for j in self.overlaps))
+
+    def fleiss_term(self, m):
+        c = self.counts[m]
+        n = int(c.sum())
+        return n, (float((c * c).sum() - n) / (n * (n - 1)) if n >= 2 else 0.0)
+
+    def summary(self):
+        return {a: {k: r.get(k) for k in ("bioUse", "bioCand", "bioStart", "bioEnd")} for a, r in self.labels.items()}
+
+
+class Agreement:
+    """Running agreement totals over units, updated by set_unit()."""
+
+    def __init__(self):
+        self.units = {}  # (pid, date) -> Unit
+        self.fleiss = {m: {"sum_p": 0.0, "items": 0, "totals": np.zeros(len(n), dtype=np.int64)} for m, n in METRICS.items()}
+        self.confusion = {m: {} for m in METRICS}  # metric -> (a, b) -> KxK counts
+        self.overlap_sum, self.overlap_n, self.overlap_exact = 0.0, 0, 0
+        self.disagreements = {}  # pid -> set of dates
+        self.rated = {}          # annotator -> notes labelled
+
+    def set_unit(self, pid, date, records):
+        """Replace the labels of one note (records: all its annotations, possibly none)."""
+        key = (pid, date)
+        old = self.units.pop(key, None)
+        if old is not None:
+            self._apply(key, old, -1)
+        if records:
+            unit = Unit(records)
+            self.units[key] = unit
+            self._apply(key, unit, +1)
+
+    def _apply(self, key, unit, sign):
+        for a in unit.labels:
+            self.rated[a] = self.rated.get(a, 0) + sign
+            if not self.rated[a]:
+                del self.rated[a]
+        for m in METRICS:
+            n, p = unit.fleiss_term(m)
+            if n >= 2:
+                f = self.fleiss[m]
+                f["sum_p"] += sign * p
+                f["items"] += sign
+                f["totals"] += sign * unit.counts[m]
+        for pair, cats in unit.pairs.items():
+            for m, (ca, cb) in cats.items():
+                k = len(METRICS[m])
+                conf = self.confusion[m].setdefault(pair, np.zeros((k, k), dtype=np.int64))
+                conf[ca, cb] += sign
+        self.overlap_sum += sign * sum(unit.overlaps)
+        self.overlap_n += sign * len(unit.overlaps)
+        self.overlap_exact += sign * sum(j == 1 for j in unit.overlaps)
+        if unit.disagree:
+            pid, date = key
+            dates = self.disagreements.setdefault(pid, set())
+            (dates.add if sign > 0 else dates.discard)(date)
+            if not dates:
+                del self.disagreements[pid]
+
+    def report(self, pid=None, limit=100):
+        metrics = {}
+        for m, names in METRICS.items():
+            f = self.fleiss[m]
+            totals = f["totals"].astype(np.float64)
+            if f["items"] > 0 and totals.sum():
+                p_j = totals / totals.sum()
+                fleiss = _kappa(f["sum_p"] / f["items"], (p_j * p_j).sum())
+            else:
+                fleiss = None
+            pairs = [
+                {"a": a, "b": b, "n": int(conf.sum()), "kappa": cohen_kappa(conf)}
+                for (a, b), conf in sorted(self.confusion[m].items()) if conf.sum() > 0
+            ]
+            metrics[m] = {"categories": list(names), "items": f["items"], "fleiss_kappa": fleiss, "cohen": pairs}
+        pids = [pid] if pid is not None else sorted(self.disagreements)
+        disagreements = {}
+        for p in pids[:limit]:
+            dates = sorted(self.disagreements.get(p, ()), key=lambda d: (d is None, d))
+            disagreements[p] = [{"date": d, "labels": self.units[(p, d)].summary()} for d in dates]
+        return {
+            "annotators": sorted(self.rated),
+            "units": len(self.units),
+            "multi_rated_units": max(f["items"] for f in self.fleiss.values()),
+            "metrics": metrics,
+            "date_overlap": {
+                "pairs": self.overlap_n,
+                "mean_jaccard": self.overlap_sum / self.overlap_n if self.overlap_n else None,
+                "exact_match": self.overlap_exact / self.overlap_n if self.overlap_n else None,
+            },
+            "patients_with_disagreements": len(self.disagreements),
+            "disagreements": disagreements,
+        }
+
+
+def from_records(records):
+    """Agreement over an iterable of page records (e.g. an export file)."""
+    agg = Agreement()
+    by_unit = {}
+    for r in records:
+        by_unit.setdefault((str(r.get("pid")), _opt_date(r.get("date"))), []).append(r)
+    for (pid, date), recs in by_unit.items():
+        agg.set_unit(pid, date, recs)
+    return agg
+
+
+def _opt_date(v):
+    return None if v is None or v == "" else float(v)
+
+
+class AgreementIndex:
+    """Agreement kept current with an AnnotationStore by replaying its change log."""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._agg = None
+        self._seq = 0
+        self._marked = None  # (seq, time) last reported to the store
+
+    def catch_up(self):
+        """Apply pending changes now (after a write), if the totals have been built."""
+        if self._agg is not None:
+            self.get()
+
+    def get(self):
+        with self._lock:
+            changes = self.store.changed_units(self._seq) if self._agg is not None else None
+            if changes is None:  # first use, or the log was pruned past us
+                self._seq = self.store.last_change()
+                self._agg = from_records(self.store.iter_records())
+            else:
+                seq, units = changes
+                for pid, date in units:
+                    self._agg.set_unit(pid, date, self.store.query(pid=pid, date=date))
+                self._seq = seq
+            self._mark()
+            return self._agg
+
+    def _mark(self):
+        # the name includes the pid: an index created before a fork is one reader per worker
+        if self._marked and self._marked[0] == self._seq and time.time() - self._marked[1] < READ_MARK_EVERY:
+            return
+        self.store.mark_read(f"agreement:{os.getpid()}:{id(self):x}", self._seq)
+        self._marked = (self._seq, time.time())
+
+
+def format_report(rep):
+    """Plain-text rendering of Agreement.report() for the CLI."""
+    fmt = lambda v: "n/a" if v is None else f"{v:.3f}"
+    lines = [
+        f"Annotators: {len(rep['annotators'])}  Notes annotated: {rep['units']}  "
+        f"Notes with 2+ annotators: {rep['multi_rated_units']}",
+        "",
+    ]
+    for m, r in rep["metrics"].items():
+        lines.append(f"{m} ({'/'.join(r['categories'])}): Fleiss kappa {fmt(r['fleiss_kappa'])} over {r['items']} notes")
+        for p in r["cohen"]:
+            lines.append(f"  {p['a']} vs {p['b']}: Cohen kappa {fmt(p['kappa'])} (n={p['n']})")
+    o = rep["date_overlap"]
+    lines += ["", f"Biologic windows: {o['pairs']} compared pairs, mean Jaccard {fmt(o['mean_jaccard'])}, "
+                  f"exact match {fmt(o['exact_match'])}",
+              "", f"Patients with disagreements: {rep['patients_with_disagreements']}"]
+    for pid, items in rep["disagreements"].items():
+        for d in items:
+            labels = "; ".join(
+                f"{a}: {'use ' + (l['bioStart'] or '?') + '..' + (l['bioEnd'] or '?') if l['bioUse'] else ('candidate' if l['bioCand'] else 'none')}"
+                for a, l in sorted(d["labels"].items()))
+            lines.append(f"  {pid} @ {d['date']}: {labels}")
+    return "\n".join(lines)
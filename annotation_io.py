@@ -0,0 +1,210 @@
+# annotation_io.py
+"""
+Streaming export/import of annotations as JSONL, CSV or Parquet (plus the page's old
+"Save to TXT" files, import only).
+
+Exports consume an iterator of page records (see annotation_store.to_record) and yield
+bytes, one batch at a time, so the full result is never held in memory. Imports yield
+records one at a time from a file object.
+"""
+import csv
+import io
+import json
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet is optional
+    pa = pq = None
+
+FIELDS = ["uid", "pid", "date", "annotator", "bioUse", "bioStart", "bioEnd", "bioCand", "note", "ts"]
+MIMETYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+BATCH = 1000
+
+
+def format_for(path, fmt=None):
+    """Explicit format, else from the file extension (.jsonl/.ndjson/.csv/.parquet/.txt)."""
+    if fmt:
+        return fmt
+    ext = Path(path).suffix.lower().lstrip(".")
+    return {"ndjson": "jsonl", "json": "jsonl", "pq": "parquet"}.get(ext, ext)
+
+
+def _batches(records, size=BATCH):
+    batch = []
+    for r in records:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------- export ----------
+def export_jsonl(records):
+    for batch in _batches(records):
+        yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch).encode("utf-8")
+
+
+def _csv_cell(v):
+    if isinstance(v, bool):
+        return int(v)
+    return "" if v is None else v
+
+
+def export_csv(records):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(FIELDS)
+    for batch in _batches(records):
+        w.writerows([_csv_cell(r.get(f)) for f in FIELDS] for r in batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def parquet_schema():
+    return pa.schema([
+        ("uid", pa.string()), ("pid", pa.string()), ("date", pa.float64()), ("annotator", pa.string()),
+        ("bioUse", pa.bool_()), ("bioStart", pa.string()), ("bioEnd", pa.string()), ("bioCand", pa.bool_()),
+        ("note", pa.string()), ("ts", pa.int64()),
+    ])
+
+
+class _Sink(io.RawIOBase):
+    """Write-only buffer that hands out what has been written so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self):
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+def export_parquet(records):
+    """One row group per batch; needs pyarrow."""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = parquet_schema()
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in _batches(records):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+EXPORTERS = {"jsonl": export_jsonl, "csv": export_csv, "parquet": export_parquet}
+
+
+def export(records, fmt):
+    if fmt not in EXPORTERS:
+        raise ValueError(f"unknown export format: {fmt!r} (use jsonl, csv or parquet)")
+    return EXPORTERS[fmt](records)
+
+
+# ---------- import ----------
+def _flag(v):
+    if v is None or isinstance(v, bool):
+        return v
+    s = str(v).strip().lower()
+    if s in ("", "none", "null", "nan"):
+        return None
+    return s in ("1", "1.0", "true", "yes", "y")
+
+
+def read_jsonl(fh):
+    for n, line in enumerate(fh, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {n}: {e}") from None
+
+
+def read_csv(fh):
+    for row in csv.DictReader(fh):
+        rec = {k: (v if v != "" else None) for k, v in row.items() if k in FIELDS}
+        rec["bioUse"] = bool(_flag(rec.get("bioUse")))
+        rec["bioCand"] = _flag(rec.get("bioCand"))
+        yield rec
+
+
+def read_parquet(fh):
+    if pq is None:
+        raise RuntimeError("Parquet import needs pyarrow (pip install pyarrow)")
+    pf = pq.ParquetFile(fh)
+    for i in range(pf.num_row_groups):
+        yield from pf.read_row_group(i).to_pylist()
+
+
+def read_txt(fh):
+    """The page's "Save to TXT" export: an `Annotator:` header, then `---`-separated blocks."""
+    annotator, rec, note_lines = "", None, None
+    for line in fh:
+        line = line.rstrip("\n")
+        if rec is None:
+            if line.startswith("Annotator: "):
+                annotator = line[len("Annotator: "):].strip()
+            elif line.startswith("PATIENT: "):
+                rec = {"pid": line[len("PATIENT: "):].strip(), "annotator": annotator,
+                       "bioUse": False, "bioCand": False, "note": ""}
+            continue
+        if line == "---":
+            if note_lines is not None:
+                rec["note"] = "\n".join(note_lines)
+            yield rec
+            rec, note_lines = None, None
+        elif note_lines is not None:
+            note_lines.append(line)
+        elif line.startswith("NoteDate: "):
+            rec["date"] = line[len("NoteDate: "):].strip()
+        elif line.startswith("BiologicUse: "):
+            rec["bioUse"] = line.endswith("Yes")
+            rec["bioCand"] = None if rec["bioUse"] else rec["bioCand"]
+        elif line.startswith("DateRange: "):
+            start, _, end = line[len("DateRange: "):].partition(" - ")
+            rec["bioStart"], rec["bioEnd"] = start.strip(), end.strip()
+        elif line.startswith("Candidate: "):
+            rec["bioCand"] = line.endswith("Yes")
+        elif line.startswith("Note: "):
+            note_lines = [line[len("Note: "):]]
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv, "parquet": read_parquet, "txt": read_txt}
+
+
+def read(fh, fmt):
+    """Records from an open file: binary for parquet, text for the others."""
+    if fmt not in READERS:
+        raise ValueError(f"unknown import format: {fmt!r} (use jsonl, csv, parquet or txt)")
+    return READERS[fmt](fh)
+
+
+def read_path(path, fmt=None):
+    fmt = format_for(path, fmt)
+    if fmt == "parquet":
+        with open(path, "rb") as fh:
+            yield from read(fh, fmt)
+    else:
+        with open(path, encoding="utf-8", newline="") as fh:
+            yield from read(fh, fmt)
@@ -0,0 +1,284 @@
+# annotation_store.py
+"""
+Server-side annotation store: one SQLite database in WAL mode, shared by all workers.
+
+Each annotation is keyed by a client-generated `uid`, so a batch that is re-sent after
+a network error is applied once. Bulk imports match on the content fingerprint `fp`
+(the fields the page's old deleteAnnotation compared) instead. Records use the page's field names (bioUse, bioStart,
+...); columns are snake_case. Readers never block the writer under WAL, and writes from
+one request go in one transaction.
+"""
+import hashlib
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    uid        TEXT PRIMARY KEY,
+    pid        TEXT NOT NULL,
+    date       REAL,
+    annotator  TEXT NOT NULL DEFAULT '',
+    note       TEXT NOT NULL DEFAULT '',
+    bio_use    INTEGER NOT NULL DEFAULT 0,
+    bio_start  TEXT NOT NULL DEFAULT '',
+    bio_end    TEXT NOT NULL DEFAULT '',
+    bio_cand   INTEGER,
+    ts         INTEGER NOT NULL DEFAULT 0,
+    fp         TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ann_by_patient   ON annotations (pid, date, annotator);
+CREATE INDEX IF NOT EXISTS ann_by_annotator ON annotations (annotator, ts DESC, date DESC);
+CREATE INDEX IF NOT EXISTS ann_by_ts        ON annotations (ts DESC, date DESC);
+CREATE INDEX IF NOT EXISTS ann_by_fp        ON annotations (fp);
+
+-- which notes changed, so derived views (agreement) can update incrementally
+CREATE TABLE IF NOT EXISTS annotation_changes (
+    seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+    pid   TEXT NOT NULL,
+    date  REAL
+);
+CREATE TRIGGER IF NOT EXISTS ann_log_insert AFTER INSERT ON annotations BEGIN
+    INSERT INTO annotation_changes (pid, date) VALUES (NEW.pid, NEW.date);
+END;
+CREATE TRIGGER IF NOT EXISTS ann_log_update AFTER UPDATE ON annotations BEGIN
+    INSERT INTO annotation_changes (pid, date) VALUES (OLD.pid, OLD.date);
+    INSERT INTO annotation_changes (pid, date) VALUES (NEW.pid, NEW.date);
+END;
+CREATE TRIGGER IF NOT EXISTS ann_log_delete AFTER DELETE ON annotations BEGIN
+    INSERT INTO annotation_changes (pid, date) VALUES (OLD.pid, OLD.date);
+END;
+
+-- how far each reader of the change log has got; entries all live readers have seen are pruned
+CREATE TABLE IF NOT EXISTS annotation_readers (
+    name  TEXT PRIMARY KEY,
+    seq   INTEGER NOT NULL,
+    seen  REAL NOT NULL
+);
+"""
+SCHEMA_VERSION = 5  # 2: fp column, 3: change log, 4: bio_cand 0 (not NULL) when bio_use is 0, 5: log readers
+READER_STALE = 3600  # seconds; a reader not heard from for longer no longer holds back pruning
+
+COLUMNS = ["uid", "pid", "date", "annotator", "note", "bio_use", "bio_start", "bio_end", "bio_cand", "ts"]
+ORDER = "ORDER BY ts DESC, date DESC"
+
+
+def _opt_float(v):
+    if v is None or v == "":
+        return None
+    return float(v)
+
+
+def fingerprint(pid, date, annotator, note, bio_use, bio_start, bio_end, bio_cand):
+    """Content identity of an annotation: everything but uid and ts."""
+    key = json.dumps([pid, date, annotator, note, bool(bio_use), bio_start, bio_end, bio_cand])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def to_row(rec, default_uid=False):
+    """Page record -> column tuple (+ fp). Raises ValueError on a malformed record."""
+    if not isinstance(rec, dict):
+        raise ValueError("annotation must be an object")
+    uid = str(rec.get("uid") or "").strip()
+    pid = str(rec.get("pid") or "").strip()
+    if not pid or not (uid or default_uid):
+        raise ValueError("annotation needs uid and pid")
+    bio_use = bool(rec.get("bioUse"))
+    cand = rec.get("bioCand")
+    content = (
+        pid,
+        _opt_float(rec.get("date")),
+        str(rec.get("annotator") or ""),
+        str(rec.get("note") or ""),
+        int(bio_use),
+        str(rec.get("bioStart") or "") if bio_use else "",
+        str(rec.get("bioEnd") or "") if bio_use else "",
+        None if bio_use else int(bool(cand)),  # "not a candidate" whether sent as false or null
+    )
+    fp = fingerprint(*content)
+    return (uid or f"fp-{fp}", *content, int(float(rec.get("ts") or 0)), fp)
+
+
+def to_record(row):
+    """Column tuple -> page record."""
+    uid, pid, date, annotator, note, bio_use, bio_start, bio_end, bio_cand, ts = row[:10]
+    if date is not None and date == int(date):
+        date = int(date)
+    return {
+        "uid": uid,
+        "pid": pid,
+        "date": date,
+        "annotator": annotator,
+        "note": note,
+        "bioUse": bool(bio_use),
+        "bioStart": bio_start,
+        "bioEnd": bio_end,
+        "bioCand": None if bio_cand is None else bool(bio_cand),
+        "ts": ts,
+    }
+
+
+_ANY = object()
+
+
+def _where(pid=None, annotator=None, date=_ANY):
+    conds, args = [], []
+    if pid is not None:
+        conds.append("pid = ?")
+        args.append(pid)
+    if date is not _ANY:
+        conds.append("date IS ?")
+        args.append(date)
+    if annotator is not None:
+        conds.append("annotator = ?")
+        args.append(annotator)
+    return (" WHERE " + " AND ".join(conds) if conds else ""), args
+
+
+class AnnotationStore:
+    """Thread-safe access to the annotations database (one connection per thread)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    self._migrate(conn)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _migrate(conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(annotations)")}
+        with conn:
+            if cols and "fp" not in cols:  # a version-1 database
+                conn.execute("ALTER TABLE annotations ADD COLUMN fp TEXT NOT NULL DEFAULT ''")
+            if cols and version < 4:  # fingerprints from before bio_cand was normalised
+                conn.execute("UPDATE annotations SET bio_cand = 0 WHERE bio_use = 0 AND bio_cand IS NULL")
+                rows = conn.execute(f"SELECT rowid, {', '.join(COLUMNS[1:9])} FROM annotations").fetchall()
+                conn.executemany("UPDATE annotations SET fp = ? WHERE rowid = ?",
+                                 [(fingerprint(*r[1:]), r[0]) for r in rows])
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def write(self, upserts=(), deletes=()):
+        """
+        Apply a batch in one transaction; returns (written, deleted, rejected). A malformed
+        record does not fail the batch: it is left out and listed in `rejected` as
+        {"index", "uid", "error"}.
+        """
+        rows, rejected = [], []
+        for k, rec in enumerate(upserts):
+            try:
+                rows.append(to_row(rec))
+            except (ValueError, TypeError, OverflowError) as e:
+                uid = rec.get("uid") if isinstance(rec, dict) else None
+                rejected.append({"index": k, "uid": uid, "error": str(e)})
+        uids = [(str(u),) for u in deletes]
+        placeholders = ", ".join("?" * (len(COLUMNS) + 1))
+        updates = ", ".join(f"{c}=excluded.{c}" for c in COLUMNS[1:] + ["fp"])
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO annotations ({', '.join(COLUMNS)}, fp) VALUES ({placeholders}) "
+                f"ON CONFLICT(uid) DO UPDATE SET {updates}",
+                rows,
+            )
+            deleted = conn.executemany("DELETE FROM annotations WHERE uid = ?", uids).rowcount if uids else 0
+        return len(rows), max(deleted, 0), rejected
+
+    def query(self, pid=None, annotator=None, limit=None, offset=0, date=_ANY):
+        """Annotations, newest first, optionally for one patient (and note date) and/or annotator."""
+        where, args = _where(pid, annotator, date)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM annotations{where} {ORDER} LIMIT ? OFFSET ?"
+        args += [-1 if limit is None else int(limit), int(offset)]
+        return [to_record(r) for r in self._conn().execute(sql, args)]
+
+    def count(self, pid=None, annotator=None):
+        where, args = _where(pid, annotator)
+        return self._conn().execute(f"SELECT COUNT(*) FROM annotations{where}", args).fetchone()[0]
+
+    def iter_records(self, pid=None, annotator=None, batch=1000):
+        """All matching annotations, streamed from one cursor `batch` rows at a time."""
+        where, args = _where(pid, annotator)
+        cur = self._conn().execute(f"SELECT {', '.join(COLUMNS)} FROM annotations{where} ORDER BY pid, date, annotator", args)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            for r in rows:
+                yield to_record(r)
+
+    def import_records(self, records, batch=1000):
+        """
+        Merge records whose fingerprint is not stored yet (records without a uid get one
+        derived from the fingerprint): a new uid is inserted, a stored uid with other
+        content is updated to the imported version. One transaction per batch; returns
+        (inserted, updated, skipped).
+        """
+        cols = ", ".join(COLUMNS + ["fp"])
+        new = "NOT EXISTS (SELECT 1 FROM annotations WHERE fp = ?)"
+        insert = (f"INSERT INTO annotations ({cols}) SELECT {', '.join('?' * (len(COLUMNS) + 1))} "
+                  f"WHERE {new} ON CONFLICT(uid) DO NOTHING")
+        update = (f"UPDATE annotations SET {', '.join(c + ' = ?' for c in COLUMNS[1:] + ['fp'])} "
+                  f"WHERE uid = ? AND {new}")
+        conn = self._conn()
+        inserted = updated = seen = 0
+        chunk = []
+        for rec in itertools.chain(records, [None]):
+            if rec is not None:
+                chunk.append(to_row(rec, default_uid=True))
+                if len(chunk) < batch:
+                    continue
+            if chunk:
+                with conn:
+                    inserted += max(conn.executemany(insert, [(*r, r[-1]) for r in chunk]).rowcount, 0)
+                    updated += max(conn.executemany(update, [(*r[1:], r[0], r[-1]) for r in chunk]).rowcount, 0)
+                seen += len(chunk)
+                chunk = []
+        return inserted, updated, seen - inserted - updated
+
+    def last_change(self):
+        # AUTOINCREMENT's counter, which survives pruning the log down to nothing
+        row = self._conn().execute("SELECT seq FROM sqlite_sequence WHERE name = 'annotation_changes'").fetchone()
+        return row[0] if row else 0
+
+    def changed_units(self, since):
+        """
+        (latest seq, {(pid, date)}) for every change after `since`, or None if some of
+        those changes have been pruned (the reader must start over from last_change()).
+        """
+        conn = self._conn()
+        rows = conn.execute("SELECT seq, pid, date FROM annotation_changes WHERE seq > ? ORDER BY seq", (since,)).fetchall()
+        if not rows:
+            return None if self.last_change() > since else (since, set())
+        if rows[0][0] > since + 1:
+            return None
+        return rows[-1][0], {(pid, date) for _, pid, date in rows}
+
+    def mark_read(self, reader, seq):
+        """Record that `reader` has applied the log up to `seq`, and prune what every live reader has."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT INTO annotation_readers (name, seq, seen) VALUES (?, ?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET seq = excluded.seq, seen = excluded.seen", (reader, seq, now))
+            conn.execute("DELETE FROM annotation_readers WHERE seen < ?", (now - READER_STALE,))
+            conn.execute("DELETE FROM annotation_changes WHERE seq <= (SELECT MIN(seq) FROM annotation_readers)")
@@ -1,11 +1,47 @@
 # app.py
-from flask import Flask, render_template_string, request, session, redirect, url_for
-import pandas as pd
+from startup_trace import STARTUP  # first: the trace times the imports below
+from flask import Flask, render_template, request, session, redirect, url_for, jsonify, Response, stream_with_context
+import click
+import importlib
+import numpy as np
 import json
+import io
+import hashlib
+import itertools
+import bisect
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import threading
+import time
+import cohort_cache
+import compact_cohort
+from compact_cohort import CompactCohort, nearest_by_date
+from med_index import MedIndex
+from cohort_query import NoteTable
+from note_search import NoteSearch
+from payload import Payload, send_payload
+from instrumentation import METRICS, Instrumentation
+from static_assets import StaticAssets
+import annotation_io
+import agreement
+from annotation_store import AnnotationStore
 from pathlib import Path
 import re
 import os
-from pathlib import Path
+
+class _LazyModule:
+    """Stands in for a module global until first used; then the global is the module itself."""
+    def __init__(self, name, alias):
+        self._name, self._alias = name, alias
+    def __getattr__(self, attr):
+        mod = importlib.import_module(self._name)
+        globals()[self._alias] = mod
+        return getattr(mod, attr)
+
+# pandas (~0.4 s to import) is only needed to parse the CSVs; a process that loads the
+# cohort from the columnar cache never imports it
+pd = _LazyModule("pandas", "pd")
+STARTUP.mark("imports")
 
 # -----------------------------
 # Helpers (backend)
@@ -61,30 +97,138 @@ def try_01(x):
     except Exception:
         return None
 
+# Column-at-a-time versions of try_float / try_01. Numeric columns are converted
+# with numpy; text columns map each distinct value through the scalar helper once.
+def _python_ints(a):
+    return a.astype(np.int64).astype(object)
+
+def float_column(s: "pd.Series") -> np.ndarray:
+    """try_float over a whole column -> object array of int | float | str | None."""
+    if s.dtype == object or s.dtype == bool:
+        uniq = pd.unique(s.dropna())
+        memo = {u: try_float(u) for u in uniq}
+        out = s.map(memo).to_numpy(dtype=object)
+        out[s.isna().to_numpy()] = None
+        return out
+    num = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+    out = np.full(len(num), None, dtype=object)
+    finite = np.isfinite(num)
+    trunc = np.trunc(num)
+    is_int = finite & (np.abs(num - trunc) < 1e-9)
+    is_flt = finite & ~is_int
+    out[is_int] = _python_ints(trunc[is_int])
+    out[is_flt] = num[is_flt].astype(object)
+    is_inf = np.isinf(num)
+    out[is_inf] = [try_float(v) for v in num[is_inf]]
+    return out
+
+def flag_column(s: "pd.Series") -> np.ndarray:
+    """try_01 over a whole column -> object array of 0 | 1 | None."""
+    if s.dtype == object or s.dtype == bool:
+        uniq = pd.unique(s.dropna())
+        memo = {u: try_01(u) for u in uniq}
+        out = s.map(memo).to_numpy(dtype=object)
+        out[s.isna().to_numpy()] = None
+        return out
+    num = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+    out = np.full(len(num), None, dtype=object)
+    ok = ~np.isnan(num)
+    out[ok] = _python_ints(num[ok] >= 0.5)
+    return out
+
 SECTION_HEADS = [
     r'Chief Complaint\(s\)', r'HPI', r'Review of Systems', r'Physical Exam',
     r'ASSESSMENT AND PLAN', r'Surgical History', r'Family History',
     r'Social History', r'Medications', r'Allergies', r'Vital Signs',
     r'ORDERS GENERATED DURING THIS VISIT'
 ]
-SECTION_RE = re.compile(r'(' + r'|'.join(SECTION_HEADS) + r')', re.I)
+# the lookahead on the heads' first letters lets the scanner skip most positions
+# without trying all twelve case-insensitive alternatives
+SECTION_RE = re.compile(r'(?=[CcHhRrPpAaSsFfMmVvOo])(' + r'|'.join(SECTION_HEADS) + r')', re.I)
+PAREN_RE   = re.compile(r'\([^)]*\)')
+COMMAS_RE  = re.compile(r'\s*,\s*,\s*')
+BULLET_RE  = re.compile(r'\s*•\s*')
+DASH_RE    = re.compile(r'\s+-\s+')
+SENTENCE_RE = re.compile(r'\.\s+([A-Z<])')
+BLANKS_RE  = re.compile(r'\n{3,}')
 
 def make_friendly_text(text: str) -> str:
     if not isinstance(text, str):
         return ""
-    t = re.sub(r'\s+', ' ', text).strip()
-    t = re.sub(r'\([^)]*\)', '', t)  # remove (...) content
+    t = " ".join(text.split())  # collapse whitespace + strip in one pass
+    t = PAREN_RE.sub('', t)  # remove (...) content
     t = t.replace(".,", ". ").replace(",.", ". ").replace("..", ". ")
-    t = re.sub(r'\s*,\s*,\s*', ', ', t)
+    t = COMMAS_RE.sub(', ', t)
     t = SECTION_RE.sub(r'\n\n\1\n', t)
-    t = re.sub(r'\s*•\s*', r'\n• ', t)
-    t = re.sub(r'\s+-\s+', r'\n- ', t)
-    t = re.sub(r'\.\s+([A-Z<])', r'.\n\1', t)
-    t = re.sub(r'\n{3,}', '\n\n', t)
+    t = BULLET_RE.sub('\n• ', t)
+    t = DASH_RE.sub('\n- ', t)
+    t = SENTENCE_RE.sub(r'.\n\1', t)
+    t = BLANKS_RE.sub('\n\n', t)
     return t.strip()
 
+# A cut between two alphanumerics separated by whitespace leaves make_friendly_text's
+# output unchanged (the pieces are joined by one space) unless the cut is inside (...)
+# or a section head is near it: the other rules all need punctuation at the cut.
+CUT_RE = re.compile(r'[A-Za-z0-9](\s+)(?=[A-Za-z0-9])')
+CUT_CONTEXT = 48  # collapsed chars checked on each side; longer than any section head
+PRETTY_FIRST_CHUNK = 1024  # raw chars formatted before the first piece is sent
+PRETTY_CHUNK = 8192
+
+def _safe_cut(text: str, start: int, parens: tuple):
+    """First index >= start where text can be cut (see CUT_RE), or None."""
+    opens, closes = parens
+    m = CUT_RE.search(text, start)
+    while m:
+        c, d = m.span(1)
+        k = bisect.bisect_right(opens, c) - 1
+        if k >= 0 and closes[k] > c:
+            m = CUT_RE.search(text, closes[k])  # inside (...): resume after it
+            continue
+        left = " ".join(text[max(c - 4 * CUT_CONTEXT, 0):c].split())
+        right = " ".join(text[d:d + 4 * CUT_CONTEXT].split())
+        window = left[-CUT_CONTEXT:] + " " + right[:CUT_CONTEXT]
+        if ((len(left) < CUT_CONTEXT and c > 4 * CUT_CONTEXT) or (len(right) < CUT_CONTEXT and d + 4 * CUT_CONTEXT < len(text))
+                or "(" in window or ")" in window or SECTION_RE.search(window)):
+            m = CUT_RE.search(text, d)  # too little context, or a (...) / section head nearby
+            continue
+        return c
+    return None
+
+def iter_friendly_text(text: str, first: int = PRETTY_FIRST_CHUNK, size: int = PRETTY_CHUNK):
+    """
+    make_friendly_text in pieces, for streaming: "".join(...) equals make_friendly_text(text).
+    The first piece covers about `first` raw chars, so it is ready in constant time
+    whatever the note's length; the rest come `size` raw chars at a time.
+    """
+    if not isinstance(text, str):
+        return
+    # the (...) spans make_friendly_text removes, found once for every cut
+    spans = [m.span() for m in PAREN_RE.finditer(text)]
+    parens = ([o for o, _ in spans], [e for _, e in spans])
+    lo, sep = 0, ""
+    while True:
+        step = first if lo == 0 else size
+        cut = _safe_cut(text, lo + step, parens) if len(text) - lo > step else None
+        piece = make_friendly_text(text[lo:cut])
+        if piece:
+            yield sep + piece
+            sep = " "
+        if cut is None:
+            return
+        lo = cut
+
+FRIENDLY_CACHE_SIZE = int(os.getenv("FRIENDLY_CACHE_SIZE", "2048"))
+
+@lru_cache(maxsize=FRIENDLY_CACHE_SIZE)
+def friendly_text(text: str) -> str:
+    """make_friendly_text computed on first access; LRU keyed by the (hashed) note text."""
+    return make_friendly_text(text)
+
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-change-me")
+# METRICS=1: stage timers + /metrics; PROFILE_REQUESTS=1: ?__profile=1 (see instrumentation.py)
+INSTRUMENTATION = Instrumentation(app)
+STARTUP.mark("flask app")
 
 # -----------------------------
 # Data (paths + columns)
@@ -301,33 +445,6 @@ MEDS_CSV  = Path(os.getenv("MEDS_CSV",  BASE_DIR /  "Medication_1600_ATS_severe.
 CSV_FILE_NOTES = NOTES_CSV
 CSV_FILE_LABS  = LABS_CSV
 
-DATA_LOADED = False
-LOAD_ERR = None
-
-def ensure_data_loaded():
-    global DATA_LOADED, LOAD_ERR
-    global PATIENTS_NOTES, LABS_BY_PATIENT, DEMO_BY_PATIENT, PATIENTS, BIO_EVENTS
-
-    if DATA_LOADED:
-        return
-
-    try:
-        PATIENTS_NOTES = load_notes(CSV_FILE_NOTES)
-        LABS_BY_PATIENT, DEMO_BY_PATIENT = load_labs(CSV_FILE_LABS)
-
-        allowed = set(LABS_BY_PATIENT.keys())
-        PATIENTS = {pid: val for pid, val in PATIENTS_NOTES.items() if pid in allowed}
-        LABS_BY_PATIENT = {pid: LABS_BY_PATIENT[pid] for pid in PATIENTS if pid in LABS_BY_PATIENT}
-        DEMO_BY_PATIENT = {pid: DEMO_BY_PATIENT.get(pid, {"AGE": None, "SEX": "", "BMI": None}) for pid in PATIENTS}
-
-        BIO_EVENTS = build_bio_events(Patient_bio_used_with_data, set(PATIENTS.keys()))
-
-        DATA_LOADED = True
-    except FileNotFoundError as e:
-        LOAD_ERR = f"Data files not found. NOTES_CSV='{CSV_FILE_NOTES}', LABS_CSV='{CSV_FILE_LABS}'. Error: {e}"
-    except Exception as e:
-        LOAD_ERR = f"Failed to load data: {e}"
-
 LAB_COLUMNS_SHOW = [
     "Absolute Basophils", "Absolute Eosinophils", "Absolute Lymphocytes",
     "Absolute Neutrophils", "FEV1 PRE", "FEV1/FVC PRE",
@@ -361,35 +478,113 @@ REF_RANGES = {
 # -----------------------------
 # Loaders
 # -----------------------------
-def load_notes(csv_path: Path):
-    df = pd.read_csv(csv_path, dtype={"PATIENTHASHMRN": str})
-    df = df[df["PATIENTHASHMRN"].isin(Candidate_patients)]
-    needed = ["PATIENTHASHMRN", "ENCDATEDIFFNO", "DEIDENTIFIED_TEXT"]
-    for c in needed:
+STARTUP.mark("cohort config")
+COHORT = frozenset(Candidate_patients)
+# rows per read_csv chunk; peak memory is one chunk plus the cohort's rows
+CSV_CHUNKSIZE = int(os.getenv("CSV_CHUNKSIZE", "100000"))
+
+def read_csv_filtered(csv_path: Path, pids=None, usecols=None, chunksize=None):
+    """
+    Stream a CSV in chunks and keep only rows whose PATIENTHASHMRN is in `pids`
+    (all rows when pids is None). `usecols` is a set of column names to keep;
+    names missing from the file are ignored.
+    """
+    chunksize = chunksize or CSV_CHUNKSIZE
+    pick = (lambda c: c in usecols) if usecols is not None else None
+    reader = pd.read_csv(csv_path, dtype={"PATIENTHASHMRN": str}, usecols=pick, chunksize=chunksize)
+    parts = []
+    with reader:
+        for chunk in reader:
+            if pids is not None and "PATIENTHASHMRN" in chunk.columns:
+                chunk = chunk[chunk["PATIENTHASHMRN"].isin(pids)]
+            if len(chunk):
+                parts.append(chunk)
+    if not parts:
+        return pd.read_csv(csv_path, dtype={"PATIENTHASHMRN": str}, usecols=pick, nrows=0)
+    return pd.concat(parts, ignore_index=True)
+
+# Each loader is split into read_*_frame (raw cohort rows) and build_* (rows -> dicts),
+# so the hot reloader can rebuild just the patients whose rows changed.
+NOTE_COLS = ["PATIENTHASHMRN", "ENCDATEDIFFNO", "DEIDENTIFIED_TEXT"]
+
+def read_notes_frame(csv_path: Path, pids=None):
+    df = read_csv_filtered(csv_path, pids, usecols=set(NOTE_COLS))
+    for c in NOTE_COLS:
         if c not in df.columns:
             raise ValueError(f"Missing column in notes CSV: {c}")
+    return df
+
+@METRICS.timed("load_notes")
+def load_notes(csv_path: Path, pids=None):
+    return build_notes(read_notes_frame(csv_path, pids))
+
+def build_notes(df, workers=None):
     df["ENCDATEDIFFNO"] = pd.to_numeric(df["ENCDATEDIFFNO"], errors="coerce")
-    df = df.dropna(subset=["ENCDATEDIFFNO"]).reset_index(drop=True)
+    df = df.dropna(subset=["ENCDATEDIFFNO", "PATIENTHASHMRN"])
+    # one stable sort by (patient, date) instead of a sort per patient group
+    df = df.sort_values(["PATIENTHASHMRN", "ENCDATEDIFFNO"], kind="stable")
+    pids = df["PATIENTHASHMRN"].to_numpy()
+    dates = df["ENCDATEDIFFNO"].to_numpy(dtype=np.float64).tolist()
+    texts = df["DEIDENTIFIED_TEXT"].astype(str).tolist()
+    starts = np.flatnonzero(np.r_[True, pids[1:] != pids[:-1]]) if len(pids) else np.zeros(0, dtype=np.int64)
+    bounds = np.r_[starts, len(pids)].tolist()
 
     patients = {}
-    for pid, g in df.groupby("PATIENTHASHMRN"):
-        g = g.sort_values("ENCDATEDIFFNO")
-        notes = []
-        for r in g.itertuples(index=False):
-            raw = str(r.DEIDENTIFIED_TEXT)
-            notes.append({
-                "date": float(r.ENCDATEDIFFNO),
-                "text": raw,
-                "pretty": make_friendly_text(raw)
-            })
-        if notes:
-            dvals = [n["date"] for n in notes]
-            patients[pid] = {"notes": notes, "min_date": min(dvals), "max_date": max(dvals)}
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        notes = [{"date": d, "text": t} for d, t in zip(dates[a:b], texts[a:b])]
+        patients[pids[a]] = {"notes": notes, "min_date": dates[a], "max_date": dates[b - 1]}
+    workers = NOTES_WORKERS if workers is None else workers
+    if workers > 0:
+        precompute_friendly(patients, workers)
     return patients
 
-def load_labs(csv_path: Path):
-    df = pd.read_csv(csv_path, dtype={"PATIENTHASHMRN": str})
-    alias = resolve_lab_aliases(df.columns)
+# Friendly text: 0 (default) = made per request (friendly_text LRU), the pool is unused;
+# 1 = all at load, serially; N > 1 = all at load in N processes. Output is the same in
+# every mode.
+NOTES_WORKERS = int(os.getenv("NOTES_WORKERS", "0"))
+SHARDS_PER_WORKER = 4  # more shards than workers evens out uneven patients
+
+def patient_shard(pid, n):
+    """Shard of a patient, stable across processes and runs (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(pid.encode("utf-8"), digest_size=8).digest(), "little") % n
+
+def _friendly_shard(texts):
+    return [make_friendly_text(t) for t in texts]
+
+@METRICS.timed("friendly_text")
+def precompute_friendly(patients, workers):
+    """Add "pretty" to every note, in a process pool when workers > 1."""
+    if workers <= 1:
+        for p in patients.values():
+            for n in p["notes"]:
+                n["pretty"] = make_friendly_text(n["text"])
+        return patients
+    n_shards = workers * SHARDS_PER_WORKER
+    shards = [[] for _ in range(n_shards)]
+    for pid in patients:
+        shards[patient_shard(pid, n_shards)].append(pid)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = [pool.submit(_friendly_shard, [n["text"] for pid in shard for n in patients[pid]["notes"]])
+                   for shard in shards]
+        # each result is written back to the note it came from, so the merge order is fixed
+        for shard, fut in zip(shards, results):
+            pretty = iter(fut.result())
+            for pid in shard:
+                for n in patients[pid]["notes"]:
+                    n["pretty"] = next(pretty)
+    return patients
+
+def read_labs_frame(csv_path: Path, pids=None):
+    header = pd.read_csv(csv_path, nrows=0).columns
+    alias = resolve_lab_aliases(header)
+    wanted = {"PATIENTHASHMRN", "AGE", "SEX", "BMI", *SYMPTOM_COLS, *(c for c in alias.values() if c)}
+    return read_csv_filtered(csv_path, pids, usecols=wanted), alias
+
+@METRICS.timed("load_labs")
+def load_labs(csv_path: Path, pids=None):
+    return build_labs(*read_labs_frame(csv_path, pids))
+
+def build_labs(df, alias):
     date_col = alias.get("DATE_DIF") or "DATE_DIF"
     if date_col not in df.columns:
         df[date_col] = pd.NA
@@ -397,56 +592,65 @@ def load_labs(csv_path: Path):
         if col not in df.columns:
             df[col] = pd.NA
     df[date_col] = pd.to_numeric(df[date_col], errors="coerce")
-    df = df.dropna(subset=[date_col]).reset_index(drop=True)
-
-    labs_by_patient = {}
-    demo_by_patient = {}
-    for pid, g in df.groupby("PATIENTHASHMRN"):
-        g = g.sort_values(date_col)
-
-        series = []
-        for _, row in g.iterrows():
-            item = {"date": try_float(row.get(date_col))}
-            for c in LAB_COLUMNS_SHOW:
-                src = alias.get(c)
-                val = row.get(src) if src in row else None
-                item[c] = try_float(val)
-            for c in SYMPTOM_COLS:
-                item[c] = try_01(row.get(c))
-            series.append(item)
-        labs_by_patient[pid] = series
-
-        gg = g.dropna(subset=["AGE", "SEX", "BMI"], how="all")
-        if len(gg) > 0:
-            last = gg.sort_values(date_col).iloc[-1]
-            demo_by_patient[pid] = {
-                "AGE": try_float(last.get("AGE")),
-                "SEX": str(last.get("SEX")) if pd.notna(last.get("SEX")) else "",
-                "BMI": try_float(last.get("BMI")),
-            }
-        else:
-            demo_by_patient[pid] = {"AGE": None, "SEX": "", "BMI": None}
+    df = df.dropna(subset=[date_col, "PATIENTHASHMRN"])
+    # one stable sort replaces the per-patient sort; rows stay grouped by patient
+    df = df.sort_values(["PATIENTHASHMRN", date_col], kind="mergesort").reset_index(drop=True)
+
+    n = len(df)
+    keys = ["date"] + LAB_COLUMNS_SHOW + SYMPTOM_COLS
+    cols = [float_column(df[date_col])]
+    for c in LAB_COLUMNS_SHOW:
+        src = alias.get(c)
+        cols.append(float_column(df[src]) if src in df.columns else np.full(n, None, dtype=object))
+    for c in SYMPTOM_COLS:
+        cols.append(flag_column(df[c]))
+    records = [dict(zip(keys, vals)) for vals in zip(*cols)]
+
+    pids = df["PATIENTHASHMRN"].to_numpy(dtype=object)
+    bounds = np.flatnonzero(pids[1:] != pids[:-1]) + 1 if n else np.array([], dtype=int)
+    starts = [0, *bounds.tolist()]
+    ends = [*bounds.tolist(), n]
+    labs_by_patient = {pids[a]: records[a:b] for a, b in zip(starts, ends) if b > a}
+
+    # latest row (by date) that has any demographics, per patient
+    demo_by_patient = {pid: {"AGE": None, "SEX": "", "BMI": None} for pid in labs_by_patient}
+    has_demo = df[["AGE", "SEX", "BMI"]].notna().any(axis=1)
+    last = df[has_demo].groupby("PATIENTHASHMRN", sort=False).tail(1)
+    sex = last["SEX"]
+    sex_txt = sex.map({u: str(u) for u in pd.unique(sex.dropna())}).where(sex.notna(), "")
+    for pid, age, sx, bmi in zip(last["PATIENTHASHMRN"], float_column(last["AGE"]),
+                                 sex_txt, float_column(last["BMI"])):
+        demo_by_patient[pid] = {"AGE": age, "SEX": sx, "BMI": bmi}
     return labs_by_patient, demo_by_patient
 
 # ---------- NEW: medications loader (patient + date aware) ----------
-def load_medications(csv_path: Path):
+@METRICS.timed("load_medications")
+def load_medications(csv_path: Path, pids=None):
     """
     Returns:
       meds_by_patient: { pid: [ {date: float|None, meds: [str,...]} , ...] }
+        one entry per (patient, date), sorted by date, meds deduped case-insensitively
       err: str|None
     Supports either:
       - one or more text columns with med lists (column name contains med/drug/rx/name)
       - many 0/1 flag columns (header is medication name)
     """
+    df, err = read_meds_frame(csv_path, pids)
+    if err:
+        return {}, err
+    return build_meds(df, med_schema(df)), None
+
+def read_meds_frame(csv_path: Path, pids=None):
+    """Cohort rows of the medications CSV (date column coerced to numeric), or (None, error)."""
     if not csv_path.exists():
-        return {}, f"Medications file not found at: {csv_path}"
+        return None, f"Medications file not found at: {csv_path}"
     try:
-        df = pd.read_csv(csv_path, dtype={"PATIENTHASHMRN": str})
+        df = read_csv_filtered(csv_path, pids)
     except Exception as e:
-        return {}, f"Failed to read medications CSV: {e}"
+        return None, f"Failed to read medications CSV: {e}"
 
     if "PATIENTHASHMRN" not in df.columns:
-        return {}, "Medications CSV must include PATIENTHASHMRN."
+        return None, "Medications CSV must include PATIENTHASHMRN."
 
     # date column best-effort
     date_col = None
@@ -458,6 +662,11 @@ def load_medications(csv_path: Path):
         df["DATE_DIF"] = pd.NA
         date_col = "DATE_DIF"
     df[date_col] = pd.to_numeric(df[date_col], errors="coerce")
+    return df, None
+
+def med_schema(df):
+    """Which columns hold meds. Decided on the whole file so partial rebuilds agree with it."""
+    date_col = next(c for c in ["DATE_DIF", "ENCDATEDIFFNO", "DATE_DIFFNO", "DATE_DIFF"] if c in df.columns)
 
     # identify med text columns
     def is_med_text_col(col):
@@ -465,88 +674,95 @@ def load_medications(csv_path: Path):
         return any(k in c for k in ["med", "drug", "rx", "name"]) and df[col].dtype == object
     text_med_cols = [c for c in df.columns if is_med_text_col(c)]
 
-    # identify binary med columns (0/1)
+    # identify binary med columns (0/1); test distinct values, not every cell
     NON_MED_LIKE = {
         "patienthashmrn", "date_dif", "encdatediffno", "date_diffno", "date_diff",
         "age", "sex", "bmi", "ats_severe", "atssevere",
         "note", "notes", "provider", "encounter", "visit", "mrn", "id"
     }
+    def is_binary(vals):
+        try:
+            fv = set(np.asarray(vals).astype(float).tolist())
+        except Exception:
+            return False
+        return bool(fv) and fv.issubset({0.0, 1.0})
     bin_med_cols = []
     for c in df.columns:
         lc = _norm(c)
-        if lc in NON_MED_LIKE: 
+        if lc in NON_MED_LIKE:
             continue
-        # boolean dtypes
         if df[c].dtype == bool:
             bin_med_cols.append(c)
             continue
-        # numeric {0,1}
+        if is_binary(pd.unique(df[c].dropna())):
+            if not any(tok in c.lower() for tok in ["date","age","sex","bmi","count","score","risk","flag"]):
+                bin_med_cols.append(c)
+
+    return {
+        "date_col": date_col,
+        "text_cols": text_med_cols,
+        "bin_cols": bin_med_cols,
+        # prefer rows with valid date if present
+        "dated_only": bool(df[date_col].notna().any()),
+    }
+
+def build_meds(df, schema):
+    date_col, text_med_cols, bin_med_cols = schema["date_col"], schema["text_cols"], schema["bin_cols"]
+
+    def flag_true(v):
         try:
-            vals = pd.unique(df[c].dropna().astype(float))
-            if len(vals) and set(vals).issubset({0.0, 1.0}):
-                if not any(tok in c.lower() for tok in ["date","age","sex","bmi","count","score","risk","flag"]):
-                    bin_med_cols.append(c)
+            return float(v) == 1.0
         except Exception:
-            pass
+            return str(v).strip().lower() in {"true","t","yes","y"}
 
-    split_re = re.compile(r'[;,\|/]+|\s{2,}')
-    def row_meds(row):
-        meds = []
-        for c in text_med_cols:
-            val = row.get(c)
-            if pd.isna(val): 
-                continue
-            s = str(val).strip()
-            if not s: 
-                continue
-            parts = [p.strip() for p in split_re.split(s) if p.strip()]
-            meds.extend(parts)
-        for c in bin_med_cols:
-            v = row.get(c)
-            if pd.isna(v): 
-                continue
-            try:
-                if float(v) == 1.0:
-                    meds.append(str(c).strip())
-            except Exception:
-                if str(v).strip().lower() in {"true","t","yes","y"}:
-                    meds.append(str(c).strip())
-        # normalize + dedupe case-insensitively
-        out, seen = [], set()
-        for m in meds:
-            mm = re.sub(r'\s+', ' ', m).strip()
-            if not mm: 
-                continue
-            key = mm.lower()
-            if key not in seen:
-                seen.add(key)
-                out.append(mm)
-        return out
-
-    meds_by_patient = {}
     work = df.dropna(subset=["PATIENTHASHMRN"])
-    # prefer rows with valid date if present
-    if work[date_col].notna().any():
+    if schema["dated_only"]:
         work = work.dropna(subset=[date_col])
+    work = work.sort_values(["PATIENTHASHMRN", date_col], kind="mergesort", na_position="last")
+    work = work.reset_index(drop=True)
 
-    for pid, g in work.groupby("PATIENTHASHMRN"):
-        series = []
-        for _, row in g.sort_values(date_col, na_position="last").iterrows():
-            series.append({"date": try_float(row.get(date_col)), "meds": row_meds(row)})
-        meds_by_patient[pid] = series
-    return meds_by_patient, None
-
-PATIENTS_NOTES = load_notes(CSV_FILE_NOTES)
-LABS_BY_PATIENT, DEMO_BY_PATIENT = load_labs(CSV_FILE_LABS)
-
-allowed = set(LABS_BY_PATIENT.keys())
-PATIENTS = {pid: val for pid, val in PATIENTS_NOTES.items() if pid in allowed}
-LABS_BY_PATIENT = {pid: LABS_BY_PATIENT[pid] for pid in PATIENTS.keys() if pid in LABS_BY_PATIENT}
-DEMO_BY_PATIENT = {pid: DEMO_BY_PATIENT.get(pid, {"AGE": None, "SEX": "", "BMI": None}) for pid in PATIENTS.keys()}
-
-# ---------- NEW: load meds & restrict to current PATIENTS ----------
-MEDS_BY_PATIENT_ALL, MEDS_ERR = load_medications(MEDS_CSV)
-MEDS_BY_PATIENT = {pid: MEDS_BY_PATIENT_ALL.get(pid, []) for pid in PATIENTS.keys()}
+    # long table (row, col, med) in row -> column -> split-position order.
+    # Med strings repeat heavily, so split/normalize each distinct value once.
+    split_re = re.compile(r'[;,\|/]+|\s{2,}')
+    def split_norm(v):
+        parts = (re.sub(r'\s+', ' ', p).strip() for p in split_re.split(str(v).strip()))
+        return [p for p in parts if p]
+    parts = []
+    for ci, c in enumerate(text_med_cols):
+        col = work[c].dropna()
+        codes, uniq = pd.factorize(col)
+        lists = np.empty(len(uniq), dtype=object)
+        lists[:] = [split_norm(u) for u in uniq]
+        vals = pd.Series(lists[codes], index=col.index).explode().dropna()
+        parts.append(pd.DataFrame({"row": vals.index, "col": ci, "med": vals.to_numpy()}))
+    for bi, c in enumerate(bin_med_cols):
+        col = work[c].dropna()
+        hit = col.map({u: flag_true(u) for u in pd.unique(col)}).astype(bool)
+        idx = col.index[hit.to_numpy()]
+        parts.append(pd.DataFrame({"row": idx, "col": len(text_med_cols) + bi, "med": str(c).strip()}))
+    if parts:
+        long = pd.concat(parts, ignore_index=True).sort_values(["row", "col"], kind="mergesort")
+    else:
+        long = pd.DataFrame({"row": pd.Series(dtype=int), "col": pd.Series(dtype=int), "med": pd.Series(dtype=object)})
+
+    # one record per (patient, date): merge its rows, dedupe case-insensitively
+    gid = work.groupby(["PATIENTHASHMRN", date_col], sort=False, dropna=False).ngroup().to_numpy()
+    long["gid"] = gid[long["row"].to_numpy()]
+    long["key"] = long["med"].str.lower()
+    long = long.drop_duplicates(["gid", "key"], keep="first")
+    # rows are sorted by (patient, date), so gid never decreases: slice instead of groupby().agg(list)
+    g = long["gid"].to_numpy()
+    meds = long["med"].to_numpy()
+    cuts = np.flatnonzero(g[1:] != g[:-1]) + 1
+    starts = [0, *cuts.tolist()]
+    ends = [*cuts.tolist(), len(g)]
+    meds_of = {g[a]: meds[a:b].tolist() for a, b in zip(starts, ends) if b > a}
+
+    first = work.assign(gid=gid).drop_duplicates("gid")
+    meds_by_patient = {}
+    for g, pid, d in zip(first["gid"], first["PATIENTHASHMRN"], float_column(first[date_col])):
+        meds_by_patient.setdefault(pid, []).append({"date": d, "meds": meds_of.get(g, [])})
+    return meds_by_patient
 
 def build_symptom_groups():
     groups = {}
@@ -587,869 +803,77 @@ def build_bio_events(flat_list, valid_patients):
         bio[pid] = uniq
     return bio
 
-BIO_EVENTS = build_bio_events(Patient_bio_used_with_data, set(PATIENTS.keys()))
-
 # -----------------------------
-# Template (UI)
+# Cohort assembly (CSV -> dicts -> CompactCohort), with an on-disk columnar cache
 # -----------------------------
-TEMPLATE = """
-<!doctype html>
-<html lang="en">
-<head>
-  <meta charset="utf-8">
-  <title>Patient Timeline & Biological Propriety (Offline)</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <style>
-    :root{
-      --border:#cfe0f5; --muted:#eef4ff; --bg:#f1f7ff; --pagebg:#f7fbff; --text:#0b1220;
-      --accent:#0ea5e9; --primary:#2563eb; --red:#f43f5e;
-      --good:#10b981; --bad:#ef4444; --unk:#64748b;
-      --tile1:#e0f2fe; --tile1b:#93c5fd;
-      --tile2:#e2e8f0; --tile2b:#94a3b8;
-      --tile3:#e8f5e9; --tile3b:#86efac;
-      --purple:#6366f1; --purpleD:#4f46e5;
-    }
-    body{ font-family: Arial, sans-serif; color:var(--text); background:var(--pagebg); margin:0; padding:24px; }
-    h2,h3{ margin:8px 0; }
-    .small{ color:#555; font-size:13px; }
-
-    .row{ display:flex; gap:28px; align-items:flex-start; }
-    .left{ flex:0 0 58%; display:flex; flex-direction:column; gap:14px; }
-    .right{ flex:1; display:flex; flex-direction:column; gap:14px; }
-
-    .card{ border:1px solid var(--border); border-radius:14px; background:#fff; padding:16px; box-shadow:0 2px 6px rgba(15,23,42,.06); }
-    .card.resizable{ resize:both; overflow:auto; min-width:280px; min-height:180px; }
-    .panel-head{ display:flex; justify-content:space-between; align-items:center; gap:12px; padding-bottom:10px; margin-bottom:12px; border-bottom:1px solid var(--border); }
-    .panel-title{ font-size:20px; font-weight:700; letter-spacing:.2px; }
-
-    .box{ height:440px; overflow-y:auto; padding:14px; background:var(--bg); border:1px solid var(--border); border-radius:10px; white-space:pre-wrap; line-height:1.45; font-family:'Times New Roman', serif; font-size:16px; }
-    .box.resizable{ resize:vertical; min-height:180px; }
-
-    .controls{ display:flex; gap:10px; flex-wrap:wrap; align-items:center; }
-    .controls-stack{ display:flex; flex-direction:column; gap:6px; }
-    select{ padding:8px 10px; border-radius:10px; border:1px solid #cbd5e1; background:#fff; }
-    button{ padding:10px 16px; border:1px solid #bbb; background:#fff; border-radius:10px; cursor:pointer; }
-    button.primary{ background:var(--primary); color:#fff; border-color:var(--primary); }
-    button.ghost{ background:#fff; }
-    .btn-purple{ background:var(--purple); color:#fff; border:1px solid var(--purple); }
-    .btn-purple:hover{ background:var(--purpleD); border-color:var(--purpleD); }
-
-    .annotator { display:flex; align-items:center; gap:10px; }
-    .badge { background:var(--muted); border:1px solid var(--border); color:#0b1220; padding:6px 10px; border-radius:999px; font-weight:700; }
-    .annotator input { padding:8px 10px; border-radius:10px; border:1px solid #cbd5e1; }
-
-    /* Biologic section */
-    .bio-group{ display:flex; flex-direction:column; gap:8px; border:1px solid var(--border); border-radius:10px; padding:10px; background:var(--muted); }
-    .bio-line{ display:flex; gap:14px; align-items:center; flex-wrap:wrap; }
-    .bio-line label{ font-weight:600; }
-    .bio-line input[type="radio"]{ transform:scale(1.05); }
-    .bio-extra{ display:none; gap:12px; align-items:center; flex-wrap:wrap; }
-    .bio-extra input[type="date"]{ padding:8px 10px; border-radius:8px; border:1px solid #cbd5e1; }
-
-    /* Timeline */
-    #timeline-section{ border:1px solid var(--border); border-radius:14px; padding:10px 14px; background:#fff; margin:10px 0 12px 0; box-shadow:0 1px 4px rgba(15,23,42,.05); }
-    .timeline{ position:relative; height:68px; border-top:4px solid var(--accent); border-radius:2px; margin:12px 6px 6px 6px; }
-    .dot{ width:14px; height:14px; border-radius:50%; position:absolute; transform:translateX(-50%); }
-    .dot.blue{ background:#175b82; border:2px solid #0b2f41; }
-    .dot.red{ background:var(--red); border:2px solid #9a1212; }
-    .dot.bio{ width:12px; height:12px; background:var(--good); border:2px solid #065f46; border-radius:2px; transform:translateX(-50%) rotate(45deg); }
-    .dot.gray{ background:#94a3b8; border:2px solid #64748b; }
-    .date-label{ position:absolute; top:28px; transform:translateX(-50%); font-size:12px; color:#111; white-space:nowrap; background:#fff; padding:1px 3px; border-radius:3px; border:1px solid #eee; }
-
-    /* Demographics */
-    .demog-grid{ display:grid; grid-template-columns:repeat(3,1fr); gap:12px; }
-    .tile{ border-radius:14px; padding:14px; }
-    .tile h4{ margin:0 0 6px 0; font-size:14px; color:#334155; text-align:left; }
-    .tile .value{ font-size:28px; font-weight:600; text-align:left; }
-
-    /* Tables */
-    .labs-table{ width:100%; border-collapse:collapse; }
-    .labs-table th, .labs-table td{ border:1px solid #e5e7eb; padding:12px 14px; text-align:left; }
-    .labs-table thead th{ background:var(--muted); font-size:14px; }
-    .labs-table tbody td, .labs-table tbody th{ font-size:16px; }
-
-    /* Symptoms */
-    .sym-grid{ display:grid; grid-template-columns:40px 40px 1fr; gap:8px 12px; align-items:center; }
-    .sym-head{ font-weight:700; }
-    .icon{ display:inline-block; width:20px; height:20px; line-height:20px; text-align:center; font-weight:800; font-size:16px; }
-    .icon.good{ color:var(--good); } .icon.bad{ color:var(--bad); } .icon.unk{ color:var(--unk); }
-
-    .header-line{ display:flex; justify-content:space-between; align-items:flex-start; margin-bottom:6px; }
-    .patient-id{ font-weight:700; font-size:16px; }
-    .muted{ color:#666; }
-    textarea.notes{ width:100%; min-height:120px; resize:vertical; padding:12px; border:1px solid var(--border); border-radius:10px; font-size:14px; line-height:1.45; }
-
-    /* NEW: Medications */
-    .med-filter { width: 100%; margin: 8px 0 10px 0; padding: 8px 10px; border:1px solid #cbd5e1; border-radius:10px; }
-    .med-box { height: 240px; overflow-y: auto; border: 1px solid var(--border); background: var(--bg); border-radius: 10px; padding: 10px 12px; font-size: 15px; line-height: 1.45; white-space: normal; }
-    .med-item { padding: 6px 4px; border-bottom: 1px dashed #e5e7eb; }
-    .med-item:last-child { border-bottom: none; }
-  </style>
-</head>
-<body>
-  <div class="header-line">
-    <div>
-      <div class="patient-id">Patient: <span id="patient-id"></span>
-        <span class="small muted" id="patient-pos"></span>
-        <span class="small muted" id="bio-flag"></span>
-      </div>
-      <div class="annotator" id="annotator-ui"></div>
-    </div>
-    <div class="controls-stack">
-      <div class="controls">
-        <button id="prev-patient-btn">⬅️ Previous Patient</button>
-        <select id="patient-select"></select>
-        <button id="next-patient-btn">Next Patient ➡️</button>
-      </div>
-    </div>
-  </div>
-
-  <div id="timeline-section">
-    <div class="small"><strong>Time Line</strong>: blue = notes; red = selected; <span style="color:#065f46;">green diamonds</span> = biologic use</div>
-    <div id="timeline" class="timeline"></div>
-  </div>
-
-  <div class="row">
-    <div class="left">
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Note Text</div>
-          <div class="controls">
-            <button class="ghost" id="prev-btn">⬅️ Previous Text</button>
-            <button id="friendly-btn" class="btn-purple">👁 Friendly View</button>
-            <button class="ghost" id="next-btn">Next Text ➡️</button>
-          </div>
-        </div>
-        <div id="text-box" class="box resizable"></div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Annotator Note & Biologic Form</div>
-        </div>
-        <textarea id="free-note" class="notes" placeholder="Write your note..."></textarea>
-
-        <!-- Biologic section -->
-        <div class="bio-group" style="margin-top:10px;">
-          <div class="bio-line">
-            <label>Biologic use (y/n):</label>
-            <label><input type="radio" name="bioUse" id="bioUseNo" value="no" checked> No</label>
-            <label><input type="radio" name="bioUse" id="bioUseYes" value="yes"> Yes</label>
-          </div>
-
-          <div id="bio-yes-extra" class="bio-extra">
-            <label>Start: <input type="date" id="bioStart"></label>
-            <label>End: <input type="date" id="bioEnd"></label>
-          </div>
-
-          <div id="bio-no-extra" class="bio-extra" style="display:flex;">
-            <div class="bio-line">
-              <label>Is patient a candidate for biologic therapy? (y/n):</label>
-              <label><input type="radio" name="bioCand" id="bioCandNo" value="no" checked> No</label>
-              <label><input type="radio" name="bioCand" id="bioCandYes" value="yes"> Yes</label>
-            </div>
-          </div>
-        </div>
-
-        <div class="controls" style="margin-top:10px;">
-          <button class="primary" id="save-annotation">Save Annotation</button>
-          <button id="export-txt" class="ghost">💾 Save to TXT</button>
-        </div>
-        <div class="small muted">Saved locally in your browser (offline).</div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Annotations</div>
-        </div>
-        <div id="no-anns" class="small">No annotations yet.</div>
-        <div style="overflow-x:auto; display:none;" id="ann-table-wrap">
-          <table class="labs-table">
-            <thead>
-              <tr>
-                <th>PATIENTHASHMRN</th>
-                <th>Note Date</th>
-                <th>Biologic Use</th>
-                <th>Date Range</th>
-                <th>Candidate?</th>
-                <th>Free Note</th>
-                <th>Annotator</th>
-                <th>Action</th>
-              </tr>
-            </thead>
-            <tbody id="ann-body"></tbody>
-          </table>
-        </div>
-      </div>
-    </div>
-
-    <div class="right">
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Demographics</div>
-        </div>
-        <div id="demo-content" class="demog-grid"></div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Spirometry & Labs – closest to selected note</div>
-        </div>
-        <div id="lab-content"></div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Symptoms – symptom_patient_merged.csv</div>
-        </div>
-        <div class="small" style="margin-bottom:8px;">
-          <span class="icon good">✓</span> present (1) &nbsp;&nbsp;
-          <span class="icon bad">✕</span> absent (0)
-        </div>
-        <div id="sym-content"></div>
-      </div>
-
-      <!-- NEW: Medications panel AT THE BOTTOM -->
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Medications — closest to selected note</div>
-        </div>
-        <div class="small muted" id="med-date"></div>
-        <div class="small muted" id="med-err" style="display:none;"></div>
-        <input id="med-filter" class="med-filter" placeholder="Filter these medications..." />
-        <div id="med-box" class="med-box"></div>
-      </div>
-    </div>
-  </div>
-
-<script>
-  // --------- Embedded data ----------
-  const PATIENTS = {{ patients_json|safe }};
-  const LABS = {{ labs_json|safe }};
-  const DEMO = {{ demo_json|safe }};
-  const LAB_FIELDS = {{ lab_fields_json|safe }};
-  const SYM_GROUPS = {{ sym_groups_json|safe }};
-  const SYM_ORDER = {{ sym_order_json|safe }};
-  const REF_RANGES = {{ ref_ranges_json|safe }};
-  const BIO = {{ bio_json|safe }};  // { pid: [dates...] }
-  // NEW:
-  const MEDS = {{ meds_json|safe }};
-  const MEDS_ERR = {{ meds_err|safe }};
-
-  const PATIENT_IDS = Object.keys(PATIENTS);
-  let currentPatient = PATIENT_IDS[0] || "";
-  let pos = 0;
-  let friendlyMode = false;
-
-  function lockBioRadioForPatient(){
-    const yes = document.getElementById("bioUseYes");
-    const no  = document.getElementById("bioUseNo");
-    const hasBio = Array.isArray(BIO[currentPatient]) && BIO[currentPatient].length > 0;
-
-    if (hasBio){
-      yes.checked = true;  no.checked = false;
-      yes.disabled = true; no.disabled = true;
-      document.getElementById("bio-yes-extra").style.display = "flex";
-      document.getElementById("bio-no-extra").style.display  = "none";
-    } else {
-      yes.checked = false; no.checked = true;
-      yes.disabled = true; no.disabled = true;
-      document.getElementById("bio-yes-extra").style.display = "none";
-      document.getElementById("bio-no-extra").style.display  = "flex";
-    }
-  }
-
-  /* ---------- Annotator UI ---------- */
-  function getAnnotator(){ return localStorage.getItem("annotator_name") || ""; }
-  function setAnnotator(name){ localStorage.setItem("annotator_name", name); }
-  function renderAnnotatorUI(){
-    const host = document.getElementById("annotator-ui");
-    host.innerHTML = "";
-    const name = getAnnotator();
-    if (name){
-      const badge = document.createElement("div");
-      badge.className = "badge";
-      badge.textContent = "Annotator: " + name;
-      const changeBtn = document.createElement("button");
-      changeBtn.className = "ghost";
-      changeBtn.textContent = "Change";
-      changeBtn.onclick = () => {
-        const v = prompt("Set annotator name:", name);
-        if (v === null) return;
-        const trimmed = (v || "").trim();
-        if (!trimmed){ alert("Annotator cannot be empty."); return; }
-        setAnnotator(trimmed);
-        renderAnnotatorUI();
-      };
-      host.appendChild(badge);
-      host.appendChild(changeBtn);
-      return;
-    }
-    const inp = document.createElement("input");
-    inp.id = "annotator-input";
-    inp.placeholder = "Your name (saved)";
-    const btn = document.createElement("button");
-    btn.className = "primary";
-    btn.textContent = "Set";
-    btn.onclick = () => {
-      const v = (document.getElementById("annotator-input").value || "").trim();
-      if (!v){ alert("Please enter annotator name."); return; }
-      setAnnotator(v);
-      renderAnnotatorUI();
-    };
-    host.appendChild(inp);
-    host.appendChild(btn);
-  }
-
-  /* ---------- Helpers ---------- */
-  function el(tag, attrs={}, text=null){
-    const e=document.createElement(tag);
-    Object.entries(attrs).forEach(([k,v])=>e.setAttribute(k,v));
-    if(text!==null) e.textContent=text;
-    return e;
-  }
-  const titleCase = s => s.replace(/\\b\\w/g, c => c.toUpperCase());
-
-  /* ---------- Patient nav ---------- */
-  function renderPatientSelect(){
-    const sel=document.getElementById("patient-select"); sel.innerHTML="";
-    PATIENT_IDS.forEach(pid=>{ const o=el("option",{},pid); o.value=pid; if(pid===currentPatient) o.selected=true; sel.appendChild(o); });
-    sel.onchange=()=>switchPatient(sel.value);
-  }
-  function renderHeader(){
-    document.getElementById("patient-id").textContent=currentPatient;
-    const total=PATIENTS[currentPatient]?.notes?.length||0;
-    document.getElementById("patient-pos").textContent= total ? ` (note ${pos+1} of ${total})` : "";
-    const biolist = BIO[currentPatient] || [];
-    document.getElementById("bio-flag").textContent = biolist.length ? ` | Biologic use: ${biolist.length} date(s)` : "";
-  }
-
-  /* ---------- Text & timeline ---------- */
-  function renderText(){
-    const note = PATIENTS[currentPatient].notes[pos];
-    const box  = document.getElementById("text-box");
-    const btn  = document.getElementById("friendly-btn");
-    const txt  = friendlyMode && note.pretty ? note.pretty : (note.text || "");
-    box.textContent = txt;
-    box.scrollTop = 0;
-    btn.textContent = friendlyMode ? "🔤 Raw View" : "👁 Friendly View";
-  }
-
-  function renderTimeline(){
-    const section = document.getElementById("timeline-section");
-    const tl = document.getElementById("timeline");
-    tl.innerHTML="";
-    const P = PATIENTS[currentPatient] || {notes:[], min_date:0, max_date:0};
-    const notes = P.notes || [];
-    const B = BIO[currentPatient] || [];
-
-    section.style.display="block";
-
-    if ((notes.length === 0) && B.length === 0){
-      const d=el("div",{class:"dot gray"});
-      d.style.left = "50%";
-      d.style.top  = "-6px";
-      d.title = "No timeline data";
-      tl.appendChild(d);
-      return;
-    }
-
-    let minD = P.min_date ?? 0, maxD = P.max_date ?? 1;
-    if (B.length){
-      const bmin = Math.min.apply(null, B);
-      const bmax = Math.max.apply(null, B);
-      if (minD===undefined || minD===null) minD=bmin;
-      if (maxD===undefined || maxD===null) maxD=bmax;
-      if (bmin < minD) minD = bmin;
-      if (bmax > maxD) maxD = bmax;
-    }
-    if (minD===maxD){ maxD = minD + 1; }
-    const span = (maxD - minD) || 1;
-
-    const slots = {};
-    notes.forEach((n,i)=>{
-      const pct = ((n.date - minD) / span) * 100;
-      const key = Math.round(pct*10)/10;
-      const stack = (slots[key]||0); slots[key] = stack + 1;
-
-      const d=el("div",{class:"dot "+(i===pos?"red":"blue")});
-      d.style.left = pct + "%";
-      d.style.top  = (-6 - stack*16) + "px";
-      d.title = "ENCDATEDIFFNO: " + n.date;
-      d.onclick = ()=>{ pos=i; renderAllForNote(); };
-      tl.appendChild(d);
-
-      const lab=el("div",{class:"date-label"});
-      lab.style.left = pct + "%";
-      lab.textContent = String(n.date);
-      tl.appendChild(lab);
-    });
-
-    B.forEach((bd)=>{
-      const pct = ((bd - minD) / span) * 100;
-      const key = Math.round(pct*10)/10;
-      const stack = (slots[key]||0); slots[key] = stack + 1;
-
-      const m=el("div",{class:"dot bio"});
-      m.style.left = pct + "%";
-      m.style.top  = (-6 - stack*16) + "px";
-      m.title = "Biologic use date: " + bd;
-
-      m.onclick = ()=>{
-        let bestI = 0, bestDist = Infinity;
-        (P.notes||[]).forEach((n,i)=>{
-          const dist = Math.abs((n.date ?? bd) - bd);
-          if (dist < bestDist){ bestDist = dist; bestI = i; }
-        });
-        pos = bestI;
-        renderAllForNote();
-      };
-      tl.appendChild(m);
-    });
-  }
-
-  /* ---------- Labs, demo, symptoms ---------- */
-  function valText(v){
-    if (v===null || typeof v==="undefined" || v==="") return "—";
-    if (typeof v === "number") return (Math.abs(v - Math.trunc(v)) < 1e-9) ? String(Math.trunc(v)) : String(Number(v.toFixed(3)));
-    return String(v);
-  }
-  function sexText(v){
-    if (v===null || v===undefined || v==="") return "—";
-    const s=String(v).trim().toLowerCase();
-    if (s==="0" || s==="0.0") return "Female";
-    if (s==="1" || s==="1.0") return "Male";
-    return s.toUpperCase() in {"F":1,"M":1} ? (s.toUpperCase()==="F"?"Female":"Male") : s;
-  }
-  function renderDemographics(){
-    const d=DEMO[currentPatient]||{};
-    const host=document.getElementById("demo-content"); host.innerHTML="";
-    const tiles=[
-      {title:"Age", value:d.AGE,  bg:"var(--tile1)", bd:"var(--tile1b)"},
-      {title:"Sex", value:sexText(d.SEX),  bg:"var(--tile2)", bd:"var(--tile2b)"},
-      {title:"BMI", value:d.BMI,  bg:"var(--tile3)", bd:"var(--tile3b)"},
-    ];
-    tiles.forEach(t=>{
-      const div=document.createElement("div");
-      div.className="tile";
-      div.style.background=t.bg;
-      div.style.border=`1px solid ${t.bd}`;
-      const h4=document.createElement("h4"); h4.textContent=t.title;
-      const v=document.createElement("div"); v.className="value";
-      v.textContent=(t.value==null||t.value==="")?"—":String(t.value);
-      div.appendChild(h4); div.appendChild(v); host.appendChild(div);
-    });
-  }
-  function closestLabRec(pid, targetDate){
-    const arr=LABS[pid]||[]; let best=null, bestDist=Infinity;
-    for(const r of arr){ const d=(r.date==null? targetDate : r.date); const dist=Math.abs(d-targetDate); if(dist<bestDist){ best=r; bestDist=dist; } }
-    return best;
-  }
-  function renderLabsForCurrentNote(){
-    const pid=currentPatient;
-    const targetDate=PATIENTS[pid].notes[pos].date;
-    const best=closestLabRec(pid, targetDate);
-    const host=document.getElementById("lab-content");
-    if(!best){ host.innerHTML='<div class="small muted">No lab/spirometry record for this patient.</div>'; return; }
-
-    const demo = DEMO[pid] || {};
-    const age = typeof demo.AGE === "number" ? demo.AGE : (parseFloat(demo.AGE) || null);
-    const isChild = (age != null) && (age < 18);
-
-    let html = '<table class="labs-table"><thead><tr>';
-    html += '<th>Lab Result</th><th>Your Value</th>';
-    if (!isChild){
-      html += '<th>Typical Reference Range (Adults)</th>';
-    }
-    html += '</tr></thead><tbody>';
-
-    html += '<tr><th>Closest DATE_DIF</th><td>' + valText(best.date) + '</td>' + (isChild ? '' : '<td>—</td>') + '</tr>';
-
-    LAB_FIELDS.forEach(f=>{
-      const v = best.hasOwnProperty(f)? best[f] : null;
-      const rawRef = (REF_RANGES && REF_RANGES[f]) ? REF_RANGES[f] : "—";
-      const ref = (()=>{
-        const low = String(rawRef).toLowerCase();
-        if (low.includes("varies") || low.includes("no single")) return "—";
-        const tokens = String(rawRef).match(/\\d+(?:\\.\\d+)?%?/g) || [];
-        if (tokens.length === 0) return "—";
-        if (tokens.length === 1) return tokens[0];
-        return tokens.slice(0,2).join(" - ");
-      })();
-      html += '<tr><th>' + f + '</th><td>' + valText(v) + '</td>' + (isChild ? '' : '<td>' + ref + '</td>') + '</tr>';
-    });
-    html += "</tbody></table>";
-    host.innerHTML = html;
-  }
-
-  function iconHTML(v){
-    if (v===1 || v==="1") return '<span class="icon good">✓</span>';
-    if (v===0 || v==="0") return '<span class="icon bad">✕</span>';
-    return '<span class="icon unk" style="visibility:hidden">·</span>';
-  }
-
-  function renderSymptoms(){
-    const pid=currentPatient;
-    const targetDate=PATIENTS[pid].notes[pos].date;
-    const best=closestLabRec(pid, targetDate);
-    const host=document.getElementById("sym-content"); host.innerHTML="";
-    if(!best){ host.innerHTML='<div class="small muted">No symptom row found for this date.</div>'; return; }
-
-    const wrap=el("div",{class:"sym-grid"});
-    wrap.appendChild(el("div",{class:"sym-head"},"Previ."));
-    wrap.appendChild(el("div",{class:"sym-head"},"Curr."));
-    wrap.appendChild(el("div",{class:"sym-head"},"Symptom"));
-
-    const SYM_ORDER = {{ sym_order_json|safe }};
-    const SYM_GROUPS = {{ sym_groups_json|safe }};
-
-    SYM_ORDER.forEach(base=>{
-      const group=SYM_GROUPS[base]; if(!group) return;
-      const rawLabel=base.replaceAll("_"," ").replace("general asthma symptoms worsening current","general asthma symptoms worsening");
-      const label=titleCase(rawLabel);
-
-      const pv=(group.previous && (group.previous in best))? best[group.previous] : null;
-      const cv=(group.current  && (group.current  in best))? best[group.current ] : null;
-
-      const pcell=el("div"); pcell.innerHTML = iconHTML(pv);
-      const ccell=el("div"); ccell.innerHTML = iconHTML(cv);
-
-      wrap.appendChild(pcell);
-      wrap.appendChild(ccell);
-      wrap.appendChild(el("div",{},label));
-    });
-    host.appendChild(wrap);
-  }
-
-  // ---------- NEW: Medications ----------
-  function closestMedRec(pid, targetDate){
-    const arr = MEDS[pid] || [];
-    let best=null, bestDist=Infinity;
-    for(const r of arr){
-      const d = (r.date==null || Number.isNaN(r.date)) ? targetDate : r.date;
-      const dist = Math.abs((d ?? targetDate) - targetDate);
-      if (dist < bestDist){ best=r; bestDist=dist; }
-    }
-    return best;
-  }
-
-  function renderMedications(){
-    const errEl = document.getElementById("med-err");
-    const dateEl = document.getElementById("med-date");
-    const box = document.getElementById("med-box");
-    const filterEl = document.getElementById("med-filter");
-
-    if (MEDS_ERR && MEDS_ERR !== "null"){ errEl.style.display="block"; errEl.textContent = MEDS_ERR; }
-    else { errEl.style.display="none"; }
-
-    const pid = currentPatient;
-    const P = PATIENTS[pid];
-    if (!P || (P.notes||[]).length===0){ box.innerHTML = '<div class="small muted">No notes for this patient.</div>'; dateEl.textContent = ""; return; }
-
-    const targetDate = P.notes[pos].date;
-    const best = closestMedRec(pid, targetDate);
+COHORT_CACHE_DIR = Path(os.getenv("COHORT_CACHE_DIR", BASE_DIR / ".cohort_cache"))
+USE_COHORT_CACHE = os.getenv("COHORT_CACHE", "1") != "0"
+
+def load_cohort_from_csv():
+    patients_notes = load_notes(CSV_FILE_NOTES, COHORT)
+    labs, demo = load_labs(CSV_FILE_LABS, COHORT)
+    meds_all, meds_err = load_medications(MEDS_CSV, COHORT)
+    return assemble_cohort(patients_notes, labs, demo, meds_all, meds_err)
+
+def assemble_cohort(patients_notes, labs, demo, meds_all, meds_err):
+    allowed = set(labs.keys())
+    patients = {pid: val for pid, val in patients_notes.items() if pid in allowed}
+    labs = {pid: labs[pid] for pid in patients.keys() if pid in labs}
+    demo = {pid: demo.get(pid, {"AGE": None, "SEX": "", "BMI": None}) for pid in patients.keys()}
+
+    # restrict meds to current patients
+    meds = {pid: meds_all.get(pid, []) for pid in patients.keys()}
+
+    bio = build_bio_events(Patient_bio_used_with_data, set(patients.keys()))
+    return {"patients": patients, "labs": labs, "demo": demo, "meds": meds, "meds_err": meds_err, "bio": bio}
+
+@METRICS.timed("compact")
+def compact(data):
+    return CompactCohort.from_data(data, LAB_COLUMNS_SHOW, SYMPTOM_COLS)
+
+def cohort_cache_key():
+    # the loader code is part of the key: editing it invalidates the cache
+    sources = [CSV_FILE_NOTES, CSV_FILE_LABS, MEDS_CSV,
+               Path(__file__), Path(cohort_cache.__file__), Path(compact_cohort.__file__)]
+    config = json.dumps([sorted(COHORT), Patient_bio_used_with_data, LAB_COLUMNS_SHOW, SYMPTOM_COLS, NOTES_WORKERS > 0])
+    return cohort_cache.source_key(sources, extra=config)
+
+def write_cohort_cache(cohort):
+    try:
+        return cohort_cache.write_cache(COHORT_CACHE_DIR, cohort_cache_key(), cohort)
+    except OSError as e:
+        app.logger.warning("Cohort cache not written to %s: %s", COHORT_CACHE_DIR, e)
+        return None
 
-    if (!best || !Array.isArray(best.meds) || best.meds.length===0){
-      dateEl.textContent = `Closest medication row to note DATE_DIF ${targetDate}: none`;
-      box.innerHTML = '<div class="small muted">No medications on/near this date.</div>';
-      return;
-    }
+@METRICS.timed("load_cohort")
+def load_cohort():
+    """CompactCohort from the cache when it matches the source files, else from the CSVs."""
+    if USE_COHORT_CACHE:
+        with METRICS.stage("cohort_cache_read"), STARTUP.phase("data: cohort cache read"):
+            cached = cohort_cache.read_cache(COHORT_CACHE_DIR / cohort_cache_key())
+        if cached is not None:
+            return cached
+    with STARTUP.phase("data: parse CSVs"):
+        cohort = compact(load_cohort_from_csv())
+    if USE_COHORT_CACHE:
+        write_cohort_cache(cohort)
+    return cohort
+
+@app.cli.command("build-cache")
+def build_cache_command():
+    """Parse the CSVs and write the columnar cohort cache (an up-to-date entry is kept)."""
+    path = write_cohort_cache(compact(load_cohort_from_csv()))
+    print(f"Cohort cache written to {path}" if path else "Cohort cache could not be written.")
+
+STARTUP.mark("loader definitions")
 
-    dateEl.textContent = `Closest medication DATE_DIF: ${best.date==null?'—':best.date} (note selected: ${targetDate})`;
+# -----------------------------
+# Pages (templates/*.html, compiled once by Jinja) + static/ assets (content-hashed URLs)
+# -----------------------------
+ASSETS = StaticAssets(app, BASE_DIR / "static")
+STARTUP.mark("templates + assets")
 
-    const f = (filterEl.value||"").trim().toLowerCase();
-    const list = f ? best.meds.filter(m => String(m).toLowerCase().includes(f)) : best.meds;
 
-    if (list.length === 0){
-      box.innerHTML = '<div class="small muted">No medications match your filter.</div>';
-      return;
-    }
-
-    const frag = document.createDocumentFragment();
-    list.forEach(m=>{
-      const div = document.createElement("div");
-      div.className = "med-item";
-      div.textContent = m;
-      frag.appendChild(div);
-    });
-    box.innerHTML = "";
-    box.appendChild(frag);
-  }
-
-  /* ---------- Annotation storage ---------- */
-  function loadPatientAnnotations(pid){
-    try { return JSON.parse(localStorage.getItem("ann_"+pid)) || []; } catch(e){ return []; }
-  }
-  function savePatientAnnotations(pid, arr){
-    try { localStorage.setItem("ann_"+pid, JSON.stringify(arr)); } catch(e){}
-  }
-
-  function deleteAnnotation(pid, ts, fp){
-    const arr = loadPatientAnnotations(pid);
-    if (ts) {
-      const newArr = arr.filter(r => String(r.ts || "") !== String(ts || ""));
-      savePatientAnnotations(pid, newArr);
-      return;
-    }
-    let removed = false;
-    const newArr = arr.filter(r => {
-      if (removed) return true;
-      const match =
-        String(r.date)            === String(fp.date) &&
-        String(r.annotator||"")   === String(fp.annotator||"") &&
-        String(r.note||"")        === String(fp.note||"") &&
-        String(!!r.bioUse)        === String(!!fp.bioUse) &&
-        String(r.bioStart||"")    === String(fp.bioStart||"") &&
-        String(r.bioEnd||"")      === String(fp.bioEnd||"") &&
-        (fp.bioUse ? true : String(!!(r.bioCand)) === String(!!(fp.bioCand)));
-      if (match) { removed = true; return false; }
-      return true;
-    });
-    savePatientAnnotations(pid, newArr);
-  }
-
-  function loadAllAnnotations(){
-    const out=[];
-    for (let i=0;i<localStorage.length;i++){
-      const k = localStorage.key(i);
-      if (k && k.startsWith("ann_")){
-        try{
-          const pid = k.slice(4);
-          const arr = JSON.parse(localStorage.getItem(k) || "[]");
-          arr.forEach(r => out.push({...r, pid}));
-        }catch(e){}
-      }
-    }
-    out.sort((a,b)=> (b.ts||0)-(a.ts||0) || (b.date||0)-(a.date||0));
-    return out;
-  }
-  function renderAnnTable(){
-    const anns=loadAllAnnotations();
-    const wrap=document.getElementById("ann-table-wrap");
-    const empty=document.getElementById("no-anns");
-    const body=document.getElementById("ann-body");
-    if(anns.length===0){ wrap.style.display="none"; empty.style.display="block"; body.innerHTML=""; return; }
-    empty.style.display="none"; wrap.style.display="block"; body.innerHTML="";
-    anns.forEach(a=>{
-      const tr=el("tr");
-      tr.appendChild(el("td",{}, a.pid));
-      tr.appendChild(el("td",{}, String(a.date)));
-      tr.appendChild(el("td",{}, a.bioUse ? "Yes" : "No"));
-      const dr = (a.bioUse && (a.bioStart||a.bioEnd)) ? `${a.bioStart||""} - ${a.bioEnd||""}` : "—";
-      tr.appendChild(el("td",{}, dr));
-      tr.appendChild(el("td",{}, (a.bioUse ? "—" : (a.bioCand ? "Yes" : "No"))));
-      tr.appendChild(el("td",{}, a.note || ""));
-      tr.appendChild(el("td",{}, a.annotator || "—"));
-
-      const delTd = el("td");
-      const btn = el("button", {
-        type:"button",
-        class:"ghost ann-del",
-        "data-pid": a.pid,
-        "data-ts":  String(a.ts || ""),
-        "data-date": String(a.date ?? ""),
-        "data-annotator": a.annotator || "",
-        "data-note": a.note || "",
-        "data-bious": a.bioUse ? "1" : "0",
-        "data-biostart": a.bioUse ? (a.bioStart || "") : "",
-        "data-bioend":   a.bioUse ? (a.bioEnd   || "") : "",
-        "data-biocand":  a.bioUse ? "" : (a.bioCand ? "1" : "0")
-      }, "🗑 Remove");
-      delTd.appendChild(btn);
-      tr.appendChild(delTd);
-
-      body.appendChild(tr);
-    });
-  }
-
-  /* ---------- Export to TXT ---------- */
-  function downloadTxt(filename, text){
-    const blob = new Blob([text], {type:"text/plain"});
-    const url = URL.createObjectURL(blob);
-    const a = document.createElement("a");
-    a.href = url; a.download = filename; a.click();
-    URL.revokeObjectURL(url);
-  }
-  function exportAnnotations(){
-    const who = getAnnotator();
-    if (!who){ alert("Please set the annotator name first."); return; }
-    const anns = loadAllAnnotations();
-    let lines = [];
-    lines.push(`Annotator: ${who}`);
-    lines.push(`Exported: ${new Date().toISOString()}`);
-    lines.push("");
-    anns.forEach(a=>{
-      lines.push(`PATIENT: ${a.pid}`);
-      lines.push(`NoteDate: ${a.date}`);
-      lines.push(`BiologicUse: ${a.bioUse ? "Yes" : "No"}`);
-      if (a.bioUse){
-        lines.push(`DateRange: ${a.bioStart||""} - ${a.bioEnd||""}`);
-      } else {
-        lines.push(`Candidate: ${a.bioCand ? "Yes" : "No"}`);
-      }
-      if (a.note) lines.push(`Note: ${a.note}`);
-      lines.push(`---`);
-    });
-    downloadTxt(`${who}_annotations.txt`, lines.join("\\n"));
-  }
-
-  /* ---------- Navigation ---------- */
-  function nextNote(){ pos=(pos+1)%PATIENTS[currentPatient].notes.length; renderAllForNote(); }
-  function prevNote(){ pos=(pos-1+PATIENTS[currentPatient].notes.length)%PATIENTS[currentPatient].notes.length; renderAllForNote(); }
-  function nextPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i+1)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
-  function prevPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i-1+PATIENT_IDS.length+PATIENT_IDS.length)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
-  function switchPatient(pid){
-    currentPatient=pid; pos=0;
-    document.getElementById("free-note").value="";
-    document.getElementById("bioUseNo").checked = true;
-    document.getElementById("bioUseYes").checked = false;
-    document.getElementById("bio-yes-extra").style.display = "none";
-    document.getElementById("bio-no-extra").style.display  = "flex";
-    document.getElementById("bioCandNo").checked = true;
-    document.getElementById("bioCandYes").checked = false;
-    document.getElementById("bioStart").value = "";
-    document.getElementById("bioEnd").value = "";
-    lockBioRadioForPatient();
-    renderAll();
-  }
-
-  /* ---------- Render orchestration ---------- */
-  function renderAll(){
-    renderAnnotatorUI();
-    renderPatientSelect(); renderHeader();
-    lockBioRadioForPatient();
-    renderText(); renderTimeline();
-    renderAnnTable(); renderDemographics(); renderLabsForCurrentNote(); renderSymptoms();
-    renderMedications(); // NEW
-    document.getElementById("med-filter").oninput = renderMedications; // NEW
-  }
-  function renderAllForNote(){
-    renderHeader(); renderText(); renderTimeline();
-    renderLabsForCurrentNote(); renderSymptoms();
-    renderMedications(); // NEW
-  }
-
-  /* ---------- Boot ---------- */
-  document.addEventListener("DOMContentLoaded", ()=>{
-    if (PATIENT_IDS.length===0){ alert("No eligible patients (filtered by labs CSV)."); return; }
-    renderAll();
-
-    document.getElementById("next-btn").onclick=(e)=>{ e.preventDefault(); nextNote(); };
-    document.getElementById("prev-btn").onclick=(e)=>{ e.preventDefault(); prevNote(); };
-    document.getElementById("next-patient-btn").onclick=(e)=>{ e.preventDefault(); nextPatient(); };
-    document.getElementById("prev-patient-btn").onclick=(e)=>{ e.preventDefault(); prevPatient(); };
-    document.getElementById("friendly-btn").onclick=()=>{ friendlyMode=!friendlyMode; renderText(); };
-
-    const useNo = document.getElementById("bioUseNo");
-    const useYes = document.getElementById("bioUseYes");
-    useNo.onchange = () => { if (useNo.checked){ document.getElementById("bio-yes-extra").style.display="none"; document.getElementById("bio-no-extra").style.display="flex"; } };
-    useYes.onchange = () => { if (useYes.checked){ document.getElementById("bio-yes-extra").style.display="flex"; document.getElementById("bio-no-extra").style.display="none"; } };
-
-    document.getElementById("save-annotation").onclick=(e)=>{
-      e.preventDefault();
-      const annotator = getAnnotator();
-      if (!annotator){ alert("Please set the annotator name first."); return; }
-
-      const P = PATIENTS[currentPatient];
-      const note = P.notes[pos];
-      const textNote = document.getElementById("free-note").value || "";
-
-      const bioUse   = document.getElementById("bioUseYes").checked;
-      const bioStart = document.getElementById("bioStart").value || "";
-      const bioEnd   = document.getElementById("bioEnd").value || "";
-      const bioCand  = document.getElementById("bioCandYes").checked;
-
-      const rec = {
-        date: note.date,
-        note: textNote,
-        annotator: annotator,
-        bioUse: !!bioUse,
-        bioStart: bioUse ? bioStart : "",
-        bioEnd:   bioUse ? bioEnd   : "",
-        bioCand:  bioUse ? null : !!bioCand,
-        ts: Date.now()
-      };
-      const arr = loadPatientAnnotations(currentPatient);
-      arr.unshift(rec);
-      savePatientAnnotations(currentPatient, arr);
-      renderAnnTable();
-      alert("Annotation saved.");
-    };
-
-    document.getElementById("export-txt").onclick=(e)=>{ e.preventDefault(); exportAnnotations(); };
-
-    document.getElementById("ann-body").addEventListener("click", (e)=>{
-      const btn = e.target.closest(".ann-del");
-      if (!btn) return;
-      e.preventDefault();
-      const pid = btn.getAttribute("data-pid");
-      const ts  = btn.getAttribute("data-ts");
-
-      const fp = {
-        date: btn.dataset.date,
-        annotator: btn.dataset.annotator || "",
-        note: btn.dataset.note || "",
-        bioUse: btn.dataset.bious === "1",
-        bioStart: btn.dataset.biostart || "",
-        bioEnd: btn.dataset.bioend || "",
-        bioCand: btn.dataset.biocand === "" ? null : (btn.dataset.biocand === "1")
-      };
-
-      if (!pid) return;
-      if (confirm("Remove this annotation?")){
-        deleteAnnotation(pid, ts, fp);
-        renderAnnTable();
-      }
-    });
-  });
-</script>
-</body>
-</html>
-"""
-
-LOGIN_TEMPLATE = """
-<!doctype html>
-<html lang="en">
-<head>
-  <meta charset="utf-8">
-  <title>Sign in</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <style>
-    :root{ --border:#cfe0f5; --bg:#f1f7ff; --text:#0b1220; --primary:#2563eb; }
-    body{ font-family: Arial, sans-serif; background:var(--bg); margin:0; padding:32px; }
-    .card{
-      max-width: 460px;
-      min-height: 340px;           /* taller to avoid mismatch */
-      margin: 64px auto;
-      background:#fff;
-      border:1px solid var(--border);
-      border-radius:14px;
-      padding:28px;
-      box-shadow:0 2px 6px rgba(15,23,42,.06);
-      box-sizing: border-box;
-    }
-    h2{ margin:0 0 16px 0; }
-    label{ display:block; margin:12px 0 8px; font-weight:700; }
-    input{ width:100%; padding:12px 14px; border:1px solid #cbd5e1; border-radius:10px; font-size:16px; }
-    button{ margin-top:20px; width:100%; padding:12px 16px; background:var(--primary); color:#fff; border:none; border-radius:10px; cursor:pointer; font-size:16px; }
-    .err{ color:#b91c1c; margin-top:12px; }
-  </style>
-</head>
-<body>
-  <div class="card">
-    <h2>Sign in</h2>
-    <form method="post">
-      <label for="userid">User ID</label>
-      <input id="userid" name="userid" autocomplete="username" required />
-      <label for="password">Password</label>
-      <input id="password" name="password" type="password" autocomplete="current-password" required />
-      <button type="submit">Enter</button>
-      {% if error %}<div class="err">{{ error }}</div>{% endif %}
-    </form>
-  </div>
-</body>
-</html>
-"""
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -1460,8 +884,8 @@ def login():
         if uid == "1" and pw == "1":
             session["authed"] = True
             return redirect(url_for("ui"))
-        return render_template_string(LOGIN_TEMPLATE, error="Invalid credentials.")
-    return render_template_string(LOGIN_TEMPLATE, error=None)
+        return render_template("login.html", error="Invalid credentials.")
+    return render_template("login.html", error=None)
 
 @app.route("/logout")
 def logout():
@@ -1470,31 +894,606 @@ def logout():
 
 @app.before_request
 def require_login():
-    if request.endpoint in ("login", "static"):
+    if request.endpoint in ("login", "static", "assets", "healthz", "healthz_ready", "healthz_startup", "metrics"):
         return
     if not session.get("authed"):
+        if request.path.startswith("/api/"):
+            return jsonify({"error": "not signed in"}), 401
         return redirect(url_for("login"))
 
+# -----------------------------
+# Pre-serialized payloads (see payload.py)
+# -----------------------------
+@lru_cache(maxsize=8)
+def ui_payload(script_root, assets_version):
+    # Only static config is embedded; patient data is fetched lazily from /api/...
+    with METRICS.stage("render_index"):
+        html = render_template("index.html", config={
+            "api_root": script_root + "/api",
+            "lab_fields": LAB_COLUMNS_SHOW,
+            "sym_groups": SYM_GROUPS,
+            "sym_order": SYM_ORDER,
+            "ref_ranges": REF_RANGES,
+            "ann_batch_max": ANN_BATCH_MAX,
+        })
+    return Payload(html.encode("utf-8"), mimetype="text/html")
+
+# -----------------------------
+# Data store (loaded once, lazily, shared by all requests)
+# -----------------------------
+API_PAGE_MAX = 1000
+NOTE_SEARCH_DIR = Path(os.getenv("NOTE_SEARCH_DIR", COHORT_CACHE_DIR))
+NOTE_PAYLOAD_CACHE_SIZE = int(os.getenv("NOTE_PAYLOAD_CACHE_SIZE", "4096"))
+PATIENT_PAYLOAD_CACHE_SIZE = int(os.getenv("PATIENT_PAYLOAD_CACHE_SIZE", "1024"))
+
+class Cohort:
+    """One immutable, fully loaded version of the cohort (a CompactCohort) plus its serialized payloads."""
+
+    def __init__(self, data):
+        self.data = data
+        self.patient_ids = data.pids
+        self.meds_err = data.meds_err
+        # payloads are built from the compact arrays on first request and kept in an LRU
+        self.patient_payload = lru_cache(maxsize=PATIENT_PAYLOAD_CACHE_SIZE)(self._patient_payload)
+        self.note_payload_cached = lru_cache(maxsize=NOTE_PAYLOAD_CACHE_SIZE)(self._note_payload)
+        self.page_payload = lru_cache(maxsize=256)(self._page_payload)
+        # query indexes are built on first use, once per cohort version
+        self._med_index = self._note_table = self._text_index = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def med_index(self):
+        if self._med_index is None:
+            with self._index_lock:
+                if self._med_index is None:
+                    self._med_index = MedIndex(self.data)
+        return self._med_index
+
+    @property
+    def note_table(self):
+        if self._note_table is None:
+            med_index = self.med_index
+            with self._index_lock:
+                if self._note_table is None:
+                    self._note_table = NoteTable(self.data, med_index)
+        return self._note_table
+
+    @property
+    def text_index(self):
+        if self._text_index is None:
+            with self._index_lock:
+                if self._text_index is None:
+                    self._text_index = NoteSearch(NOTE_SEARCH_DIR, self.data)
+        return self._text_index
+
+    def has_patient(self, pid):
+        return pid in self.data
+
+    def has_note(self, pid, i):
+        return pid in self.data and 0 <= i < self.data.n_notes(pid)
+
+    def patient_summary(self, pid):
+        return {"pid": pid, "n_notes": self.data.n_notes(pid), "bio": len(self.data.bio.get(pid, []))}
+
+    @METRICS.timed("patient_detail")
+    def patient_detail(self, pid):
+        D = self.data
+        note_dates = D.note_dates(pid)
+        meds = D.meds(pid)
+        return {
+            "pid": pid,
+            "notes": [{"date": d} for d in note_dates.tolist()],
+            "min_date": float(note_dates.min()),
+            "max_date": float(note_dates.max()),
+            "labs": D.labs(pid),
+            "meds": meds,
+            # ingredients / classes of this patient's recognised medications
+            "med_tags": {m: t for m in sorted({m for r in meds for m in r["meds"]}) if (t := self.med_index.tags(m))},
+            # per note: index of the closest lab / med record (both lists are sorted by date)
+            "note_lab": nearest_by_date(D.lab_dates(pid), note_dates),
+            "note_med": nearest_by_date(D.med_dates(pid), note_dates),
+            "demo": D.demo(pid),
+            "bio": D.bio.get(pid, []),
+        }
+
+    def note_date(self, pid, i):
+        return float(self.data.note_dates(pid)[i])
+
+    @METRICS.timed("note_payload")
+    def note_payload(self, pid, i, pretty=False):
+        text = self.data.note_text(pid, i)
+        out = {"date": self.note_date(pid, i), "text": text}
+        if pretty:
+            p = self.data.note_pretty(pid, i)
+            out["pretty"] = friendly_text(text) if p is None else p
+        return out
+
+    def note_pretty_chunks(self, pid, i):
+        """The friendly view in pieces, formatted as they are sent unless it was made at load."""
+        pretty = self.data.note_pretty(pid, i)
+        if pretty is not None:
+            return (pretty[k:k + PRETTY_CHUNK] for k in range(0, len(pretty), PRETTY_CHUNK))
+        return iter_friendly_text(self.data.note_text(pid, i))
+
+    def _patient_payload(self, pid):
+        return Payload.from_obj(self.patient_detail(pid))
+
+    def _note_payload(self, pid, i, pretty=False):
+        return Payload.from_obj(self.note_payload(pid, i, pretty))
+
+    def _page_payload(self, offset, limit):
+        page = self.patient_ids[offset:offset + limit]
+        return Payload.from_obj({
+            "total": len(self.patient_ids),
+            "offset": offset,
+            "limit": limit,
+            "patients": [self.patient_summary(pid) for pid in page],
+            "meds_err": self.meds_err,
+        })
+
+class DataStore:
+    """
+    Holds the current Cohort. Nothing is read at import time: the first caller of
+    get() (or warm_up()) loads it under a lock while concurrent callers wait.
+    A failed load is recorded in .error and retried on the next get().
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._cohort = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self._cohort is not None
+
+    def get(self):
+        """The loaded Cohort, or None if loading failed (see .error)."""
+        cohort = self._cohort
+        if cohort is not None:
+            return cohort
+        with self._lock:
+            if self._cohort is None:
+                try:
+                    self._cohort = Cohort(self._loader())
+                    self.error = None
+                except FileNotFoundError as e:
+                    self.error = f"Data files not found. NOTES_CSV='{CSV_FILE_NOTES}', LABS_CSV='{CSV_FILE_LABS}'. Error: {e}"
+                except Exception as e:
+                    self.error = f"Failed to load data: {e}"
+            return self._cohort
+
+    def warm_up(self, background=False):
+        """Load now (e.g. in the gunicorn master before forking), optionally in a thread."""
+        if background:
+            if not self.ready and not self._lock.locked():
+                threading.Thread(target=self.get, name="data-warm-up", daemon=True).start()
+            return None
+        return self.get()
+
+    def swap(self, cohort):
+        """Replace the current Cohort; requests already holding the old one finish with it."""
+        with self._lock:
+            self._cohort = cohort
+            self.error = None
+
+# -----------------------------
+# Hot reload (poll the CSVs; rebuild only patients whose rows changed)
+# -----------------------------
+DATA_RELOAD_INTERVAL = float(os.getenv("DATA_RELOAD_INTERVAL", "0"))  # seconds; 0 (default) disables
+RELOAD_STALE = 300  # seconds before another worker takes over a reload that stopped
+
+def source_signatures():
+    sigs = {}
+    for name, path in (("notes", CSV_FILE_NOTES), ("labs", CSV_FILE_LABS), ("meds", MEDS_CSV)):
+        try:
+            st = Path(path).stat()
+            sigs[name] = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            sigs[name] = None
+    return sigs
+
+def patient_row_hashes(df):
+    """{pid: digest} over each patient's rows, in file order."""
+    if not len(df):
+        return {}
+    pid = df["PATIENTHASHMRN"].astype(str).to_numpy()
+    h = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    order = np.argsort(pid, kind="stable")
+    pid, h = pid[order], h[order]
+    starts = np.flatnonzero(np.r_[True, pid[1:] != pid[:-1]]).tolist() + [len(pid)]
+    return {
+        pid[a]: hashlib.blake2b(h[a:b].tobytes(), digest_size=16).digest()
+        for a, b in zip(starts[:-1], starts[1:])
+    }
+
+def merge_patients(old, part, changed):
+    merged = {pid: v for pid, v in old.items() if pid not in changed}
+    merged.update(part)
+    return dict(sorted(merged.items()))
+
+class Reloader:
+    """
+    Watches NOTES_CSV / LABS_CSV / MEDS_CSV by size+mtime when DATA_RELOAD_INTERVAL > 0.
+    When a file changes (and has stopped changing for one poll), the new version is read
+    from the cohort cache if another worker already built it. Otherwise this worker claims
+    the build, re-reads the CSVs and hashes each patient's rows; patients whose hash
+    differs are rebuilt, the others are taken from the current CompactCohort. The result
+    is written to the cache (so the other workers map it instead of rebuilding) and
+    swapped into STORE. Between reloads only the row hashes are kept.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.sigs = None        # signatures the current cohort was built from
+        self._pending = None    # signatures seen on the previous poll
+        self._hashes = None     # per-patient row hashes (+ build params) of the current cohort
+        self._pid = None
+
+    def load(self):
+        """Initial load (DataStore loader); remembers which file versions it saw."""
+        sigs = source_signatures()
+        data = load_cohort()
+        self.sigs = sigs
+        return data
+
+    def ensure_running(self):
+        # one watcher per process; threads do not survive gunicorn's fork
+        if DATA_RELOAD_INTERVAL <= 0 or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="data-reload", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(DATA_RELOAD_INTERVAL)
+            try:
+                self.poll()
+            except Exception:
+                app.logger.exception("Data reload failed; keeping the current cohort")
+
+    def poll(self):
+        """Reload if a source changed and is stable since the last poll. Returns True on swap."""
+        sigs = source_signatures()
+        if self.sigs is None or sigs == self.sigs:
+            self._pending = None
+            return False
+        if sigs != self._pending:  # still being written, or first sighting
+            self._pending = sigs
+            return False
+        return self.reload(sigs)
+
+    def reload(self, sigs=None):
+        sigs = sigs or source_signatures()
+        lock = COHORT_CACHE_DIR / ".reload.building"
+        if USE_COHORT_CACHE:
+            cached = cohort_cache.read_cache(COHORT_CACHE_DIR / cohort_cache_key())
+            if cached is not None:  # built by another worker
+                self.store.swap(Cohort(cached))
+                self.sigs, self._hashes = sigs, None
+                app.logger.info("Data reloaded from the cohort cache")
+                return True
+            if not self._claim(lock):
+                return False  # another worker is building it; the next poll picks it up
+        try:
+            data, changed, hashes = self._rebuild()
+            cohort = compact(data)
+            del data
+            if USE_COHORT_CACHE and (path := write_cohort_cache(cohort)) is not None:
+                cohort = cohort_cache.read_cache(path) or cohort  # mapped: pages shared with the other workers
+        finally:
+            if USE_COHORT_CACHE:
+                lock.unlink(missing_ok=True)
+        self.store.swap(Cohort(cohort))
+        self.sigs, self._hashes = sigs, hashes
+        app.logger.info("Data reloaded: %s patients rebuilt", "all" if changed is None else len(changed))
+        return True
+
+    @staticmethod
+    def _claim(lock):
+        """Create the build marker unless another process holds a fresh one."""
+        try:
+            if time.time() - lock.stat().st_mtime < RELOAD_STALE:
+                return False
+            lock.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            lock.parent.mkdir(parents=True, exist_ok=True)
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        except OSError:
+            pass  # no writable cache dir: build here without coordinating
+        return True
+
+    def _rebuild(self):
+        """(dict cohort of the current CSVs, pids rebuilt or None for all, their row hashes)."""
+        notes_df = read_notes_frame(CSV_FILE_NOTES, COHORT)
+        labs_df, alias = read_labs_frame(CSV_FILE_LABS, COHORT)
+        meds_df, meds_err = read_meds_frame(MEDS_CSV, COHORT)
+        schema = None if meds_err else med_schema(meds_df)
+        hashes = {
+            "notes": patient_row_hashes(notes_df),
+            "labs": patient_row_hashes(labs_df),
+            "meds": {} if meds_err else patient_row_hashes(meds_df),
+            "params": (alias, schema, meds_err),
+        }
+        old, current = self._hashes, self.store.get()
+        changed = None
+        if old is not None and old["params"] == hashes["params"] and current is not None:
+            changed = set()
+            for name in ("notes", "labs", "meds"):
+                new_h, old_h = hashes[name], old[name]
+                changed |= {pid for pid in new_h.keys() | old_h.keys() if new_h.get(pid) != old_h.get(pid)}
+            only = lambda df: df[df["PATIENTHASHMRN"].astype(str).isin(changed)].copy()
+            notes_df, labs_df = only(notes_df), only(labs_df)
+            if not meds_err:
+                meds_df = only(meds_df)
+        meds = {} if meds_err else build_meds(meds_df, schema)
+        data = assemble_cohort(build_notes(notes_df), *build_labs(labs_df, alias), meds, meds_err)
+        if changed is not None:
+            # a patient's entry depends only on its own rows: the unchanged ones are as built before
+            kept = current.data.to_data(pids=set(current.patient_ids) - changed)
+            for key in ("patients", "labs", "demo", "meds"):
+                data[key] = merge_patients(kept[key], data[key], changed)
+            data["bio"] = build_bio_events(Patient_bio_used_with_data, set(data["patients"]))
+        return data, changed, hashes
+
+RELOADER = Reloader(None)
+STORE = DataStore(RELOADER.load)
+RELOADER.store = STORE
+STARTUP.mark("store + reloader setup")
+
+def ensure_data_loaded():
+    cohort = STORE.get()
+    if cohort is not None:
+        RELOADER.ensure_running()
+        cohort.text_index.ensure_built()  # once per version of the notes, in the background
+    return cohort
+
+def data_unavailable():
+    return jsonify({"error": STORE.error or "data not loaded"}), 503
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"ok": True})
+
+@app.route("/healthz/ready")
+def healthz_ready():
+    if STORE.ready:
+        return jsonify({"ready": True, "patients": len(STORE.get().patient_ids)})
+    STORE.warm_up(background=True)
+    return jsonify({"ready": False, "error": STORE.error}), 503
+
+@app.route("/healthz/startup")
+def healthz_startup():
+    # per-phase wall time and RSS of this process's startup, plus the first data load once done
+    return jsonify({**STARTUP.report(), "data_ready": STORE.ready})
+
 @app.route("/")
 def ui():
     if not session.get("authed"):
         return redirect(url_for("login"))
-    return render_template_string(
-        TEMPLATE,
-        patients_json=json.dumps(PATIENTS, ensure_ascii=False),
-        labs_json=json.dumps(LABS_BY_PATIENT, ensure_ascii=False),
-        demo_json=json.dumps(DEMO_BY_PATIENT, ensure_ascii=False),
-        lab_fields_json=json.dumps(LAB_COLUMNS_SHOW),
-        sym_groups_json=json.dumps(SYM_GROUPS),
-        sym_order_json=json.dumps(SYM_ORDER),
-        ref_ranges_json=json.dumps(REF_RANGES),
-        bio_json=json.dumps(BIO_EVENTS),
-        # NEW:
-        meds_json=json.dumps(MEDS_BY_PATIENT, ensure_ascii=False),
-        meds_err=json.dumps(MEDS_ERR, ensure_ascii=False),
-    )
+    return send_payload(ui_payload(request.script_root, ASSETS.version))
+
+# -----------------------------
+# JSON API (one patient / one note at a time)
+# -----------------------------
+@app.route("/api/patients")
+def api_patients():
+    cohort = ensure_data_loaded()
+    if cohort is None:
+        return data_unavailable()
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 200, type=int), 1), API_PAGE_MAX)
+    return send_payload(cohort.page_payload(offset, limit))
+
+@app.route("/api/patients/<pid>")
+def api_patient(pid):
+    cohort = ensure_data_loaded()
+    if cohort is None:
+        return data_unavailable()
+    if not cohort.has_patient(pid):
+        return jsonify({"error": f"unknown patient: {pid}"}), 404
+    return send_payload(cohort.patient_payload(pid))
+
+@app.route("/api/patients/<pid>/notes/<int:i>")
+def api_note(pid, i):
+    cohort = ensure_data_loaded()
+    if cohort is None:
+        return data_unavailable()
+    if not cohort.has_note(pid, i):
+        return jsonify({"error": f"unknown note: {pid}/{i}"}), 404
+    # the raw text; ?pretty=1 adds the whole friendly view (the page streams it instead)
+    return send_payload(cohort.note_payload_cached(pid, i, request.args.get("pretty") == "1"))
+
+@app.route("/api/patients/<pid>/notes/<int:i>/pretty")
+def api_note_pretty(pid, i):
+    # Friendly view as a chunked text/plain stream: the first paragraph goes out after
+    # formatting ~1 KB of the note, however long the note is (see iter_friendly_text).
+    cohort = ensure_data_loaded()
+    if cohort is None:
+        return data_unavailable()
+    if not cohort.has_note(pid, i):
+        return jsonify({"error": f"unknown note: {pid}/{i}"}), 404
+    resp = Response(cohort.note_pretty_chunks(pid, i), mimetype="text/plain")
+    resp.headers["X-Note-Date"] = repr(cohort.note_date(pid, i))
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx: pass chunks through as they come
+    return resp
+
+@app.route("/api/meds/search")
+def api_meds_search():
+    """Patients (and dates) with a medication matching q: a class (biologic, ICS/LABA, ...), a brand/generic name, or a substring."""
+    cohort = ensure_data_loaded()
+    if cohort is None:
+        return data_unavailable()
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    limit = min(max(request.args.get("limit", 100, type=int), 1), API_PAGE_MAX)
+    return jsonify(cohort.med_index.search(q, limit=limit))
+
+@app.route("/api/notes/search")
+def api_notes_search():
+    """Notes containing q (FTS5: words are ANDed, "quoted phrases", prefix*), best match first."""
+    cohort = ensure_data_loaded()
+    if cohort is None:
+        return data_unavailable()
+    index = cohort.text_index
+    if not index.ready:
+        return jsonify({"error": index.error or "search index is being built", "building": index.error is None}), 503
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), API_PAGE_MAX)
+    try:
+        return jsonify(index.search(request.args.get("q", ""), offset=offset, limit=limit))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/query")
+def api_query():
+    """Notes matching q, e.g. "eosinophils > 0.3 and exacerbation_current = 1 and on ICS within 30"."""
+    cohort = ensure_data_loaded()
+    if cohort is None:
+        return data_unavailable()
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 100, type=int), 1), API_PAGE_MAX)
+    try:
+        return jsonify(cohort.note_table.search(request.args.get("q", ""), offset=offset, limit=limit))
+    except ValueError as e:
+        return jsonify({"error": str(e), "fields": cohort.note_table.fields}), 400
+
+# -----------------------------
+# Annotations API (SQLite store; the page sends its writes in batches)
+# -----------------------------
+ANNOTATIONS_DB = Path(os.getenv("ANNOTATIONS_DB", BASE_DIR / "annotations.sqlite3"))
+ANNOTATIONS = AnnotationStore(ANNOTATIONS_DB)
+AGREEMENT = agreement.AgreementIndex(ANNOTATIONS)
+ANN_BATCH_MAX = 1000
+STARTUP.mark("annotation store")
+
+@app.route("/api/annotations", methods=["GET"])
+def api_annotations():
+    annotator = request.args.get("annotator")
+    pid = request.args.get("pid")
+    limit = request.args.get("limit", type=int)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    resp = jsonify({"annotations": ANNOTATIONS.query(pid=pid, annotator=annotator, limit=limit, offset=offset)})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/api/annotations", methods=["POST"])
+def api_annotations_write():
+    # force: navigator.sendBeacon posts the batch as text/plain
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "expected a JSON object"}), 400
+    upserts, deletes = body.get("upsert") or [], body.get("delete") or []
+    if not isinstance(upserts, list) or not isinstance(deletes, list):
+        return jsonify({"error": "upsert and delete must be lists"}), 400
+    if len(upserts) + len(deletes) > ANN_BATCH_MAX:
+        return jsonify({"error": f"batch too large (max {ANN_BATCH_MAX})"}), 400
+    # malformed records are skipped and returned, the rest of the batch is applied
+    written, deleted, rejected = ANNOTATIONS.write(upserts, deletes)
+    AGREEMENT.catch_up()
+    return jsonify({"written": written, "deleted": deleted, "rejected": rejected})
+
+@app.route("/api/annotations/<uid>", methods=["DELETE"])
+def api_annotation_delete(uid):
+    _, deleted, _ = ANNOTATIONS.write(deletes=[uid])
+    if not deleted:
+        return jsonify({"error": f"unknown annotation: {uid}"}), 404
+    AGREEMENT.catch_up()
+    return jsonify({"deleted": deleted})
+
+@app.route("/api/annotations/agreement")
+def api_annotations_agreement():
+    limit = min(max(request.args.get("limit", 100, type=int), 0), API_PAGE_MAX)
+    resp = jsonify(AGREEMENT.get().report(pid=request.args.get("pid"), limit=limit))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/api/annotations/export")
+def api_annotations_export():
+    fmt = request.args.get("format", "jsonl")
+    if fmt not in annotation_io.EXPORTERS:
+        return jsonify({"error": f"unknown format: {fmt} (use jsonl, csv or parquet)"}), 400
+    if fmt == "parquet" and annotation_io.pq is None:
+        return jsonify({"error": "Parquet export needs pyarrow on the server"}), 501
+    records = ANNOTATIONS.iter_records(pid=request.args.get("pid"), annotator=request.args.get("annotator"))
+    resp = Response(stream_with_context(annotation_io.export(records, fmt)), mimetype=annotation_io.MIMETYPES[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="annotations.{fmt}"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/api/annotations/import", methods=["POST"])
+def api_annotations_import():
+    # upserts by content fingerprint, so importing the same file twice adds nothing
+    fmt = request.args.get("format", "jsonl")
+    if fmt not in annotation_io.READERS:
+        return jsonify({"error": f"unknown format: {fmt} (use jsonl, csv, parquet or txt)"}), 400
+    if fmt == "parquet":
+        if annotation_io.pq is None:
+            return jsonify({"error": "Parquet import needs pyarrow on the server"}), 501
+        fh = io.BytesIO(request.get_data())  # the footer comes last; Parquet needs a seekable file
+    else:
+        fh = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    try:
+        inserted, updated, skipped = ANNOTATIONS.import_records(annotation_io.read(fh, fmt))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"import stopped: {e}"}), 400
+    AGREEMENT.catch_up()
+    return jsonify({"inserted": inserted, "updated": updated, "skipped": skipped})
+
+@app.cli.command("export-annotations")
+@click.argument("out", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(sorted(annotation_io.EXPORTERS)), help="Default: from OUT's extension.")
+@click.option("--annotator", default=None)
+@click.option("--pid", default=None)
+def export_annotations_command(out, fmt, annotator, pid):
+    """Stream all (or the selected) annotations to OUT ('-' for stdout)."""
+    fmt = annotation_io.format_for(out, fmt) if out != "-" else (fmt or "jsonl")
+    records = ANNOTATIONS.iter_records(pid=pid, annotator=annotator)
+    with click.open_file(out, "wb") as fh:
+        for chunk in annotation_io.export(records, fmt):
+            fh.write(chunk)
+
+@app.cli.command("import-annotations")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(sorted(annotation_io.READERS)), help="Default: from each file's extension.")
+def import_annotations_command(paths, fmt):
+    """Merge annotation files (JSONL/CSV/Parquet or the page's TXT export), skipping duplicates."""
+    total_in = total_up = total_skip = 0
+    for path in paths:
+        inserted, updated, skipped = ANNOTATIONS.import_records(annotation_io.read_path(path, fmt))
+        total_in, total_up, total_skip = total_in + inserted, total_up + updated, total_skip + skipped
+        click.echo(f"{path}: {inserted} added, {updated} updated, {skipped} already present")
+    if len(paths) > 1:
+        click.echo(f"total: {total_in} added, {total_up} updated, {total_skip} already present")
+
+@app.cli.command("agreement-report")
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(sorted(annotation_io.READERS)), help="Format of PATHS (default: by extension).")
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON.")
+@click.option("--limit", default=100, show_default=True, help="Patients listed with disagreements.")
+def agreement_report_command(paths, fmt, as_json, limit):
+    """Inter-annotator agreement over the annotation store, or over annotation files (PATHS)."""
+    if paths:
+        records = itertools.chain.from_iterable(annotation_io.read_path(p, fmt) for p in paths)
+        rep = agreement.from_records(records).report(limit=limit)
+    else:
+        rep = AGREEMENT.get().report(limit=limit)
+    click.echo(json.dumps(rep, indent=2, default=str) if as_json else agreement.format_report(rep))
+
+STARTUP.mark("routes + CLI")
+# printed by the server entrypoints (main, gunicorn when_ready), not by every import
+STARTUP_TRACE = os.getenv("STARTUP_TRACE", "1") != "0"
 
 def main():
+    if STARTUP_TRACE:
+        STARTUP.print()
     app.run(debug=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""
+Benchmark: vectorized load_labs vs the previous row-by-row (iterrows) loader.
+
+    python benchmarks/bench_load_labs.py [scale]
+
+Replicates symptom_patient_merged.csv `scale` times (default 100) under fresh
+patient ids, checks both loaders produce identical output and reports the speedup.
+Exits non-zero if the vectorized loader is not at least 10x faster.
+"""
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import app as A  # noqa: E402
+
+MIN_SPEEDUP = 10.0
+
+
+# Previous implementation (module globals prefixed with A.), kept as the
+# reference for output and timing.
+def load_labs_reference(csv_path: Path):
+    df = pd.read_csv(csv_path, dtype={"PATIENTHASHMRN": str})
+    alias = A.resolve_lab_aliases(df.columns)
+    date_col = alias.get("DATE_DIF") or "DATE_DIF"
+    if date_col not in df.columns:
+        df[date_col] = pd.NA
+    for col in A.SYMPTOM_COLS:
+        if col not in df.columns:
+            df[col] = pd.NA
+    df[date_col] = pd.to_numeric(df[date_col], errors="coerce")
+    df = df.dropna(subset=[date_col]).reset_index(drop=True)
+
+    labs_by_patient = {}
+    demo_by_patient = {}
+    for pid, g in df.groupby("PATIENTHASHMRN"):
+        g = g.sort_values(date_col)
+
+        series = []
+        for _, row in g.iterrows():
+            item = {"date": A.try_float(row.get(date_col))}
+            for c in A.LAB_COLUMNS_SHOW:
+                src = alias.get(c)
+                val = row.get(src) if src in row else None
+                item[c] = A.try_float(val)
+            for c in A.SYMPTOM_COLS:
+                item[c] = A.try_01(row.get(c))
+            series.append(item)
+        labs_by_patient[pid] = series
+
+        gg = g.dropna(subset=["AGE", "SEX", "BMI"], how="all")
+        if len(gg) > 0:
+            last = gg.sort_values(date_col).iloc[-1]
+            demo_by_patient[pid] = {
+                "AGE": A.try_float(last.get("AGE")),
+                "SEX": str(last.get("SEX")) if pd.notna(last.get("SEX")) else "",
+                "BMI": A.try_float(last.get("BMI")),
+            }
+        else:
+            demo_by_patient[pid] = {"AGE": None, "SEX": "", "BMI": None}
+    return labs_by_patient, demo_by_patient
+
+
+def scaled_csv(src: Path, scale: int, out_dir: str) -> Path:
+    df = pd.read_csv(src, dtype={"PATIENTHASHMRN": str})
+    parts = []
+    for k in range(scale):
+        part = df.copy()
+        part["PATIENTHASHMRN"] = part["PATIENTHASHMRN"] + f"_{k:04d}"
+        parts.append(part)
+    out = Path(out_dir) / f"labs_x{scale}.csv"
+    pd.concat(parts, ignore_index=True).to_csv(out, index=False)
+    return out
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+def main(argv):
+    scale = int(argv[1]) if len(argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as tmp:
+        path = scaled_csv(A.LABS_CSV, scale, tmp)
+        rows = sum(1 for _ in open(path)) - 1
+        (new_labs, new_demo), t_new = timed(A.load_labs, path)
+        (ref_labs, ref_demo), t_ref = timed(load_labs_reference, path)
+
+    # compare serialized output: it also catches int/float (1 vs 1.0) and key-order drift
+    assert json.dumps(new_labs) == json.dumps(ref_labs), "LABS_BY_PATIENT differs from the reference loader"
+    assert json.dumps(new_demo) == json.dumps(ref_demo), "DEMO_BY_PATIENT differs from the reference loader"
+    speedup = t_ref / t_new
+    print(f"rows={rows} patients={len(new_labs)}")
+    print(f"reference (iterrows): {t_ref:8.3f}s")
+    print(f"vectorized:           {t_new:8.3f}s")
+    print(f"speedup:              {speedup:8.1f}x")
+    if speedup < MIN_SPEEDUP:
+        print(f"FAIL: expected at least {MIN_SPEEDUP:.0f}x")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
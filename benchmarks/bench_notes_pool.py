@@ -0,0 +1,129 @@
+"""
+Benchmark: note preprocessing (build_notes + friendly text at load) serial vs a process pool.
+
+    python benchmarks/bench_notes_pool.py [--notes CSV] [scale] [workers ...]
+
+Replicates a notes CSV `scale` times (default 200) under fresh patient ids, then runs
+build_notes with NOTES_WORKERS = 1 and with each pool size (default 2 4 8). Every run
+must encode to byte-identical cohort arrays, and the vectorized build must match the
+previous per-patient groupby loader. Speedup is bounded by the cores available
+(os.cpu_count() is printed): a pool of w workers on a host with at least w cores must
+be MIN_EFFICIENCY * w times faster than serial; smaller hosts only print the speedup.
+Exits non-zero if outputs differ or a pool is too slow. The CSV is --notes, else
+NOTES_CSV if that exists, else synth.py's x1 notes (cached in BENCH_DATA_DIR).
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import app as A  # noqa: E402
+import compact_cohort  # noqa: E402
+import synth  # noqa: E402
+
+DATA_DIR = Path(os.getenv("BENCH_DATA_DIR", Path(__file__).resolve().parent / ".data"))
+MIN_EFFICIENCY = 0.4  # pickling notes to and from the pool costs the rest
+
+
+# Previous build_notes, kept as the reference for output.
+def build_notes_reference(df):
+    df["ENCDATEDIFFNO"] = pd.to_numeric(df["ENCDATEDIFFNO"], errors="coerce")
+    df = df.dropna(subset=["ENCDATEDIFFNO"]).reset_index(drop=True)
+    patients = {}
+    for pid, g in df.groupby("PATIENTHASHMRN"):
+        g = g.sort_values("ENCDATEDIFFNO")
+        notes = [{"date": float(r.ENCDATEDIFFNO), "text": str(r.DEIDENTIFIED_TEXT)} for r in g.itertuples(index=False)]
+        if notes:
+            dvals = [n["date"] for n in notes]
+            patients[pid] = {"notes": notes, "min_date": min(dvals), "max_date": max(dvals)}
+    return patients
+
+
+def scaled_csv(src: Path, scale: int, out_dir: str) -> Path:
+    df = pd.read_csv(src, dtype={"PATIENTHASHMRN": str}, usecols=A.NOTE_COLS)
+    parts = []
+    for k in range(scale):
+        part = df.copy()
+        part["PATIENTHASHMRN"] = part["PATIENTHASHMRN"] + f"_{k:04d}"
+        parts.append(part)
+    out = Path(out_dir) / f"notes_x{scale}.csv"
+    pd.concat(parts, ignore_index=True).to_csv(out, index=False)
+    return out
+
+
+def digest(patients):
+    """Hash of the note arrays the cohort cache would store."""
+    data = {"patients": patients, "labs": {}, "demo": {}, "meds": {}, "bio": {}, "meds_err": None}
+    arrays, _ = compact_cohort.encode(data, [], [])
+    h = hashlib.sha256()
+    for name in sorted(k for k in arrays if k.startswith("notes_")):
+        h.update(name.encode("utf-8"))
+        h.update(arrays[name].tobytes())
+    return h.hexdigest()
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - t0
+
+
+def source_csv(argv):
+    """(notes CSV, remaining args): --notes, else NOTES_CSV if present, else synthetic notes."""
+    if "--notes" in argv:
+        i = argv.index("--notes")
+        return Path(argv[i + 1]), argv[:i] + argv[i + 2:]
+    if Path(A.CSV_FILE_NOTES).exists():
+        return Path(A.CSV_FILE_NOTES), argv
+    return synth.write_cohort(DATA_DIR, 1)["notes"], argv
+
+
+def main(argv):
+    src, argv = source_csv(argv)
+    scale = int(argv[1]) if len(argv) > 1 else 200
+    pools = [int(w) for w in argv[2:]] or [2, 4, 8]
+    print(f"notes from {src}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = scaled_csv(src, scale, tmp)
+        df = A.read_notes_frame(path)
+
+    ref, t_ref = timed(build_notes_reference, df.copy())
+    plain, t_plain = timed(A.build_notes, df.copy(), workers=0)
+    assert digest(plain) == digest(ref), "build_notes differs from the reference loader"
+    n_notes = sum(len(p["notes"]) for p in plain.values())
+    print(f"notes={n_notes} patients={len(plain)} cpus={os.cpu_count()}")
+    print(f"groupby reference (text only): {t_ref:8.3f}s")
+    print(f"vectorized (text only):        {t_plain:8.3f}s")
+
+    serial, t_serial = timed(A.build_notes, df.copy(), workers=1)
+    expected = digest(serial)
+    print(f"serial, friendly text:         {t_serial:8.3f}s")
+    failed, slow = False, []
+    for w in pools:
+        out, t = timed(A.build_notes, df.copy(), workers=w)
+        same = digest(out) == expected
+        failed |= not same
+        speedup = t_serial / t
+        if os.cpu_count() >= w:
+            check = f"min {MIN_EFFICIENCY * w:.2f}x"
+            if speedup < MIN_EFFICIENCY * w:
+                slow.append(w)
+        else:
+            check = "not checked, fewer cpus"
+        print(f"{w} workers, friendly text:     {t:8.3f}s  speedup {speedup:5.2f}x ({check})  "
+              f"{'identical' if same else 'DIFFERENT'}")
+    if failed:
+        print("FAIL: pool output differs from serial")
+    if slow:
+        print(f"FAIL: too little speedup with {', '.join(map(str, slow))} workers")
+    return 1 if failed or slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,369 @@
+"""
+Benchmark suite: data loading and serving hot paths on synthetic cohorts.
+
+    python benchmarks/suite.py [--scales 1 10 100] [--stages ...] [--repeat 3]
+                               [--save-baseline] [--require-baseline] [--tolerance 0.25]
+
+For each scale (see synth.py) the stages below run in a forked child each, so every
+one gets its own peak RSS. A stage's record has wall_s (best of --repeat), peak_rss_mb,
+rss_delta_mb (peak minus the RSS at fork, i.e. what the stage itself allocated), items
+and, where it produces output, its size in bytes / gz_bytes.
+
+  load_notes, load_labs, load_medications   CSV -> per-patient dicts
+  make_friendly_text                        every note's friendly view
+  compact                                   dicts -> CompactCohort arrays
+  patient_payload                           /api/patients/<pid> body of every patient
+  note_payload                              /api/.../notes/<i> body of up to 5000 notes
+  note_stream                               streamed friendly view of the same notes
+  ui                                        cold render of the index page (GET /)
+
+Each run is appended to benchmarks/history.json. It is then compared with the baseline
+of this machine, benchmarks/baselines/<fingerprint>.json (written by --save-baseline;
+the fingerprint covers OS, architecture, CPU model and count, and Python version), and
+the suite exits 1 when a stage got slower, bigger in memory or bigger on the wire than
+the baseline allows. Timings from another machine say nothing about this one, so with
+no baseline for this fingerprint the comparison is skipped; --require-baseline makes
+that an error instead (for a CI runner whose baseline is committed).
+Synthetic CSVs are cached in BENCH_DATA_DIR (default benchmarks/.data).
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import traceback
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+sys.path.insert(0, str(ROOT))
+import app as A  # noqa: E402
+import synth  # noqa: E402
+
+HISTORY = HERE / "history.json"
+BASELINES = HERE / "baselines"
+DATA_DIR = Path(os.getenv("BENCH_DATA_DIR", HERE / ".data"))
+NOTE_SAMPLE = 5000
+
+# a stage regresses when it exceeds the baseline by the relative tolerance AND by at
+# least this much, so millisecond noise on small scales does not fail the run
+MIN_DELTA = {"wall_s": 0.02, "peak_rss_mb": 16.0, "bytes": 1024, "gz_bytes": 1024}
+SIZE_TOLERANCE = 0.01  # bytes are deterministic; any real growth is a change
+
+
+# ---------- measuring ----------
+def _vm_mb():
+    """(current RSS, peak RSS) of this process in MB from /proc, or None where there is no /proc."""
+    try:
+        with open("/proc/self/status") as f:
+            vm = dict(line.split(":", 1) for line in f if line.startswith(("VmRSS", "VmHWM")))
+        return int(vm["VmRSS"].split()[0]) / 1024, int(vm["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError):
+        return None
+
+
+def _maxrss_mb(ru):
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return ru.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def _run_timed(fn):
+    start = _vm_mb()
+    t0 = time.perf_counter()
+    out = fn() or {}
+    rec = {"wall_s": time.perf_counter() - t0, **out}
+    end = _vm_mb()
+    if start and end:
+        rec["peak_rss_mb"] = round(end[1], 1)
+        rec["rss_delta_mb"] = round(end[1] - start[0], 1)
+    return rec
+
+
+def measure(fn):
+    """Run fn() in a forked child: wall time, peak RSS, plus whatever sizes fn returns."""
+    if not hasattr(os, "fork"):
+        return {"peak_rss_mb": None, "rss_delta_mb": None, **_run_timed(fn)}
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        code = 0
+        try:
+            os.write(w, json.dumps(_run_timed(fn)).encode("utf-8"))
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    os.close(w)
+    with os.fdopen(r, "rb") as f:
+        raw = f.read()
+    _, status, ru = os.wait4(pid, 0)
+    if status != 0 or not raw:
+        raise RuntimeError("benchmark stage failed (see traceback above)")
+    rec = json.loads(raw)
+    rec.setdefault("peak_rss_mb", round(_maxrss_mb(ru), 1))
+    rec.setdefault("rss_delta_mb", None)
+    return rec
+
+
+def best_of(fn, repeat):
+    runs = [measure(fn) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r["wall_s"])
+    best["wall_s"] = round(best["wall_s"], 4)
+    return best
+
+
+# ---------- stages ----------
+class Inputs:
+    """Stage inputs, computed once in the parent (untimed) when a later stage needs them."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self._cache = {}
+
+    def get(self, name, make):
+        if name not in self._cache:
+            self._cache[name] = make()
+        return self._cache[name]
+
+    def notes(self):
+        return self.get("notes", lambda: A.load_notes(self.paths["notes"]))
+
+    def labs(self):
+        return self.get("labs", lambda: A.load_labs(self.paths["labs"]))
+
+    def meds(self):
+        return self.get("meds", lambda: A.load_medications(self.paths["meds"]))
+
+    def cohort(self):
+        def make():
+            data = A.assemble_cohort(self.notes(), *self.labs(), *self.meds())
+            cohort = A.Cohort(A.compact(data))
+            cohort.med_index  # built on the first patient request; not part of the payload stage
+            return cohort
+        return self.get("cohort", make)
+
+
+def stage_load_notes(inp):
+    def run():
+        patients = A.load_notes(inp.paths["notes"])
+        return {"items": sum(len(p["notes"]) for p in patients.values())}
+    return run
+
+
+def stage_load_labs(inp):
+    def run():
+        labs, _ = A.load_labs(inp.paths["labs"])
+        return {"items": sum(map(len, labs.values()))}
+    return run
+
+
+def stage_load_medications(inp):
+    def run():
+        meds, err = A.load_medications(inp.paths["meds"])
+        if err:
+            raise RuntimeError(err)
+        return {"items": sum(map(len, meds.values()))}
+    return run
+
+
+def stage_make_friendly_text(inp):
+    texts = [n["text"] for p in inp.notes().values() for n in p["notes"]]
+
+    def run():
+        return {"items": len(texts), "bytes": sum(len(A.make_friendly_text(t).encode("utf-8")) for t in texts)}
+    return run
+
+
+def stage_compact(inp):
+    data = A.assemble_cohort(inp.notes(), *inp.labs(), *inp.meds())
+
+    def run():
+        c = A.compact(data)
+        return {"items": len(c.pids), "bytes": sum(a.nbytes for a in c.arrays.values())}
+    return run
+
+
+def stage_patient_payload(inp):
+    cohort = inp.cohort()
+
+    def run():
+        ps = [cohort._patient_payload(pid) for pid in cohort.patient_ids]
+        return {"items": len(ps), "bytes": sum(p.size for p in ps), "gz_bytes": sum(len(p.gz) for p in ps)}
+    return run
+
+
+def note_sample(cohort):
+    keys = [(pid, i) for pid in cohort.patient_ids for i in range(cohort.data.n_notes(pid))]
+    return keys[::max(len(keys) // NOTE_SAMPLE, 1)][:NOTE_SAMPLE]
+
+
+def stage_note_payload(inp):
+    cohort = inp.cohort()
+    keys = note_sample(cohort)
+
+    def run():
+        ps = [cohort._note_payload(pid, i) for pid, i in keys]
+        return {"items": len(ps), "bytes": sum(p.size for p in ps), "gz_bytes": sum(len(p.gz) for p in ps)}
+    return run
+
+
+def stage_note_stream(inp):
+    cohort = inp.cohort()
+    keys = note_sample(cohort)
+
+    def run():
+        size = sum(len(chunk.encode("utf-8")) for pid, i in keys for chunk in cohort.note_pretty_chunks(pid, i))
+        return {"items": len(keys), "bytes": size}
+    return run
+
+
+def stage_ui(inp):
+    client = A.app.test_client()
+    with client.session_transaction() as s:
+        s["authed"] = True
+
+    def run():
+        A.ui_payload.cache_clear()
+        resp = client.get("/", headers={"Accept-Encoding": "gzip"})
+        if resp.status_code != 200:
+            raise RuntimeError(f"GET / -> {resp.status_code}")
+        p = A.ui_payload("", A.ASSETS.version)  # what the request just rendered (script_root "")
+        return {"bytes": p.size, "gz_bytes": len(resp.data)}
+    return run
+
+
+STAGES = {
+    "load_notes": stage_load_notes,
+    "load_labs": stage_load_labs,
+    "load_medications": stage_load_medications,
+    "make_friendly_text": stage_make_friendly_text,
+    "compact": stage_compact,
+    "patient_payload": stage_patient_payload,
+    "note_payload": stage_note_payload,
+    "note_stream": stage_note_stream,
+    "ui": stage_ui,
+}
+
+
+# ---------- history / baseline ----------
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+
+def fingerprint(run):
+    """Short id of the machine a run was measured on; baselines only apply to the same one."""
+    key = "|".join(str(run.get(k)) for k in ("system", "machine", "cpu", "cpus", "python"))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_json(path, default):
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return default
+
+
+def write_json(path, obj):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(obj, indent=1) + "\n")
+    tmp.replace(path)
+
+
+def compare(run, baseline, tolerance):
+    """Regressions of `run` against `baseline`, as printable lines."""
+    problems = []
+    for scale, stages in run["results"].items():
+        for stage, rec in stages.items():
+            base = baseline.get("results", {}).get(scale, {}).get(stage)
+            if not base:
+                continue
+            for metric, min_delta in MIN_DELTA.items():
+                new, old = rec.get(metric), base.get(metric)
+                if new is None or old is None:
+                    continue
+                tol = SIZE_TOLERANCE if metric.endswith("bytes") else tolerance
+                if new > old * (1 + tol) and new - old > min_delta:
+                    problems.append(f"x{scale} {stage}.{metric}: {old} -> {new} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return problems
+
+
+def main(argv):
+    ap = argparse.ArgumentParser(description="Benchmark loading and serving on synthetic cohorts.")
+    ap.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    ap.add_argument("--repeat", type=int, default=3, help="best of N runs per stage (default 3)")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown / RSS growth")
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    ap.add_argument("--no-history", action="store_true", help="do not append to history.json")
+    ap.add_argument("--require-baseline", action="store_true",
+                    help="exit 1 when this machine has no baseline to compare with")
+    args = ap.parse_args(argv[1:])
+
+    run = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git": git_rev(),
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu": cpu_model(),
+        "cpus": os.cpu_count(),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    for scale in args.scales:
+        paths = synth.write_cohort(DATA_DIR, scale)
+        inp = Inputs(paths)
+        results = run["results"][str(scale)] = {}
+        print(f"--- x{scale} ({', '.join(f'{k} {p.stat().st_size / 2**20:.1f} MB' for k, p in paths.items())})")
+        for name in args.stages:
+            rec = results[name] = best_of(STAGES[name](inp), args.repeat)
+            sizes = "".join(f"  {k}={rec[k]}" for k in ("items", "bytes", "gz_bytes") if k in rec)
+            print(f"{name:20s} {rec['wall_s']:9.4f}s  peak {rec['peak_rss_mb']} MB (+{rec['rss_delta_mb']}){sizes}")
+
+    run["fingerprint"] = fingerprint(run)
+    if not args.no_history:
+        write_json(HISTORY, load_json(HISTORY, []) + [run])
+    path = BASELINES / f"{run['fingerprint']}.json"
+    if args.save_baseline:
+        BASELINES.mkdir(exist_ok=True)
+        write_json(path, run)
+        print(f"Baseline written to {path}")
+        return 0
+    baseline = load_json(path, None)
+    if baseline is None:
+        print(f"No baseline for this machine ({run['fingerprint']}: {run['cpu']}, {run['cpus']} CPUs, "
+              f"Python {run['python']}); comparison skipped (run with --save-baseline to store one).")
+        return 1 if args.require_baseline else 0
+    problems = compare(run, baseline, args.tolerance)
+    if problems:
+        print(f"\nREGRESSION against baseline {baseline.get('git')} ({baseline.get('time')}):")
+        for line in problems:
+            print("  " + line)
+        return 1
+    print(f"\nNo regressions against baseline {baseline.get('git')} ({baseline.get('time')}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,177 @@
+"""
+Synthetic cohorts with the schemas of the real CSVs, for benchmarks.
+
+    write_cohort(out_dir, scale) -> {"notes": path, "labs": path, "meds": path}
+
+Scale 1 is about the size of the files in the repo: 500 patients, ~1.6k notes of ~3 KB,
+~1.1k lab/symptom rows and ~13k medication rows. Everything grows linearly with scale.
+Rows are written in shuffled order, as exported data is not sorted by patient, and the
+output depends only on (scale, seed).
+"""
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+GEN_VERSION = 1
+PATIENTS_PER_SCALE = 500
+
+LAB_FIELDS = {  # column -> (mean, sd), as in symptom_patient_merged.csv
+    "Absolute Basophils": (0.05, 0.03), "Absolute Eosinophils": (0.35, 0.25),
+    "Absolute Lymphocytes": (1.9, 0.7), "Absolute Neutrophils": (4.5, 1.8),
+    "FEV1 PRE": (2.4, 0.7), "FEV1/FVC PRE": (74.0, 9.0),
+    "FEF25-75% PRE": (2.1, 0.9), "FEV1 %PRE PRED": (78.0, 15.0),
+}
+SYMPTOMS = [
+    "wheezing", "shortness_of_breath", "chest_tightness", "coughing", "rapid_breathing",
+    "exercise_induced_symptoms", "nocturnal_symptoms", "exacerbation",
+]
+SYMPTOM_COLS = [f"{s}_{t}" for s in SYMPTOMS for t in ("current", "previous")] + [
+    "general_asthma_symptoms_worsening_current"]
+
+MED_STEMS = [
+    "ALBUTEROL SULFATE HFA", "ALBUTEROL SULFATE", "IPRATROPIUM-ALBUTEROL", "FLUTICASONE PROPIONATE",
+    "FLUTICASONE-SALMETEROL", "BUDESONIDE-FORMOTEROL", "BUDESONIDE", "MOMETASONE-FORMOTEROL",
+    "MONTELUKAST", "TIOTROPIUM BROMIDE", "PREDNISONE", "METHYLPREDNISOLONE SODIUM SUCC",
+    "DEXAMETHASONE SODIUM PHOSPHATE", "DUPIXENT", "XOLAIR", "NUCALA", "FASENRA", "TEZSPIRE",
+    "ADVAIR DISKUS", "SYMBICORT", "TRELEGY ELLIPTA", "SPIRIVA RESPIMAT", "ONDANSETRON HCL (PF)",
+    "SODIUM CHLORIDE 0.9 %", "ACETAMINOPHEN", "IOHEXOL", "KETOROLAC", "LACTATED RINGERS",
+    "OXYCODONE", "FENTANYL (PF)", "IBUPROFEN", "CETIRIZINE", "OMEPRAZOLE", "AZITHROMYCIN",
+    "AMOXICILLIN", "LORATADINE", "GABAPENTIN", "LISINOPRIL", "METFORMIN", "ATORVASTATIN",
+]
+MED_DOSES = ["2.5 MG/3 ML", "90 MCG/ACTUATION", "4 MG/2 ML", "325 MG", "500 MG", "10 MG", "20 MG",
+             "250-50 MCG/DOSE", "160-4.5 MCG/ACTUATION", "300 MG/2 ML", "50 MCG/ML", "1 MG/ML"]
+MED_FORMS = ["TABLET", "INJECTION SOLUTION", "AEROSOL INHALER", "SOLUTION FOR NEBULIZATION",
+             "IV BOLUS", "CAPSULE", "SUBCUTANEOUS SYRINGE", "INTRAVENOUS SOLUTION", "FLUSH FOR RAD"]
+
+SECTIONS = ["Chief Complaint(s)", "HPI", "Review of Systems", "Physical Exam", "Medications",
+            "Allergies", "Vital Signs", "Social History", "Family History", "ASSESSMENT AND PLAN"]
+WORDS = (
+    "patient reports wheezing cough shortness of breath chest tightness at night with exercise "
+    "albuterol inhaler use increased since last visit denies fever chills prednisone burst "
+    "exacerbation emergency department asthma control test score spirometry reviewed "
+    "eosinophils elevated biologic therapy discussed dupilumab mepolizumab injection site "
+    "tolerating well adherence good follow up in weeks lungs clear bilaterally no rales "
+    "mild expiratory wheeze heart regular rate rhythm continue current regimen step up "
+    "controller inhaled corticosteroid long acting beta agonist pt states symptoms worse "
+    "with cold air allergens pets dust smoke exposure none works as teacher lives with family"
+).split()
+NOTE_CHARS = 3200  # mean note length, as in the annotated sample
+
+
+def pid_of(seed, i):
+    return hashlib.sha256(f"synthetic-{seed}-{i}".encode()).hexdigest()
+
+
+def _sentences(rng, n):
+    out = []
+    for _ in range(n):
+        words = rng.choice(WORDS, size=int(rng.integers(6, 18)))
+        s = " ".join(words)
+        if rng.random() < 0.2:
+            s += f" ({rng.choice(WORDS)} {int(rng.integers(1, 30))}d)"
+        out.append(s[0].upper() + s[1:] + ("., " if rng.random() < 0.3 else ". "))
+    return np.array(out, dtype=object)
+
+
+def _note_texts(rng, n):
+    pool = _sentences(rng, 600)
+    mean_len = np.mean([len(s) for s in pool])
+    per_note = max(int(NOTE_CHARS / mean_len), 1)
+    texts = []
+    for _ in range(n):
+        k = max(int(rng.normal(per_note, per_note / 3)), 3)
+        idx = rng.integers(0, len(pool), size=k)
+        heads = rng.choice(SECTIONS, size=4, replace=False)
+        cut = np.sort(rng.integers(0, k, size=4))
+        parts, last = [], 0
+        for head, c in zip(heads, cut):
+            parts.append("".join(pool[idx[last:c]]))
+            parts.append(f"  {head}  ")
+            last = c
+        parts.append("".join(pool[idx[last:]]))
+        texts.append("".join(parts))
+    return texts
+
+
+def _per_patient(rng, n_pat, extra_mean):
+    return 1 + rng.poisson(extra_mean, size=n_pat)
+
+
+def _dates(rng, counts, spread):
+    """Per row: patient index and a date around the patient's own baseline."""
+    pidx = np.repeat(np.arange(len(counts)), counts)
+    base = rng.integers(20000, 28000, size=len(counts))
+    return pidx, (base[pidx] + rng.integers(0, spread, size=len(pidx))).astype(float)
+
+
+def notes_frame(rng, pids):
+    pidx, dates = _dates(rng, _per_patient(rng, len(pids), 2.3), 1500)
+    n = len(pidx)
+    df = pd.DataFrame({
+        "index": np.arange(n),
+        "PATIENTHASHMRN": pids[pidx],
+        "ENCOUNTERHASHKEY": [hashlib.sha256(f"enc-{i}".encode()).hexdigest() for i in range(n)],
+        "ENCDATEDIFFNO": dates,
+        "NOTE_KEY": rng.integers(10**7, 10**8, size=n),
+        "DEIDENTIFIED_TEXT": _note_texts(rng, n),
+    })
+    for c in SYMPTOM_COLS:
+        df[c] = rng.integers(0, 2, size=n)
+    return df
+
+
+def labs_frame(rng, pids):
+    pidx, dates = _dates(rng, _per_patient(rng, len(pids), 1.2), 1500)
+    n = len(pidx)
+    df = pd.DataFrame({
+        "PATIENTHASHMRN": pids[pidx],
+        "ENCOUNTERHASHKEY": [hashlib.sha256(f"lab-{i}".encode()).hexdigest() for i in range(n)],
+        "DATE_DIF": dates,
+        "NOTE_KEY": rng.integers(10**7, 10**8, size=n),
+    })
+    for c in SYMPTOM_COLS:
+        df[c] = rng.integers(0, 2, size=n)
+    for c, (mean, sd) in LAB_FIELDS.items():
+        v = np.round(np.abs(rng.normal(mean, sd, size=n)), 2)
+        v[rng.random(n) < 0.3] = np.nan
+        df[c] = v
+    # demographics are per patient
+    df["BMI"] = np.round(rng.normal(29, 6, size=len(pids)), 1)[pidx]
+    df["AGE"] = rng.integers(5, 85, size=len(pids)).astype(float)[pidx]
+    df["SEX"] = rng.integers(0, 2, size=len(pids)).astype(float)[pidx]
+    df["ATS_SEVERE"] = rng.integers(0, 2, size=n)
+    return df
+
+
+def meds_frame(rng, pids):
+    # ~6 medications per (patient, date) and ~4 dates per patient
+    visits = _per_patient(rng, len(pids), 3.0)
+    vidx, vdates = _dates(rng, visits, 1500)
+    per_visit = 1 + rng.poisson(5, size=len(vidx))
+    rows = np.repeat(np.arange(len(vidx)), per_visit)
+    vocab = np.array([f"{s} {d} {f}" for s in MED_STEMS for d in MED_DOSES for f in MED_FORMS], dtype=object)
+    vocab = vocab[rng.permutation(len(vocab))[:len(vocab) // 3]]
+    # a few names are very common, most are rare
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    names = rng.choice(vocab, size=len(rows), p=weights / weights.sum())
+    return pd.DataFrame({"PATIENTHASHMRN": pids[vidx[rows]], "DATE_DIF": vdates[rows], "MEDNAME": names})
+
+
+def write_cohort(out_dir, scale, seed=0):
+    """Write (or reuse) the synthetic CSVs for `scale`; returns their paths by kind."""
+    out = Path(out_dir) / f"x{scale}-seed{seed}-v{GEN_VERSION}"
+    paths = {k: out / f"{k}.csv" for k in ("notes", "labs", "meds")}
+    if all(p.exists() for p in paths.values()):
+        return paths
+    out.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng([seed, scale])
+    pids = np.array([pid_of(seed, i) for i in range(PATIENTS_PER_SCALE * scale)], dtype=object)
+    for kind, make in (("labs", labs_frame), ("meds", meds_frame), ("notes", notes_frame)):
+        df = make(rng, pids)
+        df = df.iloc[rng.permutation(len(df))]
+        tmp = paths[kind].with_suffix(".tmp")
+        df.to_csv(tmp, index=False)
+        tmp.replace(paths[kind])
+    return paths
@@ -0,0 +1,112 @@
+# cohort_cache.py
+"""
+Columnar on-disk cache of the processed cohort, so workers skip CSV parsing.
+
+One cache entry is a directory named by its key, holding a CompactCohort:
+  manifest.json      patient ids, field names, bio events, meds error, notes hash
+  notes_*.npy        per-note patient index and date; raw text as one UTF-8 blob + offsets
+  labs_*.npy         per-record patient index; float64 values; int8 flags (-1 = missing)
+  meds_*.npy         per-record patient index and date; med codes + offsets into a vocab
+  demo_*.npy         per-patient age, BMI and sex code
+Arrays are opened with mmap_mode="r", so the OS pages in only what is read and workers
+share the pages. An entry is published with one rename and never rewritten; evicting one
+renames it away before deleting it, so a reader sees a whole entry or a miss (and then
+parses the CSVs), never a partial one.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from compact_cohort import CompactCohort
+
+CACHE_VERSION = 5  # 5: manifest lists the arrays
+
+
+def source_key(paths, extra=""):
+    """
+    Key from each source file's path, size and mtime (plus any extra config), as
+    "<sources>-<versions>": the first part names the source set (paths + config) alone.
+    """
+    sources = hashlib.sha256(f"v{CACHE_VERSION}|{extra}".encode("utf-8"))
+    versions = hashlib.sha256()
+    for p in paths:
+        p = Path(p)
+        try:
+            st = p.stat()
+            sources.update(f"|{p.resolve()}".encode("utf-8"))
+            versions.update(f"|{st.st_size}|{st.st_mtime_ns}".encode("utf-8"))
+        except FileNotFoundError:
+            sources.update(f"|{p}".encode("utf-8"))
+            versions.update(b"|missing")
+    return f"{sources.hexdigest()[:12]}-{versions.hexdigest()[:12]}"
+
+
+# ---------- write ----------
+def write_cache(cache_dir, key, cohort):
+    """Atomically write a CompactCohort's arrays and manifest as entry `key` (kept if it already exists)."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {"version": CACHE_VERSION, "key": key, "arrays": sorted(cohort.arrays), **cohort.manifest}
+
+    tmp = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir))
+    try:
+        for name, arr in cohort.arrays.items():
+            np.save(tmp / f"{name}.npy", arr, allow_pickle=False)
+        with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        target = cache_dir / key
+        # same key, same sources: a readable entry is the same cohort, and other processes may
+        # have it mapped; only an unreadable one is replaced
+        if read_cache(target) is None:
+            _discard(target)
+            try:
+                os.rename(tmp, target)
+            except OSError:
+                if not target.is_dir():
+                    raise
+                # another process published it first
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(tmp, ignore_errors=True)
+    # entries for older versions of the same sources are dead weight; other source sets
+    # (another deployment or config sharing the directory) are left alone
+    prefix = key.split("-")[0] + "-"
+    for old in cache_dir.iterdir():
+        if old.is_dir() and old.name != key and old.name.startswith(prefix):
+            _discard(old)
+    return cache_dir / key
+
+
+def _discard(entry_dir):
+    """Delete an entry: renamed away first, so no reader finds it half deleted."""
+    gone = entry_dir.with_name(f".{entry_dir.name}.{os.getpid()}.discarded")
+    try:
+        os.rename(entry_dir, gone)
+    except OSError:  # already gone (another process evicted it)
+        return
+    shutil.rmtree(gone, ignore_errors=True)
+
+
+# ---------- read ----------
+def read_cache(entry_dir):
+    """
+    The CompactCohort stored in `entry_dir` (arrays memory-mapped), or None if it is missing,
+    unreadable or was evicted while being read.
+    """
+    entry_dir = Path(entry_dir)
+    try:
+        with open(entry_dir / "manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != CACHE_VERSION:
+            return None
+        names = manifest.pop("arrays")
+        arrays = {name: np.load(entry_dir / f"{name}.npy", mmap_mode="r", allow_pickle=False) for name in names}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return CompactCohort(arrays, manifest)
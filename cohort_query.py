@@ -0,0 +1,185 @@
+# cohort_query.py
+"""
+Cohort-wide note queries, e.g.
+
+    eosinophils > 0.3 and exacerbation_current = 1 and on ICS within 30
+
+Clauses are joined by "and":
+  <field> <op> <number>    op: > >= < <= = != ; field: a lab, a symptom flag, AGE, BMI,
+                           note_date or lab_date (unambiguous parts of a name are enough)
+  on [a|an|the] <medication> [within <days>]
+                           a MedIndex query (class, brand/generic or substring) with a
+                           dated record within ±days of the note (default 30); a query
+                           that matches no medication at all is an error, not 0 notes
+
+Every note gets the values of its closest lab/symptom record, the one the page shows
+next to it. Those values sit in one float column per field (NaN = missing), each with
+a lazily built argsort, so a threshold is two binary searches. The most selective
+clause picks the candidates, and the rest are checked on those rows only.
+"""
+import operator
+import re
+
+import numpy as np
+
+from compact_cohort import nearest_by_date
+
+DEFAULT_MED_WINDOW = 30
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+       "=": operator.eq, "==": operator.eq, "!=": operator.ne}
+
+_CMP = re.compile(r"^(.+?)\s*(>=|<=|!=|==|=|<|>)\s*(-?(?:\d+(?:\.\d*)?|\.\d+))$")
+_MED = re.compile(r"^(?:on|meds?)\s+(?:(?:an?|the)\s+)?(.+?)(?:\s+within\s+±?\s*(\d+)\s*(?:d|days?)?)?$", re.I)
+
+
+def _norm(s):
+    return re.sub(r"[^a-z0-9]+", "", str(s).lower())
+
+
+def resolve_field(name, fields):
+    """The field `name` refers to: an exact match, else the only field containing it."""
+    n = _norm(name)
+    exact = [f for f in fields if _norm(f) == n]
+    if exact:
+        return exact[0]
+    found = [f for f in fields if n and n in _norm(f)]
+    if len(found) == 1:
+        return found[0]
+    if not found:
+        raise ValueError(f"unknown field: {name!r}")
+    raise ValueError(f"ambiguous field {name!r}: {', '.join(found)}")
+
+
+def parse(query, fields):
+    """Query string -> list of clauses ({"field", "op", "value"} or {"med", "within"})."""
+    clauses = []
+    for part in re.split(r"\s+and\s+", str(query).strip(), flags=re.I):
+        part = part.strip()
+        if not part:
+            raise ValueError("empty clause")
+        m = _CMP.match(part)
+        if m:
+            clauses.append({"field": resolve_field(m.group(1), fields), "op": m.group(2), "value": float(m.group(3))})
+            continue
+        m = _MED.match(part)
+        if m:
+            within = DEFAULT_MED_WINDOW if m.group(2) is None else int(m.group(2))
+            clauses.append({"med": m.group(1).strip(), "within": within})
+            continue
+        raise ValueError(f"cannot parse {part!r} (use '<field> <op> <number>' or 'on <medication> within <days>')")
+    return clauses
+
+
+class NoteTable:
+    """One row per note of a CompactCohort, with the columns queries filter on."""
+
+    def __init__(self, cohort, med_index):
+        self.cohort = cohort
+        self.med_index = med_index
+        a = cohort.arrays
+        self.note_pid = np.asarray(a["notes_pid"])
+        self.note_date = np.asarray(a["notes_date"])
+        values = np.asarray(a["labs_values"])
+        flags = np.asarray(a["labs_flags"])
+
+        # closest lab record of every note (-1: the patient has none)
+        lab_row = np.full(len(self.note_pid), -1, dtype=np.int64)
+        for p in range(len(cohort.pids)):
+            na, nb = int(cohort.note_off[p]), int(cohort.note_off[p + 1])
+            la, lb = int(cohort.lab_off[p]), int(cohort.lab_off[p + 1])
+            if lb > la and nb > na:
+                lab_row[na:nb] = la + np.asarray(nearest_by_date(values[la:lb, 0], self.note_date[na:nb]))
+        has_lab = lab_row >= 0
+        rows = np.where(has_lab, lab_row, 0)
+
+        def per_note(col):
+            out = np.full(len(lab_row), np.nan)
+            if len(col):
+                out[has_lab] = col[rows[has_lab]]
+            return out
+
+        self.columns = {"note_date": self.note_date}
+        for j, key in enumerate(cohort.lab_keys):
+            self.columns["lab_date" if key == "date" else key] = per_note(values[:, j])
+        for j, key in enumerate(cohort.sym_keys):
+            f = flags[:, j].astype(np.float64)
+            f[f < 0] = np.nan
+            self.columns[key] = per_note(f)
+        self.columns["AGE"] = np.asarray(a["demo_age"])[self.note_pid]
+        self.columns["BMI"] = np.asarray(a["demo_bmi"])[self.note_pid]
+        self.fields = list(self.columns)
+        self._sorted = {}
+
+    def _index(self, field):
+        """(argsort, sorted values, number of non-missing values) of a column."""
+        idx = self._sorted.get(field)
+        if idx is None:
+            col = self.columns[field]
+            order = np.argsort(col, kind="stable")  # NaN sorts last
+            idx = self._sorted[field] = (order, col[order], int(np.count_nonzero(~np.isnan(col))))
+        return idx
+
+    def _range(self, c):
+        """(lo, hi) span of the column's sorted index that can match a threshold clause."""
+        order, vals, n = self._index(c["field"])
+        v, op = c["value"], c["op"]
+        left = int(np.searchsorted(vals[:n], v, side="left"))
+        right = int(np.searchsorted(vals[:n], v, side="right"))
+        return {">": (right, n), ">=": (left, n), "<": (0, left), "<=": (0, right),
+                "=": (left, right), "==": (left, right), "!=": (0, n)}[op]
+
+    def _on_med(self, rows, c):
+        """Which of `rows` have a dated record of a matching medication within ±within days."""
+        rp, rd = self.med_index.occurrences(c["med"])
+        dated = ~np.isnan(rd)
+        rp, rd = rp[dated], rd[dated]
+        if not len(rd) or not len(rows):
+            return np.zeros(len(rows), dtype=bool)
+        # one sorted key per (patient, date) so a window is two binary searches
+        d = c["within"]
+        nd = self.note_date[rows]
+        base = min(rd.min(), nd.min()) - d
+        span = max(rd.max(), nd.max()) - base + d + 1
+        keys = np.sort(rp * span + (rd - base))
+        centre = self.note_pid[rows] * span + (nd - base)
+        return np.searchsorted(keys, centre + d, side="right") > np.searchsorted(keys, centre - d, side="left")
+
+    def run(self, clauses):
+        """Indexes (in cohort order) of notes matching every clause."""
+        cmp = [c for c in clauses if "field" in c]
+        meds = [c for c in clauses if "med" in c]
+        if cmp:
+            ranges = sorted(((self._range(c), c) for c in cmp), key=lambda r: r[0][1] - r[0][0])
+            (lo, hi), first = ranges[0]
+            rows = self._index(first["field"])[0][lo:hi]
+            if first["op"] == "!=":
+                rows = rows[self.columns[first["field"]][rows] != first["value"]]
+            for _, c in ranges[1:]:
+                col = self.columns[c["field"]][rows]
+                rows = rows[OPS[c["op"]](col, c["value"]) & ~np.isnan(col)]
+            rows = np.sort(rows)
+        else:
+            rows = np.arange(len(self.note_pid))
+        for c in meds:
+            rows = rows[self._on_med(rows, c)]
+        return rows
+
+    def search(self, query, offset=0, limit=100):
+        clauses = parse(query, self.fields)
+        for c in clauses:
+            if "med" in c and not len(self.med_index.match(c["med"])):
+                raise ValueError(f"no medication matches {c['med']!r} (use a class such as ICS, or a brand/generic name)")
+        rows = self.run(clauses)
+        shown = [c["field"] for c in clauses if "field" in c]
+        pids, off = self.cohort.pids, self.cohort.note_off
+        notes = []
+        for r in rows[offset:offset + limit].tolist():
+            p = int(self.note_pid[r])
+            vals = {f: self.columns[f][r] for f in dict.fromkeys(shown + ["lab_date"])}
+            notes.append({
+                "pid": pids[p],
+                "note": r - int(off[p]),
+                "date": float(self.note_date[r]),
+                "values": {f: None if np.isnan(v) else float(v) for f, v in vals.items()},
+            })
+        return {"query": query, "clauses": clauses, "total": len(rows), "offset": offset, "limit": limit, "notes": notes}
@@ -0,0 +1,295 @@
+# compact_cohort.py
+"""
+Compact in-memory cohort. Each per-patient series lives in one contiguous NumPy array
+for the whole cohort and is sliced by per-patient offsets:
+
+  notes  notes_pid int32, notes_date float64; text as one UTF-8 blob + int64 offsets
+         (friendly text likewise, when it was made at load)
+  labs   labs_values float64 (rows x ["date"] + lab fields), labs_flags int8 (rows x
+         symptom fields, -1 = missing); the rare non-numeric lab cell goes in lab_text
+  meds   meds_date float64 (NaN = undated), meds_off into meds_codes int32; codes index
+         an interned vocabulary, so each distinct medication string is stored once
+  demo   demo_age / demo_bmi float64 per patient, demo_sex as codes into a small vocabulary
+
+Dict records are rebuilt only for the patient being served. cohort_cache writes these
+same arrays to disk and serves a cached cohort straight from np.load(mmap_mode="r").
+"""
+import hashlib
+import sys
+
+import numpy as np
+
+
+# ---------- encoding helpers ----------
+def _pack_strings(strings):
+    enc = [s.encode("utf-8") for s in strings]
+    off = np.zeros(len(enc) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in enc], out=off[1:])
+    return np.frombuffer(b"".join(enc), dtype=np.uint8), off
+
+
+def _unpack_strings(blob, off):
+    buf = blob.tobytes()
+    o = off.tolist()
+    return [buf[a:b].decode("utf-8") for a, b in zip(o[:-1], o[1:])]
+
+
+def _to_float(v):
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+
+
+def _floats_to_py(a):
+    """float64 column -> object array of int (integral) | float | None (NaN), like try_float."""
+    out = np.full(len(a), None, dtype=object)
+    ok = ~np.isnan(a)
+    is_int = ok & (a == np.trunc(a))
+    out[is_int] = a[is_int].astype(np.int64).astype(object)
+    out[ok & ~is_int] = a[ok & ~is_int].astype(object)
+    return out
+
+
+def _slices(idx, n_groups):
+    """Offsets of each group in an index array that is sorted by group."""
+    return np.searchsorted(idx, np.arange(n_groups + 1), side="left")
+
+
+def nearest_by_date(dates, targets):
+    """
+    For each target date, the index of the record closest in date (None if there are no
+    records). `dates` is sorted ascending with undated (NaN) records last, as the loaders
+    emit them; an undated record counts as distance 0 and ties go to the earlier record,
+    which is what the page's former linear scan picked.
+    """
+    d = np.asarray(dates, dtype=np.float64)
+    t = np.asarray(targets, dtype=np.float64)
+    if not len(d):
+        return [None] * len(t)
+    dated = d[~np.isnan(d)]
+    m = len(dated)
+    if m == 0:
+        return [0] * len(t)
+    j = np.searchsorted(dated, t, side="left")      # first record on/after the target
+    hi = np.minimum(j, m - 1)
+    lo_date = dated[np.maximum(j - 1, 0)]
+    lo = np.searchsorted(dated, lo_date, side="left")  # first record on the date before it
+    dist_lo = np.where(j > 0, t - lo_date, np.inf)
+    dist_hi = np.where(j < m, dated[hi] - t, np.inf)
+    best = np.where(dist_lo <= dist_hi, lo, hi)
+    if m < len(d):
+        best = np.where(dist_hi == 0, hi, m)  # an exact match, else the first undated record
+    return best.tolist()
+
+
+def _notes_hash(arrays):
+    """Hash of the note texts and their boundaries (names note_search's index)."""
+    h = hashlib.blake2b(digest_size=12)
+    for name in ("notes_text_off", "notes_text"):
+        h.update(memoryview(np.ascontiguousarray(arrays[name])).cast("B"))
+    return h.hexdigest()
+
+
+def encode(data, lab_fields, sym_fields):
+    """(arrays, manifest) for the dict cohort built by app.assemble_cohort."""
+    pids = list(data["patients"].keys())
+    pindex = {pid: i for i, pid in enumerate(pids)}
+
+    arrays = {}
+    # notes
+    note_pid, note_date, texts, pretty = [], [], [], []
+    for pid in pids:
+        for n in data["patients"][pid]["notes"]:
+            note_pid.append(pindex[pid])
+            note_date.append(n["date"])
+            texts.append(n["text"])
+            pretty.append(n.get("pretty"))
+    arrays["notes_pid"] = np.asarray(note_pid, dtype=np.int32)
+    arrays["notes_date"] = np.asarray(note_date, dtype=np.float64)
+    arrays["notes_text"], arrays["notes_text_off"] = _pack_strings(texts)
+    if pretty and None not in pretty:
+        arrays["notes_pretty"], arrays["notes_pretty_off"] = _pack_strings(pretty)
+
+    # labs: numeric cells in a float matrix, anything else (text values) as exceptions
+    value_keys = ["date"] + list(lab_fields)
+    lab_pid, values, flags, lab_text = [], [], [], {}
+    for pid in pids:
+        for rec in data["labs"].get(pid, []):
+            r = len(lab_pid)
+            lab_pid.append(pindex[pid])
+            row = []
+            for j, k in enumerate(value_keys):
+                v = rec.get(k)
+                if isinstance(v, str):
+                    lab_text[f"{r},{j}"] = v
+                row.append(_to_float(v))
+            values.append(row)
+            flags.append([-1 if rec.get(k) is None else int(rec[k]) for k in sym_fields])
+    arrays["labs_pid"] = np.asarray(lab_pid, dtype=np.int32)
+    arrays["labs_values"] = np.asarray(values, dtype=np.float64).reshape(len(lab_pid), len(value_keys))
+    arrays["labs_flags"] = np.asarray(flags, dtype=np.int8).reshape(len(lab_pid), len(sym_fields))
+
+    # meds: vocabulary + codes
+    vocab, vcode = [], {}
+    med_pid, med_date, codes, med_off = [], [], [], [0]
+    for pid in pids:
+        for rec in data["meds"].get(pid, []):
+            med_pid.append(pindex[pid])
+            med_date.append(np.nan if rec["date"] is None else float(rec["date"]))
+            for m in rec["meds"]:
+                if m not in vcode:
+                    vcode[m] = len(vocab)
+                    vocab.append(m)
+                codes.append(vcode[m])
+            med_off.append(len(codes))
+    arrays["meds_pid"] = np.asarray(med_pid, dtype=np.int32)
+    arrays["meds_date"] = np.asarray(med_date, dtype=np.float64)
+    arrays["meds_codes"] = np.asarray(codes, dtype=np.int32)
+    arrays["meds_off"] = np.asarray(med_off, dtype=np.int64)
+    arrays["meds_vocab"], arrays["meds_vocab_off"] = _pack_strings(vocab)
+
+    # demographics: one row per patient (text AGE/BMI values kept aside, like lab_text)
+    demo = [data["demo"].get(pid, {}) for pid in pids]
+    demo_text = {f"{i},{k}": d[k] for i, d in enumerate(demo) for k in ("AGE", "BMI") if isinstance(d.get(k), str)}
+    sexes = sorted({str(d.get("SEX") or "") for d in demo})
+    arrays["demo_age"] = np.asarray([_to_float(d.get("AGE")) for d in demo], dtype=np.float64)
+    arrays["demo_bmi"] = np.asarray([_to_float(d.get("BMI")) for d in demo], dtype=np.float64)
+    arrays["demo_sex"] = np.asarray([sexes.index(str(d.get("SEX") or "")) for d in demo], dtype=np.int16)
+
+    manifest = {
+        "pids": pids,
+        "lab_keys": value_keys,
+        "sym_keys": list(sym_fields),
+        "lab_text": lab_text,
+        "sex_vocab": sexes,
+        "demo_text": demo_text,
+        "bio": data["bio"],
+        "meds_err": data["meds_err"],
+        "notes_hash": _notes_hash(arrays),
+    }
+    return arrays, manifest
+
+
+class CompactCohort:
+    """Read-only columnar cohort with per-patient accessors that return page-ready records."""
+
+    def __init__(self, arrays, manifest):
+        self.arrays = arrays
+        self.manifest = manifest
+        self.pids = manifest["pids"]
+        self.index = {pid: i for i, pid in enumerate(self.pids)}
+        self.lab_keys = manifest["lab_keys"]
+        self.sym_keys = manifest["sym_keys"]
+        self.bio = manifest["bio"]
+        self.meds_err = manifest["meds_err"]
+        self.lab_text = {}
+        for cell, text in manifest["lab_text"].items():
+            r, j = map(int, cell.split(","))
+            self.lab_text.setdefault(r, {})[j] = text
+
+        a = arrays
+        n = len(self.pids)
+        self.note_off = _slices(np.asarray(a["notes_pid"]), n)
+        self.lab_off = _slices(np.asarray(a["labs_pid"]), n)
+        self.med_off = _slices(np.asarray(a["meds_pid"]), n)
+        self.vocab = [sys.intern(s) for s in _unpack_strings(a["meds_vocab"], a["meds_vocab_off"])]
+
+    @classmethod
+    def from_data(cls, data, lab_fields, sym_fields):
+        return cls(*encode(data, lab_fields, sym_fields))
+
+    def __contains__(self, pid):
+        return pid in self.index
+
+    def _span(self, offsets, pid):
+        i = self.index[pid]
+        return int(offsets[i]), int(offsets[i + 1])
+
+    def demo(self, pid):
+        i = self.index[pid]
+        a = self.arrays
+        age, bmi = _floats_to_py(np.array([a["demo_age"][i], a["demo_bmi"][i]]))
+        text = self.manifest["demo_text"]
+        return {
+            "AGE": text.get(f"{i},AGE", age),
+            "SEX": self.manifest["sex_vocab"][int(a["demo_sex"][i])],
+            "BMI": text.get(f"{i},BMI", bmi),
+        }
+
+    # ---------- notes ----------
+    def n_notes(self, pid):
+        a, b = self._span(self.note_off, pid)
+        return b - a
+
+    def note_dates(self, pid):
+        a, b = self._span(self.note_off, pid)
+        return np.asarray(self.arrays["notes_date"][a:b])
+
+    def note_text(self, pid, i, blob="notes_text"):
+        a, _ = self._span(self.note_off, pid)
+        off = self.arrays[blob + "_off"]
+        lo, hi = int(off[a + i]), int(off[a + i + 1])
+        return self.arrays[blob][lo:hi].tobytes().decode("utf-8")
+
+    def note_pretty(self, pid, i):
+        """Friendly text made at load, or None when it is made on request."""
+        return self.note_text(pid, i, "notes_pretty") if "notes_pretty" in self.arrays else None
+
+    # ---------- labs ----------
+    def lab_dates(self, pid):
+        a, b = self._span(self.lab_off, pid)
+        return np.asarray(self.arrays["labs_values"][a:b, 0])
+
+    def labs(self, pid):
+        a, b = self._span(self.lab_off, pid)
+        if a == b:
+            return []
+        values = np.asarray(self.arrays["labs_values"][a:b])
+        flags = np.asarray(self.arrays["labs_flags"][a:b])
+        cols = [_floats_to_py(values[:, j]) for j in range(len(self.lab_keys))]
+        for r in range(a, b):
+            for j, text in self.lab_text.get(r, {}).items():
+                cols[j][r - a] = text
+        for j in range(len(self.sym_keys)):
+            f = flags[:, j]
+            col = np.full(len(f), None, dtype=object)
+            col[f >= 0] = f[f >= 0].astype(np.int64).astype(object)
+            cols.append(col)
+        keys = self.lab_keys + self.sym_keys
+        return [dict(zip(keys, vals)) for vals in zip(*cols)]
+
+    # ---------- meds ----------
+    def med_dates(self, pid):
+        a, b = self._span(self.med_off, pid)
+        return np.asarray(self.arrays["meds_date"][a:b])
+
+    def meds(self, pid):
+        a, b = self._span(self.med_off, pid)
+        if a == b:
+            return []
+        dates = _floats_to_py(np.asarray(self.arrays["meds_date"][a:b]))
+        off = np.asarray(self.arrays["meds_off"][a:b + 1]).tolist()
+        codes = np.asarray(self.arrays["meds_codes"][off[0]:off[-1]]).tolist()
+        base, vocab = off[0], self.vocab
+        return [
+            {"date": dates[r], "meds": [vocab[c] for c in codes[off[r] - base:off[r + 1] - base]]}
+            for r in range(b - a)
+        ]
+
+    def to_data(self, pids=None):
+        """The equivalent dict cohort (as built by app.assemble_cohort), optionally of some patients only."""
+        pids = self.pids if pids is None else [pid for pid in self.pids if pid in pids]
+        patients = {}
+        for pid in pids:
+            dates = self.note_dates(pid).tolist()
+            notes = [{"date": d, "text": self.note_text(pid, i)} for i, d in enumerate(dates)]
+            if "notes_pretty" in self.arrays:
+                for i, n in enumerate(notes):
+                    n["pretty"] = self.note_pretty(pid, i)
+            patients[pid] = {"notes": notes, "min_date": min(dates), "max_date": max(dates)}
+        return {
+            "patients": patients,
+            "labs": {pid: labs for pid in pids if (labs := self.labs(pid))},
+            "demo": {pid: self.demo(pid) for pid in pids},
+            "meds": {pid: self.meds(pid) for pid in pids},
+            "meds_err": self.meds_err,
+            "bio": {pid: v for pid, v in self.bio.items() if pid in patients},
+        }
@@ -0,0 +1,29 @@
+# gunicorn.conf.py — picked up automatically by `gunicorn app:app` from this directory.
+import os
+
+# Import the app (and load the cohort, below) once in the master; forked workers then
+# share that memory copy-on-write instead of each parsing the CSVs again.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # Runs in the master after the preload and before workers are forked.
+    if preload_app:
+        import app
+        cohort = app.STORE.warm_up()
+        if cohort is None:
+            server.log.warning("Data not loaded at startup: %s", app.STORE.error)
+        else:
+            cohort.text_index.ensure_built()  # workers wait for (and then share) this build
+        if app.STARTUP_TRACE:
+            app.STARTUP.print()  # includes the data load above
+
+
+def post_fork(server, worker):
+    # A worker forked while the master's build thread ran would inherit its held lock
+    # (but not the thread) and never build or retry; reset it. The `.building` marker
+    # still tells the worker that the master is building.
+    if preload_app:
+        import app
+        if app.STORE.ready:
+            app.STORE.get().text_index.after_fork()
@@ -0,0 +1,268 @@
+# instrumentation.py
+"""
+Opt-in request instrumentation: stage timers, payload-size counters, a Prometheus
+/metrics endpoint and per-request sampling profiles.
+
+  METRICS=1           time stages (loaders, rendering, JSON serialization, compression)
+                      and requests; expose them at /metrics; add a Server-Timing header
+                      so the browser shows server time next to transfer time
+  METRICS_TOKEN=...   /metrics also accepts "Authorization: Bearer <token>" (scrapers)
+  PROFILE_REQUESTS=1  ?__profile=1 on any page or API URL (signed-in users) returns a
+                      sampled profile of that request (a streamed body included) in
+                      folded-stack format, the input of flamegraph.pl, speedscope and inferno
+
+Disabled (the default), `timed` returns the function unchanged, `stage` a shared no-op
+context manager, and no request hooks are registered.
+
+Metrics are per process: every sample carries a `worker` label (the pid), so under
+gunicorn aggregate across workers with sum() / histogram_quantile over sum by (le).
+"""
+import collections
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from flask import Response, g, has_request_context, request, session
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROFILE_INTERVAL = 0.001  # seconds between stack samples
+PROFILE_MAX_SECONDS = 60
+_NOOP = nullcontext()
+
+
+def _labels(pairs):
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{esc(v)}"' for k, v in pairs)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        for i, b in enumerate(BUCKETS):
+            if v <= b:
+                self.counts[i] += 1
+                break
+        self.sum += v
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms, keyed by (name, label tuple), rendered in Prometheus text format."""
+
+    HELP = {
+        "app_stage_seconds": ("histogram", "Time spent in an instrumented stage."),
+        "app_requests_total": ("counter", "HTTP requests by endpoint and status."),
+        "app_request_seconds": ("histogram", "Request handling time by endpoint (excludes sending the body)."),
+        "app_response_bytes_total": ("counter", "Response body bytes by endpoint and content encoding."),
+        "app_payload_bytes_total": ("counter", "Pre-serialized payload bytes built, by encoding."),
+    }
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(float)
+        self._hists = collections.defaultdict(_Histogram)
+
+    # ---------- recording ----------
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            with self._lock:
+                self._counters[name, tuple(labels.items())] += value
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            with self._lock:
+                self._hists[name, tuple(labels.items())].observe(value)
+
+    def stage(self, name):
+        """Context manager timing one stage; inside a request it also goes to Server-Timing."""
+        return _Stage(self, name) if self.enabled else _NOOP
+
+    def timed(self, name):
+        """Decorator form of stage(); a no-op (the function itself) when disabled."""
+        def deco(fn):
+            if not self.enabled:
+                return fn
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Stage(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    # ---------- exposition ----------
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: (list(h.counts), h.sum, h.count) for k, h in self._hists.items()}
+        worker = ("worker", os.getpid())  # not at import: gunicorn workers fork from a preloaded master
+        lines = []
+        for name, (kind, text) in self.HELP.items():
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{{{_labels((*labels, worker))}}} {v:g}")
+            for (n, labels), (counts, total, count) in sorted(hists.items()):
+                if n != name:
+                    continue
+                cum = 0
+                for b, c in zip(BUCKETS, counts):
+                    cum += c
+                    lines.append(f"{name}_bucket{{{_labels((*labels, worker, ('le', b)))}}} {cum}")
+                lines.append(f"{name}_bucket{{{_labels((*labels, worker, ('le', '+Inf')))}}} {count}")
+                lines.append(f"{name}_sum{{{_labels((*labels, worker))}}} {total:.6f}")
+                lines.append(f"{name}_count{{{_labels((*labels, worker))}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class _Stage:
+    __slots__ = ("m", "name", "t0")
+
+    def __init__(self, m, name):
+        self.m, self.name = m, name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        self.m.observe("app_stage_seconds", dt, stage=self.name)
+        if has_request_context():
+            g.setdefault("stage_times", []).append((self.name, dt))
+        return False
+
+
+class SamplingProfiler:
+    """Samples one thread's stack from a helper thread and counts folded stacks."""
+
+    _active = 0  # profiles running in this process; the last one restores the switch interval
+    _active_lock = threading.Lock()
+    _switch = None
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        # the sampler needs the GIL to look at the other thread: switch more often meanwhile
+        cls = SamplingProfiler
+        with cls._active_lock:
+            if cls._active == 0:
+                cls._switch = sys.getswitchinterval()
+                sys.setswitchinterval(min(cls._switch, self.interval / 2))
+            cls._active += 1
+        self.t0 = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        cls = SamplingProfiler
+        with cls._active_lock:
+            cls._active -= 1
+            if cls._active == 0:
+                sys.setswitchinterval(cls._switch)
+        self.seconds = time.perf_counter() - self.t0
+
+    def _run(self):
+        deadline = time.perf_counter() + PROFILE_MAX_SECONDS
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+METRICS = Metrics(enabled=os.getenv("METRICS", "0") == "1")
+
+
+class Instrumentation:
+    """Registers the request hooks, /metrics and ?__profile=1 on a Flask app (only what is enabled)."""
+
+    def __init__(self, app, metrics=METRICS, profiling=None, token=None):
+        self.metrics = metrics
+        self.profiling = os.getenv("PROFILE_REQUESTS", "0") == "1" if profiling is None else profiling
+        self.token = os.getenv("METRICS_TOKEN") if token is None else token
+        if metrics.enabled:
+            app.before_request(self._start)
+            app.after_request(self._finish)
+            app.add_url_rule("/metrics", "metrics", self.serve_metrics)
+        if self.profiling:
+            app.before_request(self._start_profile)
+            app.after_request(self._finish_profile)
+
+    def authorized(self):
+        if session.get("authed"):
+            return True
+        return bool(self.token) and request.headers.get("Authorization") == f"Bearer {self.token}"
+
+    def serve_metrics(self):
+        if not self.authorized():
+            return Response("not authorized\n", status=401, mimetype="text/plain")
+        return Response(self.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    # ---------- request timing ----------
+    def _start(self):
+        g.request_t0 = time.perf_counter()
+
+    def _finish(self, resp):
+        t0 = g.get("request_t0")
+        if t0 is None:
+            return resp
+        dt = time.perf_counter() - t0
+        endpoint = request.endpoint or "unmatched"
+        m = self.metrics
+        m.inc("app_requests_total", endpoint=endpoint, method=request.method, status=resp.status_code)
+        m.observe("app_request_seconds", dt, endpoint=endpoint)
+        if not resp.is_streamed:
+            m.inc("app_response_bytes_total", resp.content_length or 0, endpoint=endpoint,
+                  encoding=resp.content_encoding or "identity")
+        timings = [f"{name};dur={t * 1000:.2f}" for name, t in g.get("stage_times", ())]
+        resp.headers["Server-Timing"] = ", ".join(timings + [f"app;dur={dt * 1000:.2f}"])
+        return resp
+
+    # ---------- sampling profile ----------
+    def _start_profile(self):
+        if request.args.get("__profile") == "1" and session.get("authed"):
+            g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+    def _finish_profile(self, resp):
+        prof = g.pop("profiler", None)
+        if prof is None:
+            return resp
+        if resp.is_streamed:
+            # a streamed body only runs after this hook: run it here, under the profiler
+            for _ in resp.iter_encoded():
+                pass
+            resp.close()
+        prof.stop()
+        out = Response(prof.folded(), mimetype="text/plain")
+        out.headers["Content-Disposition"] = f'inline; filename="{request.endpoint or "request"}.folded"'
+        out.headers["X-Profile-Samples"] = str(prof.samples)
+        out.headers["X-Profile-Seconds"] = f"{prof.seconds:.4f}"
+        out.headers["Cache-Control"] = "no-store"
+        return out
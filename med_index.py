@@ -0,0 +1,187 @@
+# med_index.py
+"""
+Medication vocabulary index over a CompactCohort.
+
+Each distinct medication string is normalized once:
+  ingredients  generic names found in it (brands mapped, e.g. DUPIXENT -> dupilumab)
+  classes      drug classes of those ingredients (biologic, ICS, LABA, ICS/LABA, ...)
+  key          "+"-joined ingredients, or the name without doses, units and forms
+A trigram index over the lower-cased names and keys answers substring queries without
+scanning the vocabulary. Occurrences are grouped by code, so going from matched codes
+to (patient, date) records is a few array slices.
+"""
+import re
+
+import numpy as np
+
+# generic -> class
+INGREDIENT_CLASSES = {
+    # biologics used in severe asthma
+    "omalizumab": "biologic", "mepolizumab": "biologic", "reslizumab": "biologic",
+    "benralizumab": "biologic", "dupilumab": "biologic", "tezepelumab": "biologic",
+    # inhaled corticosteroids
+    "fluticasone": "ICS", "budesonide": "ICS", "beclomethasone": "ICS", "mometasone": "ICS",
+    "ciclesonide": "ICS", "flunisolide": "ICS", "triamcinolone": "ICS",
+    # bronchodilators / controllers
+    "salmeterol": "LABA", "formoterol": "LABA", "vilanterol": "LABA", "arformoterol": "LABA",
+    "albuterol": "SABA", "levalbuterol": "SABA", "terbutaline": "SABA",
+    "tiotropium": "LAMA", "umeclidinium": "LAMA", "glycopyrrolate": "LAMA", "ipratropium": "SAMA",
+    "montelukast": "LTRA", "zafirlukast": "LTRA", "theophylline": "methylxanthine",
+    # systemic corticosteroids
+    "prednisone": "OCS", "prednisolone": "OCS", "methylprednisolone": "OCS", "dexamethasone": "OCS",
+}
+
+# brand -> generics
+BRANDS = {
+    "xolair": ["omalizumab"], "nucala": ["mepolizumab"], "cinqair": ["reslizumab"],
+    "fasenra": ["benralizumab"], "dupixent": ["dupilumab"], "tezspire": ["tezepelumab"],
+    "advair": ["fluticasone", "salmeterol"], "wixela": ["fluticasone", "salmeterol"],
+    "airduo": ["fluticasone", "salmeterol"], "symbicort": ["budesonide", "formoterol"],
+    "breyna": ["budesonide", "formoterol"], "dulera": ["mometasone", "formoterol"],
+    "breo": ["fluticasone", "vilanterol"], "trelegy": ["fluticasone", "umeclidinium", "vilanterol"],
+    "flovent": ["fluticasone"], "arnuity": ["fluticasone"], "pulmicort": ["budesonide"],
+    "qvar": ["beclomethasone"], "asmanex": ["mometasone"], "alvesco": ["ciclesonide"],
+    "serevent": ["salmeterol"], "spiriva": ["tiotropium"], "incruse": ["umeclidinium"],
+    "proair": ["albuterol"], "ventolin": ["albuterol"], "proventil": ["albuterol"],
+    "xopenex": ["levalbuterol"], "singulair": ["montelukast"], "duoneb": ["ipratropium", "albuterol"],
+    "combivent": ["ipratropium", "albuterol"], "medrol": ["methylprednisolone"],
+}
+
+# doses, units, routes and dosage forms: not part of a medication's identity
+STOPWORDS = set("""
+mg mcg g gram grams ml l meq unit units iu hr hrs h pf
+tablet tablets tab tabs capsule capsules cap solution soln susp suspension syrup oral iv im sc
+injection inj syringe vial bolus flush ivpb piggyback intravenous nebulization nebulizer neb
+inhaler inhalation aerosol hfa actuation spray nasal powder diskus respimat ellipta dose pack
+delayed extended release er xr sr in for of and with the a
+""".split())
+
+CLASS_NAMES = sorted(set(INGREDIENT_CLASSES.values()) | {"ICS/LABA"})
+
+
+def normalize(name):
+    """{"key", "ingredients", "classes"} for one medication string."""
+    words = re.findall(r"[a-z]+", str(name).lower())
+    ingredients = set()
+    for w in words:
+        if w in INGREDIENT_CLASSES:
+            ingredients.add(w)
+        elif w in BRANDS:
+            ingredients.update(BRANDS[w])
+    classes = {INGREDIENT_CLASSES[i] for i in ingredients}
+    if "ICS" in classes and "LABA" in classes:
+        classes.add("ICS/LABA")
+    if ingredients:
+        key = "+".join(sorted(ingredients))
+    else:
+        key = " ".join(w for w in words if w not in STOPWORDS and len(w) > 1)
+    return {"key": key, "ingredients": sorted(ingredients), "classes": sorted(classes)}
+
+
+def _trigrams(s):
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class MedIndex:
+    """Search a CompactCohort's medication vocabulary and map hits to patients and dates."""
+
+    def __init__(self, cohort):
+        self.cohort = cohort
+        self.vocab = cohort.vocab
+        self.info = [normalize(m) for m in self.vocab]
+        self._code = {m: c for c, m in enumerate(self.vocab)}
+        # what substring queries are matched against: the name and its normalized key
+        self._text = [f"{m.lower()}\n{i['key']}" for m, i in zip(self.vocab, self.info)]
+        grams = {}
+        for code, t in enumerate(self._text):
+            for g in _trigrams(t):
+                grams.setdefault(g, []).append(code)
+        self._grams = {g: np.asarray(c, dtype=np.int32) for g, c in grams.items()}
+        self._by_ingredient, self._by_class = {}, {}
+        for code, i in enumerate(self.info):
+            for ing in i["ingredients"]:
+                self._by_ingredient.setdefault(ing, []).append(code)
+            for cls in i["classes"]:
+                self._by_class.setdefault(cls.lower(), []).append(code)
+
+        # occurrences grouped by code: record index of every (record, med) pair
+        a = cohort.arrays
+        codes = np.asarray(a["meds_codes"])
+        off = np.asarray(a["meds_off"])
+        rec = np.repeat(np.arange(len(off) - 1, dtype=np.int64), np.diff(off))
+        order = np.argsort(codes, kind="stable")
+        self._occ_rec = rec[order]
+        self._occ_off = np.searchsorted(codes[order], np.arange(len(self.vocab) + 1))
+        self._rec_pid = np.asarray(a["meds_pid"])
+        self._rec_date = np.asarray(a["meds_date"])
+
+    def tags(self, name):
+        """Ingredients + classes of a vocabulary string (empty if none are recognised)."""
+        code = self._code.get(name)
+        i = self.info[code] if code is not None else normalize(name)
+        return i["ingredients"] + i["classes"]
+
+    def match(self, query):
+        """Vocabulary codes for a query: a drug class, a brand/generic name, or a substring."""
+        q = str(query).strip().lower()
+        if not q:
+            return np.zeros(0, dtype=np.int32)
+        if q in self._by_class:
+            return np.asarray(self._by_class[q], dtype=np.int32)
+        norm = normalize(q)
+        hits = set()
+        if norm["ingredients"]:
+            # every ingredient of the query (e.g. both parts of "advair") must be present
+            hits = set.intersection(*(set(self._by_ingredient.get(i, ())) for i in norm["ingredients"]))
+        for s in {q, norm["key"]} - {""}:
+            hits.update(self._substring(s))
+        return np.asarray(sorted(hits), dtype=np.int32)
+
+    def _substring(self, s):
+        if len(s) < 3:
+            return [c for c, t in enumerate(self._text) if s in t]
+        # candidates must contain every trigram of s; start from the rarest
+        cands = None
+        for g in sorted(_trigrams(s), key=lambda g: len(self._grams.get(g, ()))):
+            post = self._grams.get(g)
+            if post is None:
+                return []
+            cands = post if cands is None else np.intersect1d(cands, post, assume_unique=True)
+            if not len(cands):
+                return []
+        return [int(c) for c in cands if s in self._text[c]]
+
+    def records(self, codes):
+        """Sorted indexes of med records (patient + date rows) containing any of `codes`."""
+        if not len(codes):
+            return np.zeros(0, dtype=np.int64)
+        parts = [self._occ_rec[self._occ_off[c]:self._occ_off[c + 1]] for c in codes]
+        return np.unique(np.concatenate(parts))
+
+    def occurrences(self, query):
+        """(patient index, date) arrays of the med records matching `query`, in cohort order."""
+        recs = self.records(self.match(query))
+        return self._rec_pid[recs], self._rec_date[recs]
+
+    def search(self, query, limit=100):
+        """Which patients (and on which dates) had a medication matching `query`."""
+        codes = self.match(query)
+        recs = self.records(codes)
+        pidx = self._rec_pid[recs]
+        dates = self._rec_date[recs]
+        starts = np.flatnonzero(np.r_[True, pidx[1:] != pidx[:-1]]) if len(recs) else np.zeros(0, dtype=np.int64)
+        bounds = np.r_[starts, len(recs)].tolist()
+        pids = self.cohort.pids
+        patients = [
+            {"pid": pids[int(pidx[a])],
+             "dates": [None if np.isnan(d) else (int(d) if d == int(d) else d) for d in dates[a:b].tolist()]}
+            for a, b in zip(bounds[:limit], bounds[1:limit + 1])
+        ]
+        return {
+            "query": query,
+            "matches": [{"name": self.vocab[c], **self.info[c]} for c in codes.tolist()[:limit]],
+            "n_matches": len(codes),
+            "n_records": len(recs),
+            "n_patients": len(starts),
+            "patients": patients,
+        }
@@ -0,0 +1,204 @@
+# note_search.py
+"""
+Full-text search over note text (SQLite FTS5, porter stemming).
+
+The index is one database file per version of the notes, named by a hash of the note
+text, so it is built once and then shared by every worker and by later restarts. A row's
+rowid is the note's position in the CompactCohort, which maps it back to (pid, note).
+Building runs in a background thread; a `.building` file next to the target tells other
+processes that a build is under way (a build that stops touching it is taken as dead).
+"""
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+FTS_VERSION = 1
+BATCH = 5000
+STALE_BUILD = 120  # seconds without progress before another process takes over a build
+RETRY_BUILD = 60    # seconds before a failed build is retried; doubles per failure, up to an hour
+HIT, END = "\x02", "\x03"
+RANK_MAX = 20000    # bm25 ranking scores every match; above this, results come in cohort order
+COUNT_MAX = 100000  # totals are counted up to here
+
+
+def notes_key(cohort):
+    """
+    Hash of the note texts (and their boundaries) the index is built from. Uses the hash
+    compact_cohort.encode stored in the manifest, so no request thread reads the whole blob.
+    """
+    h = hashlib.blake2b(f"fts{FTS_VERSION}".encode("utf-8"), digest_size=12)
+    notes_hash = cohort.manifest.get("notes_hash")
+    if notes_hash:
+        h.update(notes_hash.encode("utf-8"))
+    else:
+        for name in ("notes_text_off", "notes_text"):
+            h.update(memoryview(np.ascontiguousarray(cohort.arrays[name])).cast("B"))
+    return h.hexdigest()
+
+
+def fts_query(q):
+    """User query -> FTS5 expression: "quoted phrases" stay phrases, other words are ANDed, word* is a prefix."""
+    parts = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', str(q)):
+        words = re.findall(r"\w+", (phrase or word).lower())
+        if not words:
+            continue
+        if phrase:
+            parts.append('"' + " ".join(words) + '"')
+        else:
+            parts += [f'"{w}"' for w in words]
+            if word.endswith("*"):
+                parts[-1] += "*"
+    return " ".join(parts)
+
+
+def highlight_prefix(word):
+    """Rough stem of a query word for highlighting hits in the page (the index itself uses porter)."""
+    for suffix in ("ations", "ation", "ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def snippet_html(s):
+    return html.escape(s).replace(HIT, "<mark>").replace(END, "</mark>")
+
+
+class NoteSearch:
+    """FTS5 index of one CompactCohort's notes."""
+
+    def __init__(self, index_dir, cohort):
+        self.cohort = cohort
+        self.dir = Path(index_dir)
+        self.path = self.dir / f"notes-{notes_key(cohort)}.fts.sqlite3"
+        self._lock_path = self.path.with_name(self.path.name + ".building")
+        self._local = threading.local()
+        self._build_lock = threading.Lock()
+        self._ready = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self.error = None
+
+    # ---------- build ----------
+    @property
+    def ready(self):
+        if not self._ready:
+            self._ready = self.path.exists()
+        return self._ready
+
+    def ensure_built(self, background=True):
+        """
+        Start a build unless the index exists, another thread/process is building it, or
+        the last build failed less than the back-off ago.
+        """
+        if self.ready or self._build_lock.locked() or time.monotonic() < self._retry_at:
+            return
+        try:
+            if time.time() - self._lock_path.stat().st_mtime < STALE_BUILD:
+                return
+            self._lock_path.unlink()
+        except OSError:  # no marker (or no directory: reported below)
+            pass
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            os.close(os.open(self._lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return
+        except OSError as e:
+            self._failed(f"Search index not built in {self.dir}: {e}")
+            return
+        if background:
+            threading.Thread(target=self._build, name="note-search-build", daemon=True).start()
+        else:
+            self._build()
+
+    def _build(self):
+        with self._build_lock:
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+            try:
+                tmp.unlink(missing_ok=True)
+                conn = sqlite3.connect(tmp)
+                conn.execute("PRAGMA journal_mode=OFF")
+                conn.execute("PRAGMA synchronous=OFF")
+                conn.execute("CREATE VIRTUAL TABLE notes USING fts5(text, tokenize='porter unicode61')")
+                blob = self.cohort.arrays["notes_text"]
+                off = np.asarray(self.cohort.arrays["notes_text_off"]).tolist()
+                for lo in range(0, len(off) - 1, BATCH):
+                    hi = min(lo + BATCH, len(off) - 1)
+                    buf = np.asarray(blob[off[lo]:off[hi]]).tobytes()
+                    rows = [(r, buf[off[r] - off[lo]:off[r + 1] - off[lo]].decode("utf-8")) for r in range(lo, hi)]
+                    with conn:
+                        conn.executemany("INSERT INTO notes (rowid, text) VALUES (?, ?)", rows)
+                    os.utime(self._lock_path)
+                with conn:
+                    conn.execute("INSERT INTO notes (notes) VALUES ('optimize')")
+                conn.close()
+                os.replace(tmp, self.path)
+                self.error, self._failures = None, 0
+                # indexes of older note versions are dead weight
+                for old in self.dir.glob("notes-*.fts.sqlite3"):
+                    if old != self.path:
+                        old.unlink(missing_ok=True)
+            except Exception as e:
+                tmp.unlink(missing_ok=True)
+                self._failed(f"Search index build failed: {e}")
+            finally:
+                self._lock_path.unlink(missing_ok=True)
+
+    def after_fork(self):
+        """
+        Reset the per-process state in a forked child (gunicorn post_fork): a build thread
+        of the parent does not exist here, and the build lock it held would stay locked.
+        """
+        self._local = threading.local()
+        self._build_lock = threading.Lock()
+
+    def _failed(self, error):
+        self.error = error
+        self._failures += 1
+        self._retry_at = time.monotonic() + min(RETRY_BUILD * 2 ** (self._failures - 1), 3600)
+
+    # ---------- search ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(f"{self.path.as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        return conn
+
+    def search(self, query, offset=0, limit=50, tokens=16):
+        """
+        Notes matching `query`, best first (cohort order for very common terms), with an
+        HTML snippet (<mark> around hits).
+        """
+        expr = fts_query(query)
+        if not expr:
+            raise ValueError("empty search")
+        conn = self._conn()
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM (SELECT 1 FROM notes WHERE notes MATCH ? LIMIT ?)",
+                                 (expr, COUNT_MAX + 1)).fetchone()[0]
+            ranked = total <= RANK_MAX
+            rows = conn.execute(
+                "SELECT rowid, snippet(notes, 0, ?, ?, '…', ?) FROM notes WHERE notes MATCH ? "
+                f"ORDER BY {'rank' if ranked else 'rowid'} LIMIT ? OFFSET ?",
+                (HIT, END, tokens, expr, limit, offset)).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"bad search: {e}") from None
+        c = self.cohort
+        note_pid = c.arrays["notes_pid"]
+        note_date = c.arrays["notes_date"]
+        hits = []
+        for r, snip in rows:
+            p = int(note_pid[r])
+            hits.append({"pid": c.pids[p], "note": r - int(c.note_off[p]), "date": float(note_date[r]),
+                         "snippet": snippet_html(snip)})
+        terms = sorted({highlight_prefix(w) for w in re.findall(r"\w+", str(query).lower())})
+        return {"query": query, "terms": terms, "total": min(total, COUNT_MAX), "more": total > COUNT_MAX,
+                "ranked": ranked, "offset": offset, "limit": limit, "hits": hits}
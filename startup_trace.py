@@ -0,0 +1,99 @@
+# startup_trace.py
+"""
+Where process startup goes: wall time and RSS growth per phase.
+
+app.py calls STARTUP.mark("<phase>") at the end of each phase of its import. Later
+one-off phases, such as the first data load, are timed with STARTUP.phase(name). The
+trace is served at /healthz/startup and printed to stderr by the server entrypoints
+(app.main, gunicorn's when_ready; STARTUP_TRACE=0 silences it), not on import.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def rss_mb():
+    """Current RSS in MB (Linux /proc), else the peak RSS, else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2**20 if sys.platform == "darwin" else 2**10)
+    except ImportError:
+        return None
+
+
+def process_age():
+    """Seconds since this process started (Linux), or None."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTrace:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.before = process_age()  # interpreter start + imports before the trace began
+        self.t0 = self._last = time.perf_counter()
+        self.rss0 = self._last_rss = rss_mb()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    def _record(self, name, start, seconds, rss_before, rss_after):
+        delta = None if rss_before is None or rss_after is None else round(rss_after - rss_before, 1)
+        with self._lock:
+            self.phases.append({
+                "name": name,
+                "start": round(start - self.t0, 4),
+                "seconds": round(seconds, 4),
+                "rss_mb": None if rss_after is None else round(rss_after, 1),
+                "rss_delta_mb": delta,
+            })
+
+    def mark(self, name):
+        """End the current import phase (it began at the previous mark)."""
+        now, rss = time.perf_counter(), rss_mb()
+        self._record(name, self._last, now - self._last, self._last_rss, rss)
+        self._last, self._last_rss = now, rss
+
+    @contextmanager
+    def phase(self, name):
+        t, rss = time.perf_counter(), rss_mb()
+        try:
+            yield
+        finally:
+            self._record(name, t, time.perf_counter() - t, rss, rss_mb())
+
+    def report(self):
+        with self._lock:
+            phases = list(self.phases)
+        return {
+            "pid": self.pid,
+            "before_trace_seconds": None if self.before is None else round(self.before, 4),
+            "import_seconds": round(self._last - self.t0, 4),
+            "rss_mb": None if self._last_rss is None else round(self._last_rss, 1),
+            "phases": phases,
+        }
+
+    def print(self, file=None):
+        r = self.report()
+        lines = [f"startup (pid {r['pid']}): import {r['import_seconds'] * 1000:.0f} ms, RSS {r['rss_mb']} MB"
+                 + ("" if r["before_trace_seconds"] is None else f", {r['before_trace_seconds'] * 1000:.0f} ms before")]
+        for p in r["phases"]:
+            lines.append(f"  {p['name']:<24} {p['seconds'] * 1000:8.1f} ms  {p['rss_delta_mb']:+7.1f} MB"
+                         if p["rss_delta_mb"] is not None else f"  {p['name']:<24} {p['seconds'] * 1000:8.1f} ms")
+        print("\n".join(lines), file=file or sys.stderr)
+
+
+STARTUP = StartupTrace()
@@ -0,0 +1,957 @@
+// --------- Static config (patient data is fetched from the API) ----------
+const CONFIG = JSON.parse(document.getElementById("app-config").textContent);
+const API_ROOT = CONFIG.api_root;
+const LAB_FIELDS = CONFIG.lab_fields;
+const SYM_GROUPS = CONFIG.sym_groups;
+const SYM_ORDER = CONFIG.sym_order;
+const REF_RANGES = CONFIG.ref_ranges;
+const PAGE_SIZE = 200;
+
+let PATIENT_IDS = [];
+let MEDS_ERR = null;
+const PATIENT_CACHE_SIZE = 64, NOTE_CACHE_SIZE = 256;
+let currentPatient = "";
+let pos = 0;
+let friendlyMode = false;
+
+/* ---------- Client caches ---------- */
+function lruCache(max){
+  // Map keeps insertion order: re-insert on use, evict from the front
+  const map = new Map();
+  return {
+    get(key){
+      const v = map.get(key);
+      if (v !== undefined){ map.delete(key); map.set(key, v); }
+      return v;
+    },
+    set(key, v){
+      map.delete(key); map.set(key, v);
+      if (map.size > max) map.delete(map.keys().next().value);
+      return v;
+    },
+    delete(key){ map.delete(key); },
+    keys(){ return [...map.keys()]; },
+  };
+}
+const PATIENT_CACHE = lruCache(PATIENT_CACHE_SIZE);  // pid -> {notes:[{date}], min_date, max_date, labs, meds, demo, bio}
+const NOTE_CACHE = lruCache(NOTE_CACHE_SIZE);        // "pid|i" -> {date, text?, pretty?}, each view fetched when first needed
+
+// One request per resource in flight, shared by the view and the prefetcher; cancelled
+// with its AbortController once nothing on or next to the screen needs it.
+// Keys: "p|<pid>" (patient detail), "text|<pid>|<i>" (raw note), "pretty|<pid>|<i>" (friendly view).
+const REQUESTS = new Map();  // key -> {ctrl, promise, text, onChunk}
+function sharedRequest(key, start){
+  let r = REQUESTS.get(key);
+  if (!r){
+    r = {ctrl: new AbortController(), text: "", onChunk: null};
+    r.promise = start(r).finally(()=>{ if (REQUESTS.get(key) === r) REQUESTS.delete(key); });
+    REQUESTS.set(key, r);
+  }
+  return r;
+}
+function cancelRequests(keep){
+  for (const [key, r] of REQUESTS){
+    if (!keep.has(key)){ r.ctrl.abort(); REQUESTS.delete(key); }
+  }
+}
+
+/* ---------- API ---------- */
+async function checkResponse(res, url){
+  if (res.status === 401){ window.location.reload(); throw new Error("Not signed in"); }
+  if (!res.ok){
+    let msg = `${res.status} ${res.statusText} for ${url}`;
+    try { const body = await res.json(); if (body && body.error) msg = body.error; } catch(e){}
+    const err = new Error(msg); err.status = res.status;
+    throw err;
+  }
+  return res;
+}
+async function fetchJSON(url, opts={}){
+  const res = await fetch(url, {credentials:"same-origin", ...opts, headers:{"Accept":"application/json", ...(opts.headers||{})}});
+  return (await checkResponse(res, url)).json();
+}
+function fetchPatientPage(offset){
+  return fetchJSON(`${API_ROOT}/patients?offset=${offset}&limit=${PAGE_SIZE}`);
+}
+function loadPatient(pid){
+  const P = PATIENT_CACHE.get(pid);
+  if (P) return Promise.resolve(P);
+  return sharedRequest("p|" + pid, r=>fetchJSON(`${API_ROOT}/patients/${encodeURIComponent(pid)}`, {signal: r.ctrl.signal})
+    .then(P=>PATIENT_CACHE.set(pid, P))).promise;
+}
+function noteURL(pid, i){ return `${API_ROOT}/patients/${encodeURIComponent(pid)}/notes/${i}`; }
+function loadNote(pid, i){
+  // raw text (+ date), only fetched for the raw view
+  const key = pid + "|" + i, cached = NOTE_CACHE.get(key);
+  if (cached && cached.text != null) return Promise.resolve(cached);
+  return sharedRequest("text|" + key, r=>fetchJSON(noteURL(pid, i), {signal: r.ctrl.signal})
+    .then(note=>NOTE_CACHE.set(key, {...NOTE_CACHE.get(key), ...note}))).promise;
+}
+function loadPretty(pid, i, onChunk){
+  // Friendly view, streamed: onChunk(piece) gets the text as it arrives (first everything
+  // received so far when joining a stream already under way); resolves to the cached note.
+  const key = pid + "|" + i, cached = NOTE_CACHE.get(key);
+  if (cached && cached.pretty != null) return Promise.resolve(cached);
+  const r = sharedRequest("pretty|" + key, r=>readPretty(pid, i, r));
+  if (onChunk){
+    r.onChunk = onChunk;
+    if (r.text) onChunk(r.text);
+  }
+  return r.promise;
+}
+async function readPretty(pid, i, r){
+  const url = noteURL(pid, i) + "/pretty";
+  const res = await checkResponse(await fetch(url, {credentials:"same-origin", signal: r.ctrl.signal}), url);
+  const date = parseFloat(res.headers.get("X-Note-Date"));
+  if (res.body && res.body.getReader){
+    const reader = res.body.getReader(), dec = new TextDecoder();
+    for (;;){
+      const {done, value} = await reader.read();
+      const piece = done ? dec.decode() : dec.decode(value, {stream:true});
+      if (piece){ r.text += piece; if (r.onChunk) r.onChunk(piece); }
+      if (done) break;
+    }
+  } else {
+    r.text = await res.text();
+    if (r.onChunk) r.onChunk(r.text);
+  }
+  const key = pid + "|" + i;
+  return NOTE_CACHE.set(key, {...NOTE_CACHE.get(key), date, pretty: r.text});
+}
+function currentDetail(){ return PATIENT_CACHE.get(currentPatient) || {notes:[], min_date:0, max_date:0, labs:[], meds:[], demo:{}, bio:[]}; }
+
+function lockBioRadioForPatient(){
+  const yes = document.getElementById("bioUseYes");
+  const no  = document.getElementById("bioUseNo");
+  const bio = currentDetail().bio;
+  const hasBio = Array.isArray(bio) && bio.length > 0;
+
+  if (hasBio){
+    yes.checked = true;  no.checked = false;
+    yes.disabled = true; no.disabled = true;
+    document.getElementById("bio-yes-extra").style.display = "flex";
+    document.getElementById("bio-no-extra").style.display  = "none";
+  } else {
+    yes.checked = false; no.checked = true;
+    yes.disabled = true; no.disabled = true;
+    document.getElementById("bio-yes-extra").style.display = "none";
+    document.getElementById("bio-no-extra").style.display  = "flex";
+  }
+}
+
+/* ---------- Annotator UI ---------- */
+function getAnnotator(){ return localStorage.getItem("annotator_name") || ""; }
+function setAnnotator(name){ localStorage.setItem("annotator_name", name); }
+function renderAnnotatorUI(){
+  const host = document.getElementById("annotator-ui");
+  host.innerHTML = "";
+  const name = getAnnotator();
+  if (name){
+    const badge = document.createElement("div");
+    badge.className = "badge";
+    badge.textContent = "Annotator: " + name;
+    const changeBtn = document.createElement("button");
+    changeBtn.className = "ghost";
+    changeBtn.textContent = "Change";
+    changeBtn.onclick = () => {
+      const v = prompt("Set annotator name:", name);
+      if (v === null) return;
+      const trimmed = (v || "").trim();
+      if (!trimmed){ alert("Annotator cannot be empty."); return; }
+      setAnnotator(trimmed);
+      renderAnnotatorUI();
+      refreshAnnotations();
+    };
+    host.appendChild(badge);
+    host.appendChild(changeBtn);
+    return;
+  }
+  const inp = document.createElement("input");
+  inp.id = "annotator-input";
+  inp.placeholder = "Your name (saved)";
+  const btn = document.createElement("button");
+  btn.className = "primary";
+  btn.textContent = "Set";
+  btn.onclick = () => {
+    const v = (document.getElementById("annotator-input").value || "").trim();
+    if (!v){ alert("Please enter annotator name."); return; }
+    setAnnotator(v);
+    renderAnnotatorUI();
+    refreshAnnotations();
+  };
+  host.appendChild(inp);
+  host.appendChild(btn);
+}
+
+/* ---------- Helpers ---------- */
+function el(tag, attrs={}, text=null){
+  const e=document.createElement(tag);
+  Object.entries(attrs).forEach(([k,v])=>e.setAttribute(k,v));
+  if(text!==null) e.textContent=text;
+  return e;
+}
+const titleCase = s => s.replace(/\b\w/g, c => c.toUpperCase());
+
+/* ---------- Patient nav ---------- */
+function renderPatientSelect(){
+  const sel=document.getElementById("patient-select"); sel.innerHTML="";
+  PATIENT_IDS.forEach(pid=>{ const o=el("option",{},pid); o.value=pid; if(pid===currentPatient) o.selected=true; sel.appendChild(o); });
+  sel.onchange=()=>switchPatient(sel.value);
+}
+function renderHeader(){
+  document.getElementById("patient-id").textContent=currentPatient;
+  const total=currentDetail().notes.length;
+  document.getElementById("patient-pos").textContent= total ? ` (note ${pos+1} of ${total})` : "";
+  const biolist = currentDetail().bio || [];
+  document.getElementById("bio-flag").textContent = biolist.length ? ` | Biologic use: ${biolist.length} date(s)` : "";
+}
+
+/* ---------- Text & timeline ---------- */
+async function renderText(){
+  const pid = currentPatient, i = pos;
+  const box  = document.getElementById("text-box");
+  const btn  = document.getElementById("friendly-btn");
+  btn.textContent = friendlyMode ? "🔤 Raw View" : "👁 Friendly View";
+  const mode = friendlyMode;
+  const current = ()=>pid===currentPatient && i===pos && mode===friendlyMode;
+  const cached = NOTE_CACHE.get(pid + "|" + i);
+  if (!cached || cached[mode ? "pretty" : "text"] == null) box.textContent = "Loading note…";
+  // friendly view: paragraphs are shown as they arrive; search hits are marked once it is complete
+  let streamed = false;
+  const onChunk = piece=>{
+    if (!current()) return;
+    if (!streamed){ streamed = true; renderNoteText(box, ""); box.scrollTop = 0; }
+    box.appendChild(document.createTextNode(piece));
+  };
+  let note;
+  try { note = await (mode ? loadPretty(pid, i, onChunk) : loadNote(pid, i)); }
+  catch(e){ if (current()) box.textContent = "Failed to load note: " + e.message; return; }
+  if (!current()) return;  // user navigated away (or switched view) meanwhile
+  if (note.date !== (currentDetail().notes[i] || {}).date && refreshPatient(pid)) return;
+  if (streamed && !SEARCH_TERMS.length) return;  // already on screen
+  renderNoteText(box, (mode ? note.pretty : note.text) || "");
+  if (!streamed) box.scrollTop = 0;
+  if (HIT_MARKS.length) gotoHit(1);
+}
+
+/* ---------- Note search (server-side full-text index) ---------- */
+let SEARCH_TERMS = [];  // word prefixes of the active search, highlighted in the open note
+let HIT_MARKS = [], hitIdx = -1, searchTimer = null;
+async function runSearch(){
+  const input = document.getElementById("note-search");
+  const host = document.getElementById("search-results");
+  const info = document.getElementById("search-info");
+  const q = input.value.trim();
+  if (!q){ SEARCH_TERMS = []; host.innerHTML = ""; info.textContent = ""; renderText(); return; }
+  info.textContent = "Searching…";
+  let res;
+  try { res = await fetchJSON(`${API_ROOT}/notes/search?q=${encodeURIComponent(q)}&limit=100`); }
+  catch(e){ if (q === input.value.trim()) info.textContent = e.status===503 ? "Search index is still being built; try again shortly." : e.message; return; }
+  if (q !== input.value.trim()) return;  // superseded by a newer query
+  SEARCH_TERMS = res.terms || [];
+  info.textContent = `${res.total}${res.more ? "+" : ""} note(s)` +
+    (res.total > res.hits.length ? `, ${res.ranked ? "best" : "first"} ${res.hits.length} shown` : "");
+  const frag = document.createDocumentFragment();
+  res.hits.forEach(h=>{
+    const row = el("div",{class:"search-hit"});
+    row.appendChild(el("div",{class:"small muted"}, `${h.pid} · note DATE_DIF ${h.date}`));
+    const snip = el("div");
+    snip.innerHTML = h.snippet;  // escaped on the server, <mark> around the hits
+    row.appendChild(snip);
+    row.onclick = ()=>openNote(h.pid, h.note);
+    frag.appendChild(row);
+  });
+  host.innerHTML = "";
+  host.appendChild(frag);
+  renderText();
+}
+function openNote(pid, i){
+  if (pid !== currentPatient) return switchPatient(pid, i);
+  pos = Math.min(i, Math.max(currentDetail().notes.length - 1, 0));
+  renderAllForNote();
+}
+function renderNoteText(box, txt){
+  HIT_MARKS = []; hitIdx = -1;
+  if (!SEARCH_TERMS.length){ box.textContent = txt; updateHitNav(); return; }
+  const re = new RegExp("(^|[^A-Za-z0-9_])((?:" + SEARCH_TERMS.join("|") + ")[A-Za-z0-9_]*)", "gi");
+  const frag = document.createDocumentFragment();
+  let last = 0;
+  for (const m of txt.matchAll(re)){
+    const start = m.index + m[1].length;
+    frag.appendChild(document.createTextNode(txt.slice(last, start)));
+    const mark = el("mark", {}, m[2]);
+    frag.appendChild(mark);
+    HIT_MARKS.push(mark);
+    last = start + m[2].length;
+  }
+  frag.appendChild(document.createTextNode(txt.slice(last)));
+  box.innerHTML = "";
+  box.appendChild(frag);
+  updateHitNav();
+}
+function updateHitNav(){
+  document.getElementById("hit-nav").style.display = HIT_MARKS.length ? "" : "none";
+  document.getElementById("hit-pos").textContent = HIT_MARKS.length ? `${hitIdx+1} / ${HIT_MARKS.length}` : "";
+  HIT_MARKS.forEach((m,k)=>m.classList.toggle("current", k===hitIdx));
+}
+function gotoHit(step){
+  if (!HIT_MARKS.length) return;
+  hitIdx = (hitIdx + step + HIT_MARKS.length) % HIT_MARKS.length;
+  updateHitNav();
+  const box = document.getElementById("text-box");
+  box.scrollTop = Math.max(HIT_MARKS[hitIdx].offsetTop - box.clientHeight / 2, 0);
+}
+
+// The timeline is built once per patient detail; navigating between notes only moves
+// the "current" highlight from one dot to the other.
+let TL = {detail:null, dots:[], cur:-1};
+function renderTimeline(){
+  const P = currentDetail();
+  if (TL.detail !== P) buildTimeline(P);
+  if (TL.cur === pos) return;
+  if (TL.dots[TL.cur]) TL.dots[TL.cur].classList.replace("red", "blue");
+  if (TL.dots[pos]) TL.dots[pos].classList.replace("blue", "red");
+  TL.cur = pos;
+}
+function buildTimeline(P){
+  const section = document.getElementById("timeline-section");
+  const tl = document.getElementById("timeline");
+  const notes = P.notes || [];
+  const B = P.bio || [];
+  TL = {detail:P, dots:[], cur:-1};
+
+  section.style.display="block";
+
+  if ((notes.length === 0) && B.length === 0){
+    const d=el("div",{class:"dot gray"});
+    d.style.left = "50%";
+    d.style.top  = "-6px";
+    d.title = "No timeline data";
+    tl.replaceChildren(d);
+    return;
+  }
+
+  let minD = P.min_date ?? 0, maxD = P.max_date ?? 1;
+  if (B.length){
+    const bmin = Math.min.apply(null, B);
+    const bmax = Math.max.apply(null, B);
+    if (minD===undefined || minD===null) minD=bmin;
+    if (maxD===undefined || maxD===null) maxD=bmax;
+    if (bmin < minD) minD = bmin;
+    if (bmax > maxD) maxD = bmax;
+  }
+  if (minD===maxD){ maxD = minD + 1; }
+  const span = (maxD - minD) || 1;
+
+  const frag = document.createDocumentFragment();
+  const slots = {};
+  notes.forEach((n,i)=>{
+    const pct = ((n.date - minD) / span) * 100;
+    const key = Math.round(pct*10)/10;
+    const stack = (slots[key]||0); slots[key] = stack + 1;
+
+    const d=el("div",{class:"dot blue", "data-i": i});
+    d.style.left = pct + "%";
+    d.style.top  = (-6 - stack*16) + "px";
+    d.title = "ENCDATEDIFFNO: " + n.date;
+    frag.appendChild(d);
+    TL.dots.push(d);
+
+    const lab=el("div",{class:"date-label"});
+    lab.style.left = pct + "%";
+    lab.textContent = String(n.date);
+    frag.appendChild(lab);
+  });
+
+  B.forEach((bd)=>{
+    const pct = ((bd - minD) / span) * 100;
+    const key = Math.round(pct*10)/10;
+    const stack = (slots[key]||0); slots[key] = stack + 1;
+
+    const m=el("div",{class:"dot bio", "data-bio": bd});
+    m.style.left = pct + "%";
+    m.style.top  = (-6 - stack*16) + "px";
+    m.title = "Biologic use date: " + bd;
+    frag.appendChild(m);
+  });
+  tl.replaceChildren(frag);
+}
+function onTimelineClick(e){
+  const d = e.target.closest(".dot");
+  if (!d) return;
+  if (d.dataset.i !== undefined){ pos = Number(d.dataset.i); renderAllForNote(); return; }
+  if (d.dataset.bio === undefined) return;
+  // a biologic marker jumps to the note closest to it
+  const bd = Number(d.dataset.bio);
+  let bestI = 0, bestDist = Infinity;
+  (currentDetail().notes||[]).forEach((n,i)=>{
+    const dist = Math.abs((n.date ?? bd) - bd);
+    if (dist < bestDist){ bestDist = dist; bestI = i; }
+  });
+  pos = bestI;
+  renderAllForNote();
+}
+
+/* ---------- Labs, demo, symptoms ---------- */
+function valText(v){
+  if (v===null || typeof v==="undefined" || v==="") return "—";
+  if (typeof v === "number") return (Math.abs(v - Math.trunc(v)) < 1e-9) ? String(Math.trunc(v)) : String(Number(v.toFixed(3)));
+  return String(v);
+}
+function sexText(v){
+  if (v===null || v===undefined || v==="") return "—";
+  const s=String(v).trim().toLowerCase();
+  if (s==="0" || s==="0.0") return "Female";
+  if (s==="1" || s==="1.0") return "Male";
+  return s.toUpperCase() in {"F":1,"M":1} ? (s.toUpperCase()==="F"?"Female":"Male") : s;
+}
+function renderDemographics(){
+  const d=currentDetail().demo||{};
+  const host=document.getElementById("demo-content"); host.innerHTML="";
+  const tiles=[
+    {title:"Age", value:d.AGE,  bg:"var(--tile1)", bd:"var(--tile1b)"},
+    {title:"Sex", value:sexText(d.SEX),  bg:"var(--tile2)", bd:"var(--tile2b)"},
+    {title:"BMI", value:d.BMI,  bg:"var(--tile3)", bd:"var(--tile3b)"},
+  ];
+  tiles.forEach(t=>{
+    const div=document.createElement("div");
+    div.className="tile";
+    div.style.background=t.bg;
+    div.style.border=`1px solid ${t.bd}`;
+    const h4=document.createElement("h4"); h4.textContent=t.title;
+    const v=document.createElement("div"); v.className="value";
+    v.textContent=(t.value==null||t.value==="")?"—":String(t.value);
+    div.appendChild(h4); div.appendChild(v); host.appendChild(div);
+  });
+}
+// Closest lab + med record for the current note. The server sends labs/meds sorted by date
+// with per-note indexes (note_lab / note_med); the lookup is done once per note and shared.
+let NEAREST = {key:null, detail:null, lab:null, med:null};
+function nearestRecords(){
+  const P = currentDetail(), key = currentPatient + "|" + pos;
+  if (NEAREST.key !== key || NEAREST.detail !== P){
+    const li = (P.note_lab||[])[pos], mi = (P.note_med||[])[pos];
+    NEAREST = {key, detail:P, lab: li==null ? null : P.labs[li], med: mi==null ? null : P.meds[mi]};
+  }
+  return NEAREST;
+}
+function renderLabsForCurrentNote(){
+  const best=nearestRecords().lab;
+  const host=document.getElementById("lab-content");
+  if(!best){ host.innerHTML='<div class="small muted">No lab/spirometry record for this patient.</div>'; return; }
+
+  const demo = currentDetail().demo || {};
+  const age = typeof demo.AGE === "number" ? demo.AGE : (parseFloat(demo.AGE) || null);
+  const isChild = (age != null) && (age < 18);
+
+  let html = '<table class="labs-table"><thead><tr>';
+  html += '<th>Lab Result</th><th>Your Value</th>';
+  if (!isChild){
+    html += '<th>Typical Reference Range (Adults)</th>';
+  }
+  html += '</tr></thead><tbody>';
+
+  html += '<tr><th>Closest DATE_DIF</th><td>' + valText(best.date) + '</td>' + (isChild ? '' : '<td>—</td>') + '</tr>';
+
+  LAB_FIELDS.forEach(f=>{
+    const v = best.hasOwnProperty(f)? best[f] : null;
+    const rawRef = (REF_RANGES && REF_RANGES[f]) ? REF_RANGES[f] : "—";
+    const ref = (()=>{
+      const low = String(rawRef).toLowerCase();
+      if (low.includes("varies") || low.includes("no single")) return "—";
+      const tokens = String(rawRef).match(/\d+(?:\.\d+)?%?/g) || [];
+      if (tokens.length === 0) return "—";
+      if (tokens.length === 1) return tokens[0];
+      return tokens.slice(0,2).join(" - ");
+    })();
+    html += '<tr><th>' + f + '</th><td>' + valText(v) + '</td>' + (isChild ? '' : '<td>' + ref + '</td>') + '</tr>';
+  });
+  html += "</tbody></table>";
+  host.innerHTML = html;
+}
+
+function iconHTML(v){
+  if (v===1 || v==="1") return '<span class="icon good">✓</span>';
+  if (v===0 || v==="0") return '<span class="icon bad">✕</span>';
+  return '<span class="icon unk" style="visibility:hidden">·</span>';
+}
+
+function renderSymptoms(){
+  const best=nearestRecords().lab;
+  const host=document.getElementById("sym-content"); host.innerHTML="";
+  if(!best){ host.innerHTML='<div class="small muted">No symptom row found for this date.</div>'; return; }
+
+  const wrap=el("div",{class:"sym-grid"});
+  wrap.appendChild(el("div",{class:"sym-head"},"Previ."));
+  wrap.appendChild(el("div",{class:"sym-head"},"Curr."));
+  wrap.appendChild(el("div",{class:"sym-head"},"Symptom"));
+
+
+  SYM_ORDER.forEach(base=>{
+    const group=SYM_GROUPS[base]; if(!group) return;
+    const rawLabel=base.replaceAll("_"," ").replace("general asthma symptoms worsening current","general asthma symptoms worsening");
+    const label=titleCase(rawLabel);
+
+    const pv=(group.previous && (group.previous in best))? best[group.previous] : null;
+    const cv=(group.current  && (group.current  in best))? best[group.current ] : null;
+
+    const pcell=el("div"); pcell.innerHTML = iconHTML(pv);
+    const ccell=el("div"); ccell.innerHTML = iconHTML(cv);
+
+    wrap.appendChild(pcell);
+    wrap.appendChild(ccell);
+    wrap.appendChild(el("div",{},label));
+  });
+  host.appendChild(wrap);
+}
+
+// ---------- NEW: Medications ----------
+function renderMedications(){
+  const errEl = document.getElementById("med-err");
+  const dateEl = document.getElementById("med-date");
+  const box = document.getElementById("med-box");
+  const filterEl = document.getElementById("med-filter");
+
+  if (MEDS_ERR){ errEl.style.display="block"; errEl.textContent = MEDS_ERR; }
+  else { errEl.style.display="none"; }
+
+  const pid = currentPatient;
+  const P = PATIENT_CACHE.get(pid);
+  if (!P || (P.notes||[]).length===0){ box.innerHTML = '<div class="small muted">No notes for this patient.</div>'; dateEl.textContent = ""; return; }
+
+  const targetDate = P.notes[pos].date;
+  const best = nearestRecords().med;
+
+  if (!best || !Array.isArray(best.meds) || best.meds.length===0){
+    dateEl.textContent = `Closest medication row to note DATE_DIF ${targetDate}: none`;
+    box.innerHTML = '<div class="small muted">No medications on/near this date.</div>';
+    return;
+  }
+
+  dateEl.textContent = `Closest medication DATE_DIF: ${best.date==null?'—':best.date} (note selected: ${targetDate})`;
+
+  // the filter also matches ingredients and classes, so "biologic" or "ics/laba" finds brand names
+  const tags = P.med_tags || {};
+  const f = (filterEl.value||"").trim().toLowerCase();
+  const matches = m => String(m).toLowerCase().includes(f) || (tags[m]||[]).some(t => t.toLowerCase().includes(f));
+  const list = f ? best.meds.filter(matches) : best.meds;
+
+  if (list.length === 0){
+    box.innerHTML = '<div class="small muted">No medications match your filter.</div>';
+    return;
+  }
+
+  const frag = document.createDocumentFragment();
+  list.forEach(m=>{
+    const div = document.createElement("div");
+    div.className = "med-item";
+    div.textContent = m;
+    (tags[m]||[]).forEach(t=>{
+      const tag = document.createElement("span");
+      tag.className = "med-tag";
+      tag.textContent = t;
+      div.appendChild(tag);
+    });
+    frag.appendChild(div);
+  });
+  box.innerHTML = "";
+  box.appendChild(frag);
+}
+
+/* ---------- Annotation storage (server-side; writes are queued and sent in batches) ---------- */
+let ANN_ROWS = [];  // the current annotator's annotations, newest first (from /api/annotations)
+const OUTBOX_KEY = "ann_outbox";      // writes stay here until the server confirms them
+const REJECTED_KEY = "ann_rejected";  // records the server refused as malformed, kept for recovery
+const ANN_BATCH_MAX = CONFIG.ann_batch_max || 1000;  // writes per POST (the server's limit)
+let flushTimer = null, flushing = false, sending = new Set();  // uids of upserts in the POST under way
+
+function newUid(){
+  return (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+    : Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+}
+function loadOutbox(){
+  try { return JSON.parse(localStorage.getItem(OUTBOX_KEY)) || {upsert:[], delete:[]}; }
+  catch(e){ return {upsert:[], delete:[]}; }
+}
+function saveOutbox(box){ try { localStorage.setItem(OUTBOX_KEY, JSON.stringify(box)); } catch(e){} }
+function scheduleFlush(ms){ clearTimeout(flushTimer); flushTimer = setTimeout(flushAnnotations, ms); }
+
+function queueUpsert(rec){
+  const box = loadOutbox();
+  box.upsert.push(rec);
+  saveOutbox(box); scheduleFlush(800);
+}
+function queueDelete(uid){
+  const box = loadOutbox();
+  const n = box.upsert.length;
+  box.upsert = box.upsert.filter(r => r.uid !== uid || sending.has(r.uid));
+  if (box.upsert.length === n) box.delete.push(uid);  // already sent, or being sent
+  saveOutbox(box); scheduleFlush(800);
+}
+function keepRejected(upsert, rejected){
+  let kept;
+  try { kept = JSON.parse(localStorage.getItem(REJECTED_KEY)) || []; } catch(e){ kept = []; }
+  rejected.forEach(x => kept.push({record: upsert[x.index], error: x.error}));
+  try { localStorage.setItem(REJECTED_KEY, JSON.stringify(kept)); } catch(e){}
+  console.error(`${rejected.length} annotation(s) rejected by the server, kept in localStorage "${REJECTED_KEY}":`, rejected);
+}
+async function flushAnnotations(){
+  if (flushing){ scheduleFlush(800); return; }
+  const box = loadOutbox();
+  if (!box.upsert.length && !box.delete.length) return;
+  // one server batch at a time; its writes leave the outbox only once the server answers 2xx
+  const upsert = box.upsert.slice(0, ANN_BATCH_MAX);
+  const del = box.delete.slice(0, ANN_BATCH_MAX - upsert.length);
+  flushing = true; sending = new Set(upsert.map(r => r.uid));
+  let rejected;
+  try {
+    const res = await fetchJSON(`${API_ROOT}/annotations`, {
+      method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify({upsert, delete: del})
+    });
+    rejected = res.rejected || [];
+  } catch(e){
+    // retried later (uids make a re-sent batch idempotent), unless the batch itself was refused
+    if (e.status !== 400){ scheduleFlush(5000); return; }
+    rejected = upsert.map((r, index) => ({index, uid: r.uid, error: e.message}));
+  } finally { flushing = false; sending = new Set(); }
+  if (rejected.length) keepRejected(upsert, rejected);
+  const sentUpserts = new Set(upsert.map(r => r.uid)), sentDeletes = new Set(del);
+  const now = loadOutbox();
+  const rest = {upsert: now.upsert.filter(r => !sentUpserts.has(r.uid)), delete: now.delete.filter(u => !sentDeletes.has(u))};
+  saveOutbox(rest);
+  if (rest.upsert.length || rest.delete.length) flushAnnotations();
+}
+function flushOnExit(){
+  const box = loadOutbox();
+  if (!box.upsert.length && !box.delete.length) return;
+  // the outbox is only cleared by a confirmed flush, so what the beacon loses is re-sent next visit
+  const upsert = box.upsert.slice(0, ANN_BATCH_MAX);
+  const batch = {upsert, delete: box.delete.slice(0, ANN_BATCH_MAX - upsert.length)};
+  navigator.sendBeacon(`${API_ROOT}/annotations`, new Blob([JSON.stringify(batch)], {type:"text/plain"}));
+}
+function migrateLocalAnnotations(){
+  // one-time upload of annotations saved by older versions of this page (ann_<pid> keys);
+  // flushAnnotations sends them in server-sized batches and parks any malformed ones
+  if (localStorage.getItem("ann_migrated")) return;
+  const box = loadOutbox();
+  for (let i=0;i<localStorage.length;i++){
+    const k = localStorage.key(i);
+    if (!k || !k.startsWith("ann_") || [OUTBOX_KEY, REJECTED_KEY, "ann_migrated"].includes(k)) continue;
+    try {
+      const pid = k.slice(4);
+      (JSON.parse(localStorage.getItem(k) || "[]") || []).forEach((r, j)=>{
+        box.upsert.push({...r, pid, uid: `local-${pid}-${r.ts || j}`});
+      });
+    } catch(e){}
+  }
+  saveOutbox(box);
+  localStorage.setItem("ann_migrated", "1");
+}
+
+function mergeOutbox(rows){
+  // server rows + writes not yet acknowledged, so the table never flickers back
+  const box = loadOutbox();
+  const gone = new Set(box.delete), pending = new Set(box.upsert.map(r => r.uid));
+  const who = getAnnotator();
+  return box.upsert.filter(r => r.annotator === who && !gone.has(r.uid))
+    .concat(rows.filter(r => !gone.has(r.uid) && !pending.has(r.uid)))
+    .sort((a,b)=> (b.ts||0)-(a.ts||0) || (b.date||0)-(a.date||0));
+}
+async function refreshAnnotations(){
+  const who = getAnnotator();
+  let rows = [];
+  if (who){
+    try { rows = (await fetchJSON(`${API_ROOT}/annotations?annotator=${encodeURIComponent(who)}`)).annotations; }
+    catch(e){ console.error("Failed to load annotations:", e.message); }
+  }
+  if (who !== getAnnotator()) return;  // annotator changed meanwhile
+  ANN_ROWS = mergeOutbox(rows);
+  renderAnnTable();
+}
+function saveAnnotation(rec){
+  ANN_ROWS.unshift(rec);
+  queueUpsert(rec);
+}
+function deleteAnnotation(uid){
+  ANN_ROWS = ANN_ROWS.filter(r => r.uid !== uid);
+  queueDelete(uid);
+}
+
+// The table is virtualized: only the rows in view (plus a margin) are in the DOM, between
+// two spacer rows that keep the scroll height. Rows are keyed by uid and a record never
+// changes once saved, so a save or delete inserts or removes single rows.
+const ANN_OVERSCAN = 10;
+let annRowH = 0;           // measured from the first rendered row
+const ANN_TR = new Map();  // uid -> <tr> in the table
+let annScrollQueued = false;
+function annRow(a){
+  const tr=el("tr");
+  tr.appendChild(el("td",{}, a.pid));
+  tr.appendChild(el("td",{}, String(a.date)));
+  tr.appendChild(el("td",{}, a.bioUse ? "Yes" : "No"));
+  const dr = (a.bioUse && (a.bioStart||a.bioEnd)) ? `${a.bioStart||""} - ${a.bioEnd||""}` : "—";
+  tr.appendChild(el("td",{}, dr));
+  tr.appendChild(el("td",{}, (a.bioUse ? "—" : (a.bioCand ? "Yes" : "No"))));
+  tr.appendChild(el("td",{class:"ann-note", title: a.note || ""}, a.note || ""));
+  tr.appendChild(el("td",{}, a.annotator || "—"));
+
+  const delTd = el("td");
+  const btn = el("button", {type:"button", class:"ghost ann-del", "data-uid": a.uid}, "🗑 Remove");
+  delTd.appendChild(btn);
+  tr.appendChild(delTd);
+  return tr;
+}
+function annSpacer(){
+  const tr = el("tr", {class:"ann-spacer"});
+  tr.appendChild(el("td", {colspan: 8}));
+  return tr;
+}
+function renderAnnTable(){
+  const anns=ANN_ROWS;
+  const wrap=document.getElementById("ann-table-wrap");
+  const empty=document.getElementById("no-anns");
+  const body=document.getElementById("ann-body");
+  if(anns.length===0){ wrap.style.display="none"; empty.style.display="block"; body.replaceChildren(); ANN_TR.clear(); return; }
+  empty.style.display="none"; wrap.style.display="block";
+  if (!body.firstChild) body.append(annSpacer(), annSpacer());
+  const top = body.firstChild, bottom = body.lastChild;
+
+  const rowH = annRowH || 45;
+  const first = Math.max(Math.floor(wrap.scrollTop / rowH) - ANN_OVERSCAN, 0);
+  const last = Math.min(first + Math.ceil((wrap.clientHeight || 400) / rowH) + 2*ANN_OVERSCAN, anns.length);
+  const want = anns.slice(first, last);
+  const keep = new Set(want.map(a => a.uid));
+  for (const [uid, tr] of ANN_TR){
+    if (!keep.has(uid)){ tr.remove(); ANN_TR.delete(uid); }
+  }
+  let at = top.nextSibling;
+  want.forEach(a=>{
+    let tr = ANN_TR.get(a.uid);
+    if (!tr){ tr = annRow(a); ANN_TR.set(a.uid, tr); }
+    if (tr === at) at = at.nextSibling;
+    else body.insertBefore(tr, at);
+  });
+  if (!annRowH && want.length) annRowH = ANN_TR.get(want[0].uid).offsetHeight;
+  top.firstChild.style.height = (first * rowH) + "px";
+  bottom.firstChild.style.height = ((anns.length - last) * rowH) + "px";
+}
+function onAnnScroll(){
+  if (annScrollQueued) return;
+  annScrollQueued = true;
+  requestAnimationFrame(()=>{ annScrollQueued = false; renderAnnTable(); });
+}
+
+/* ---------- Export to TXT ---------- */
+function downloadTxt(filename, text){
+  const blob = new Blob([text], {type:"text/plain"});
+  const url = URL.createObjectURL(blob);
+  const a = document.createElement("a");
+  a.href = url; a.download = filename; a.click();
+  URL.revokeObjectURL(url);
+}
+function exportAnnotations(){
+  const who = getAnnotator();
+  if (!who){ alert("Please set the annotator name first."); return; }
+  const anns = ANN_ROWS;
+  let lines = [];
+  lines.push(`Annotator: ${who}`);
+  lines.push(`Exported: ${new Date().toISOString()}`);
+  lines.push("");
+  anns.forEach(a=>{
+    lines.push(`PATIENT: ${a.pid}`);
+    lines.push(`NoteDate: ${a.date}`);
+    lines.push(`BiologicUse: ${a.bioUse ? "Yes" : "No"}`);
+    if (a.bioUse){
+      lines.push(`DateRange: ${a.bioStart||""} - ${a.bioEnd||""}`);
+    } else {
+      lines.push(`Candidate: ${a.bioCand ? "Yes" : "No"}`);
+    }
+    if (a.note) lines.push(`Note: ${a.note}`);
+    lines.push(`---`);
+  });
+  downloadTxt(`${who}_annotations.txt`, lines.join("\n"));
+}
+
+/* ---------- Navigation ---------- */
+function nextNote(){ const n=currentDetail().notes.length; if(!n) return; pos=(pos+1)%n; renderAllForNote(); }
+function prevNote(){ const n=currentDetail().notes.length; if(!n) return; pos=(pos-1+n)%n; renderAllForNote(); }
+function nextPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i+1)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
+function prevPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i-1+PATIENT_IDS.length+PATIENT_IDS.length)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
+
+// After every navigation, requests for whatever is neither on screen nor next to it are
+// cancelled (fast clicking), and once the user pauses the neighbouring notes and patients
+// are fetched one at a time, so the next click renders from the cache.
+const PREFETCH_DELAY = 150;  // ms without navigation before prefetching starts
+let prefetchTimer = null, prefetchGen = 0;
+function neighbours(){
+  // [pid, note] pairs, nearest first: the notes either side, then the patients either side (first note)
+  const out = [], n = currentDetail().notes.length;
+  const k = PATIENT_IDS.indexOf(currentPatient), np = PATIENT_IDS.length;
+  if (n > 1) out.push([currentPatient, (pos + 1) % n], [currentPatient, (pos - 1 + n) % n]);
+  if (k >= 0 && np > 1) out.push([PATIENT_IDS[(k + 1) % np], 0], [PATIENT_IDS[(k - 1 + np) % np], 0]);
+  return out;
+}
+function viewKeys(pid, i){ return ["p|" + pid, `${friendlyMode ? "pretty" : "text"}|${pid}|${i}`]; }
+function schedulePrefetch(){
+  const targets = neighbours();
+  cancelRequests(new Set([[currentPatient, pos], ...targets].flatMap(([pid, i])=>viewKeys(pid, i))));
+  clearTimeout(prefetchTimer);
+  const gen = ++prefetchGen;
+  prefetchTimer = setTimeout(async ()=>{
+    for (const [pid, i] of targets){
+      if (gen !== prefetchGen) return;  // navigated again: a newer schedule took over
+      try {
+        const P = await loadPatient(pid);
+        if (gen === prefetchGen && i < P.notes.length) await (friendlyMode ? loadPretty(pid, i) : loadNote(pid, i));
+      } catch(e){}  // cancelled, or failed: shown (and retried) if the user goes there
+    }
+  }, PREFETCH_DELAY);
+}
+async function loadRemainingPatientIds(total){
+  // Page through the rest of the cohort in the background so the first patient renders immediately.
+  for (let offset = PATIENT_IDS.length; offset < total; offset += PAGE_SIZE){
+    let page;
+    try { page = await fetchPatientPage(offset); } catch(e){ return; }
+    if (!page.patients.length) break;
+    page.patients.forEach(p=>PATIENT_IDS.push(p.pid));
+  }
+  renderPatientSelect();
+}
+const REFRESHED = new Set();
+function refreshPatient(pid){
+  // The server hot-reloaded its data: drop this patient's cached detail + notes and refetch once.
+  if (REFRESHED.has(pid)) return false;
+  REFRESHED.add(pid);
+  PATIENT_CACHE.delete(pid);
+  NOTE_CACHE.keys().forEach(k=>{ if (k.startsWith(pid + "|")) NOTE_CACHE.delete(k); });
+  loadPatient(pid).then(()=>{
+    if (pid!==currentPatient) return;
+    pos = Math.min(pos, Math.max(currentDetail().notes.length - 1, 0));
+    renderAll();
+  }, ()=>{});
+  return true;
+}
+async function switchPatient(pid, startPos=0){
+  currentPatient=pid; pos=startPos;
+  document.getElementById("free-note").value="";
+  document.getElementById("bioUseNo").checked = true;
+  document.getElementById("bioUseYes").checked = false;
+  document.getElementById("bio-yes-extra").style.display = "none";
+  document.getElementById("bio-no-extra").style.display  = "flex";
+  document.getElementById("bioCandNo").checked = true;
+  document.getElementById("bioCandYes").checked = false;
+  document.getElementById("bioStart").value = "";
+  document.getElementById("bioEnd").value = "";
+  schedulePrefetch();  // cancels the patients clicked past
+  try { await loadPatient(pid); }
+  catch(e){ if (pid===currentPatient) alert("Failed to load patient " + pid + ": " + e.message); return; }
+  if (pid!==currentPatient) return;  // a later switch superseded this one
+  pos = Math.min(pos, Math.max(currentDetail().notes.length - 1, 0));
+  lockBioRadioForPatient();
+  renderAll();
+}
+
+/* ---------- Render orchestration ---------- */
+function renderAll(){
+  renderAnnotatorUI();
+  renderPatientSelect(); renderHeader();
+  lockBioRadioForPatient();
+  renderText(); renderTimeline();
+  renderAnnTable(); renderDemographics(); renderLabsForCurrentNote(); renderSymptoms();
+  renderMedications(); // NEW
+  document.getElementById("med-filter").oninput = renderMedications; // NEW
+  schedulePrefetch();
+}
+function renderAllForNote(){
+  renderHeader(); renderText(); renderTimeline();
+  renderLabsForCurrentNote(); renderSymptoms();
+  renderMedications(); // NEW
+  schedulePrefetch();
+}
+
+/* ---------- Boot ---------- */
+document.addEventListener("DOMContentLoaded", async ()=>{
+  migrateLocalAnnotations();
+  flushAnnotations();
+  refreshAnnotations();
+  window.addEventListener("pagehide", flushOnExit);
+
+  let first;
+  try { first = await fetchPatientPage(0); }
+  catch(e){ alert("Failed to load patient list: " + e.message); return; }
+  MEDS_ERR = first.meds_err;
+  PATIENT_IDS = first.patients.map(p=>p.pid);
+  if (PATIENT_IDS.length===0){ alert("No eligible patients (filtered by labs CSV)."); return; }
+  await switchPatient(PATIENT_IDS[0]);
+  loadRemainingPatientIds(first.total);
+
+  document.getElementById("next-btn").onclick=(e)=>{ e.preventDefault(); nextNote(); };
+  document.getElementById("prev-btn").onclick=(e)=>{ e.preventDefault(); prevNote(); };
+  document.getElementById("next-patient-btn").onclick=(e)=>{ e.preventDefault(); nextPatient(); };
+  document.getElementById("prev-patient-btn").onclick=(e)=>{ e.preventDefault(); prevPatient(); };
+  document.getElementById("friendly-btn").onclick=()=>{ friendlyMode=!friendlyMode; renderText(); schedulePrefetch(); };
+  document.getElementById("hit-prev").onclick=()=>gotoHit(-1);
+  document.getElementById("hit-next").onclick=()=>gotoHit(1);
+  const search = document.getElementById("note-search");
+  search.oninput = ()=>{ clearTimeout(searchTimer); searchTimer = setTimeout(runSearch, 300); };
+  search.onkeydown = (e)=>{ if (e.key==="Enter"){ clearTimeout(searchTimer); runSearch(); } };
+
+  const useNo = document.getElementById("bioUseNo");
+  const useYes = document.getElementById("bioUseYes");
+  useNo.onchange = () => { if (useNo.checked){ document.getElementById("bio-yes-extra").style.display="none"; document.getElementById("bio-no-extra").style.display="flex"; } };
+  useYes.onchange = () => { if (useYes.checked){ document.getElementById("bio-yes-extra").style.display="flex"; document.getElementById("bio-no-extra").style.display="none"; } };
+
+  document.getElementById("save-annotation").onclick=(e)=>{
+    e.preventDefault();
+    const annotator = getAnnotator();
+    if (!annotator){ alert("Please set the annotator name first."); return; }
+
+    const note = currentDetail().notes[pos];
+    if (!note) return;
+    const textNote = document.getElementById("free-note").value || "";
+
+    const bioUse   = document.getElementById("bioUseYes").checked;
+    const bioStart = document.getElementById("bioStart").value || "";
+    const bioEnd   = document.getElementById("bioEnd").value || "";
+    const bioCand  = document.getElementById("bioCandYes").checked;
+
+    const rec = {
+      uid: newUid(),
+      pid: currentPatient,
+      date: note.date,
+      note: textNote,
+      annotator: annotator,
+      bioUse: !!bioUse,
+      bioStart: bioUse ? bioStart : "",
+      bioEnd:   bioUse ? bioEnd   : "",
+      bioCand:  bioUse ? null : !!bioCand,
+      ts: Date.now()
+    };
+    saveAnnotation(rec);
+    renderAnnTable();
+    alert("Annotation saved.");
+  };
+
+  document.getElementById("export-txt").onclick=(e)=>{ e.preventDefault(); exportAnnotations(); };
+  ["csv", "jsonl"].forEach(fmt=>{
+    document.getElementById("export-" + fmt).onclick=(e)=>{
+      e.preventDefault();
+      const who = getAnnotator();
+      window.location.href = `${API_ROOT}/annotations/export?format=${fmt}` + (who ? `&annotator=${encodeURIComponent(who)}` : "");
+    };
+  });
+
+  document.getElementById("timeline").addEventListener("click", onTimelineClick);
+  document.getElementById("ann-table-wrap").addEventListener("scroll", onAnnScroll);
+  document.getElementById("ann-body").addEventListener("click", (e)=>{
+    const btn = e.target.closest(".ann-del");
+    if (!btn) return;
+    e.preventDefault();
+    const uid = btn.dataset.uid;
+    if (!uid) return;
+    if (confirm("Remove this annotation?")){
+      deleteAnnotation(uid);
+      renderAnnTable();
+    }
+  });
+});
@@ -0,0 +1,75 @@
+# static_assets.py
+"""
+Content-hashed static assets. Every file in a directory is served from memory as a
+Payload at <prefix>/<stem>.<hash><ext> with a one-year immutable Cache-Control, so a
+browser downloads each version once. Templates link them with asset_url("app.js");
+editing a file changes its hash and therefore its URL.
+
+Generated assets (e.g. data embedded by an app at startup) can be added with add().
+"""
+import hashlib
+import mimetypes
+from pathlib import Path
+
+from flask import abort, url_for
+
+from payload import Payload, send_payload
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class StaticAssets:
+    def __init__(self, app, directory, url_prefix="/assets", endpoint="assets"):
+        self.app = app
+        self.dir = Path(directory)
+        self.endpoint = endpoint
+        self._by_name = {}   # "app.js" -> "app.<hash>.js"
+        self._files = {}     # "app.<hash>.js" -> Payload
+        self._mtimes = {}
+        self.scan()
+        app.add_url_rule(f"{url_prefix}/<path:filename>", endpoint, self.serve)
+        app.jinja_env.globals["asset_url"] = self.url
+
+    def scan(self):
+        """(Re)load every file whose mtime changed."""
+        if not self.dir.is_dir():
+            return
+        for path in sorted(self.dir.rglob("*")):
+            if not path.is_file():
+                continue
+            mtime = path.stat().st_mtime_ns
+            name = path.relative_to(self.dir).as_posix()
+            if self._mtimes.get(name) != mtime:
+                self._mtimes[name] = mtime
+                self.add(name, path.read_bytes())
+
+    def add(self, name, body: bytes, mimetype=None):
+        """Serve `body` as asset `name`; returns its hashed filename."""
+        stem, dot, ext = name.rpartition(".")
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        hashed = f"{stem}.{digest}.{ext}" if dot else f"{name}.{digest}"
+        mimetype = mimetype or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        old = self._by_name.get(name)
+        if old and old != hashed:
+            self._files.pop(old, None)
+        self._files[hashed] = Payload(body, mimetype=mimetype)
+        self._by_name[name] = hashed
+        return hashed
+
+    @property
+    def version(self):
+        """Changes whenever any asset does (for caching pages that link them)."""
+        if self.app.debug:  # pick up edits without a restart while developing
+            self.scan()
+        return hashlib.sha256("|".join(sorted(self._files)).encode("utf-8")).hexdigest()[:12]
+
+    def url(self, name):
+        if self.app.debug:
+            self.scan()
+        return url_for(self.endpoint, filename=self._by_name[name])
+
+    def serve(self, filename):
+        p = self._files.get(filename)
+        if p is None:
+            abort(404)
+        return send_payload(p, cache_control=IMMUTABLE)
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# app reads its configuration at import: serve the sample cohort and keep caches out of the tree
+os.environ.setdefault("NOTES_CSV", str(ROOT / "webpage" / "Test_to_annotate.csv"))
+os.environ.setdefault("COHORT_CACHE_DIR", tempfile.mkdtemp(prefix="cohort-cache-"))
+os.environ.setdefault("ANNOTATIONS_DB", os.path.join(tempfile.mkdtemp(prefix="annotations-"), "annotations.sqlite3"))
@@ -0,0 +1,86 @@
+import pytest
+
+import agreement
+from annotation_store import AnnotationStore
+
+# Fleiss (1971) / Wikipedia worked example: 10 items, 14 raters, 5 categories -> 0.210
+FLEISS_EXAMPLE = [
+    [0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+    [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7],
+]
+
+
+def test_fleiss_kappa():
+    assert agreement.fleiss_kappa(FLEISS_EXAMPLE) == pytest.approx(0.20993, abs=1e-5)
+    assert agreement.fleiss_kappa([[2, 0], [0, 2]]) == pytest.approx(1.0)
+    assert agreement.fleiss_kappa([[1, 1], [1, 1]]) == pytest.approx(-1.0)
+    assert agreement.fleiss_kappa([[1, 0], [0, 1]]) is None  # no item rated twice
+
+
+def test_cohen_kappa():
+    # p_o = 35/50, p_e = (25*30 + 25*20) / 50^2 = 0.5
+    assert agreement.cohen_kappa([[20, 5], [10, 15]]) == pytest.approx(0.4)
+    assert agreement.cohen_kappa([[3, 0], [0, 0]]) == pytest.approx(1.0)
+    assert agreement.cohen_kappa([[0, 0], [0, 0]]) is None
+
+
+def label(annotator, date, use, ts=1, **kw):
+    return {"uid": f"{annotator}-{date}-{ts}", "pid": "p1", "date": date, "annotator": annotator,
+            "bioUse": use, "bioCand": False, "ts": ts, **kw}
+
+
+# x says yes, yes, no, no; y says yes, no, no, no
+RECORDS = [label("x", d, u) for d, u in zip((1, 2, 3, 4), (True, True, False, False))] + \
+          [label("y", d, u) for d, u in zip((1, 2, 3, 4), (True, False, False, False))]
+
+
+def test_report_from_records():
+    rep = agreement.from_records(RECORDS).report()
+    use = rep["metrics"]["bioUse"]
+    # Cohen: confusion [[2, 0], [1, 1]], p_o = 3/4, p_e = (2*3 + 2*1) / 16 = 1/2
+    assert use["cohen"] == [{"a": "x", "b": "y", "n": 4, "kappa": pytest.approx(0.5)}]
+    # Fleiss: items [0,2] [1,1] [2,0] [2,0]: P = 3/4, p = (5/8, 3/8), P_e = 34/64
+    assert use["fleiss_kappa"] == pytest.approx(7 / 15)
+    assert rep["multi_rated_units"] == 4
+
+
+def test_latest_label_per_annotator_counts():
+    rep = agreement.from_records(RECORDS + [label("y", 2, True, ts=2)]).report()
+    assert rep["metrics"]["bioUse"]["cohen"][0]["kappa"] == pytest.approx(1.0)
+
+
+def test_index_follows_the_store(tmp_path):
+    store = AnnotationStore(tmp_path / "ann.sqlite3")
+    index = agreement.AgreementIndex(store)
+    store.write(RECORDS)
+    assert index.get().report()["metrics"]["bioUse"]["cohen"][0]["kappa"] == pytest.approx(0.5)
+    store.write([label("y", 2, True, ts=2)])
+    index.catch_up()
+    assert index.get().report() == agreement.from_records(store.iter_records()).report()
+
+
+def test_change_log_is_pruned_after_every_reader_has_seen_it(tmp_path):
+    store = AnnotationStore(tmp_path / "ann.sqlite3")
+    store.write(RECORDS[:2])
+    since = store.last_change()
+    store.write(RECORDS[2:3])
+    assert store.changed_units(since) == (since + 1, {("p1", 3.0)})
+    store.mark_read("r1", since)
+    store.mark_read("r2", since + 1)
+    assert store.changed_units(since) is not None  # r1 still needs it
+    store.mark_read("r1", since + 1)
+    assert store.changed_units(since) is None  # pruned: a reader this far behind rebuilds
+    assert store.changed_units(since + 1) == (since + 1, set())
+
+
+def test_index_rebuilds_when_its_changes_were_pruned(tmp_path):
+    store = AnnotationStore(tmp_path / "ann.sqlite3")
+    behind, ahead = agreement.AgreementIndex(store), agreement.AgreementIndex(store)
+    store.write(RECORDS)
+    behind.get()
+    store._conn().execute("DELETE FROM annotation_readers")  # as if `behind` had gone stale
+    store._conn().commit()
+    store.write([label("y", 2, True, ts=2)])
+    ahead.get()
+    assert store._conn().execute("SELECT COUNT(*) FROM annotation_changes").fetchone()[0] == 0
+    assert behind.get().report() == agreement.from_records(store.iter_records()).report()
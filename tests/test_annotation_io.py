@@ -0,0 +1,91 @@
+import io
+
+import pytest
+
+import annotation_io
+from annotation_store import AnnotationStore
+
+RECORDS = [
+    {"uid": "a", "pid": "p1", "date": 1000, "annotator": "ann", "note": "line one, \"quoted\"\nline two",
+     "bioUse": True, "bioStart": "2020-01-01", "bioEnd": "2020-03-01", "bioCand": None, "ts": 3},
+    {"uid": "b", "pid": "p1", "date": 2000.5, "annotator": "bob", "note": "",
+     "bioUse": False, "bioStart": "", "bioEnd": "", "bioCand": True, "ts": 2},
+    {"uid": "c", "pid": "p2", "date": None, "annotator": "ann", "note": "ünïcode",
+     "bioUse": False, "bioStart": "", "bioEnd": "", "bioCand": False, "ts": 1},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = AnnotationStore(tmp_path / "ann.sqlite3")
+    s.write(RECORDS)
+    return s
+
+
+def exported(store, fmt):
+    return b"".join(annotation_io.export(store.iter_records(), fmt))
+
+
+def read_back(data, fmt):
+    return list(annotation_io.read(io.StringIO(data.decode("utf-8"), newline=""), fmt))
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_export_import_round_trip(store, tmp_path, fmt):
+    records = read_back(exported(store, fmt), fmt)
+    fresh = AnnotationStore(tmp_path / "fresh.sqlite3")
+    assert fresh.import_records(records) == (3, 0, 0)
+    assert fresh.query() == store.query()
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_reimport_adds_nothing(store, fmt):
+    records = read_back(exported(store, fmt), fmt)
+    assert store.import_records(records) == (0, 0, 3)
+    assert store.count() == 3
+
+
+def test_import_updates_a_changed_uid(store):
+    changed = dict(RECORDS[1], note="revised", ts=9)
+    assert store.import_records([changed]) == (0, 1, 0)
+    assert store.query(pid="p1", annotator="bob")[0]["note"] == "revised"
+
+
+def page_txt(annotator, records):
+    """The page's "Save to TXT" export (static/app.js exportAnnotations)."""
+    lines = [f"Annotator: {annotator}", "Exported: 2024-01-01T00:00:00.000Z", ""]
+    for a in records:
+        lines += [f"PATIENT: {a['pid']}", f"NoteDate: {a['date']}", f"BiologicUse: {'Yes' if a['bioUse'] else 'No'}"]
+        if a["bioUse"]:
+            lines.append(f"DateRange: {a['bioStart']} - {a['bioEnd']}")
+        else:
+            lines.append(f"Candidate: {'Yes' if a['bioCand'] else 'No'}")
+        if a["note"]:
+            lines.append(f"Note: {a['note']}")
+        lines.append("---")
+    return "\n".join(lines)
+
+
+def test_txt_import_and_reimport(tmp_path):
+    mine = [r for r in RECORDS if r["annotator"] == "ann" and r["date"] is not None]
+    text = page_txt("ann", mine)
+    store = AnnotationStore(tmp_path / "ann.sqlite3")
+    assert store.import_records(annotation_io.read(io.StringIO(text), "txt")) == (1, 0, 0)
+    got = store.query()[0]
+    assert {k: got[k] for k in ("pid", "date", "annotator", "note", "bioUse", "bioStart", "bioEnd")} == \
+        {k: mine[0][k] for k in ("pid", "date", "annotator", "note", "bioUse", "bioStart", "bioEnd")}
+    assert store.import_records(annotation_io.read(io.StringIO(text), "txt")) == (0, 0, 1)
+
+
+def test_txt_import_matches_stored_annotation(store):
+    """The page's TXT of annotations already in the store adds nothing (uids differ, content matches)."""
+    text = page_txt("ann", [r for r in RECORDS if r["annotator"] == "ann" and r["date"] is not None])
+    assert store.import_records(annotation_io.read(io.StringIO(text), "txt")) == (0, 0, 1)
+
+
+@pytest.mark.skipif(annotation_io.pq is None, reason="needs pyarrow")
+def test_parquet_round_trip(store, tmp_path):
+    records = list(annotation_io.read(io.BytesIO(exported(store, "parquet")), "parquet"))
+    fresh = AnnotationStore(tmp_path / "fresh.sqlite3")
+    assert fresh.import_records(records) == (3, 0, 0)
+    assert fresh.query() == store.query()
@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+import annotation_store
+from annotation_store import AnnotationStore
+
+
+def rec(uid, pid="p1", date=1000, annotator="ann", **kw):
+    return {"uid": uid, "pid": pid, "date": date, "annotator": annotator, "note": "",
+            "bioUse": False, "bioCand": False, "ts": 1, **kw}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AnnotationStore(tmp_path / "ann.sqlite3")
+
+
+def test_batch_upsert_and_delete(store):
+    assert store.write([rec("a"), rec("b"), rec("c", pid="p2")]) == (3, 0, [])
+    assert store.count() == 3
+    written, deleted, rejected = store.write([rec("a", note="edited", ts=2)], deletes=["b", "missing"])
+    assert (written, deleted, rejected) == (1, 1, [])
+    assert {r["uid"]: r["note"] for r in store.query()} == {"a": "edited", "c": ""}
+    assert [r["uid"] for r in store.query(pid="p2")] == ["c"]
+
+
+def test_resent_batch_is_applied_once(store):
+    batch = [rec("a"), rec("b", bioUse=True, bioStart="2020-01-01", bioEnd="2020-02-01")]
+    store.write(batch)
+    store.write(batch)
+    assert store.count() == 2
+    b = store.query(annotator="ann", pid="p1", date=1000)
+    assert {r["uid"]: r["bioCand"] for r in b} == {"a": False, "b": None}
+
+
+def test_query_is_newest_first_and_pages(store):
+    store.write([rec("old", ts=1), rec("new", ts=3), rec("mid", ts=2), rec("other", annotator="bob", ts=4)])
+    assert [r["uid"] for r in store.query(annotator="ann")] == ["new", "mid", "old"]
+    assert [r["uid"] for r in store.query(limit=2, offset=1)] == ["new", "mid"]
+    assert store.count(annotator="bob") == 1
+
+
+def test_bad_records_are_rejected_not_the_batch(store):
+    written, _, rejected = store.write([rec("a"), {"uid": "x"}, "junk", rec("b", date="not a date")])
+    assert written == 1
+    assert [(r["index"], r["uid"]) for r in rejected] == [(1, "x"), (2, None), (3, "b")]
+    assert [r["uid"] for r in store.query()] == ["a"]
+
+
+def test_null_and_false_candidate_are_the_same_content(store):
+    assert annotation_store.to_row(rec("a", bioCand=None))[-1] == annotation_store.to_row(rec("a"))[-1]
+    store.write([rec("a", bioCand=None)])
+    assert store.query()[0]["bioCand"] is False
+
+
+def test_version_3_database_is_migrated(tmp_path):
+    path = tmp_path / "old.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.executescript(annotation_store.SCHEMA)
+    row = ("u1", "p1", 1.0, "ann", "", 0, "", "", None, 5)
+    conn.execute(f"INSERT INTO annotations ({', '.join(annotation_store.COLUMNS)}, fp) VALUES ({', '.join('?' * 11)})",
+                 (*row, annotation_store.fingerprint(*row[1:9])))
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+    store = AnnotationStore(path)
+    assert store.query()[0]["bioCand"] is False
+    assert store.import_records([rec("other-uid", date=1, ts=5)]) == (0, 0, 1)
+
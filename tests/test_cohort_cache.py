@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+
+import app
+import cohort_cache
+
+
+def test_read_returns_what_was_written(tmp_path):
+    cohort = app.compact(app.load_cohort_from_csv())
+    cached = cohort_cache.read_cache(cohort_cache.write_cache(tmp_path, "k", cohort))
+    assert {k: v for k, v in cached.manifest.items() if k not in ("version", "key")} == cohort.manifest
+    assert sorted(cached.arrays) == sorted(cohort.arrays)
+    for name, arr in cohort.arrays.items():
+        assert isinstance(cached.arrays[name], np.memmap)
+        assert np.array_equal(cached.arrays[name], arr, equal_nan=arr.dtype.kind == "f"), name
+    assert cached.to_data() == cohort.to_data()
+
+
+def test_missing_or_outdated_entry_is_a_miss(tmp_path):
+    assert cohort_cache.read_cache(tmp_path / "absent") is None
+    entry = cohort_cache.write_cache(tmp_path, "k", app.compact(app.load_cohort_from_csv()))
+    manifest = json.loads((entry / "manifest.json").read_text(encoding="utf-8"))
+    manifest["version"] = cohort_cache.CACHE_VERSION - 1
+    (entry / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    assert cohort_cache.read_cache(entry) is None
+
+
+def test_key_changes_with_the_sources_and_config(tmp_path):
+    src = tmp_path / "notes.csv"
+    src.write_text("a")
+    key = cohort_cache.source_key([src])
+    assert cohort_cache.source_key([src]) == key
+    assert cohort_cache.source_key([src], extra="config") != key
+    src.write_text("ab")
+    assert cohort_cache.source_key([src]) != key
+
+
+def test_only_older_versions_of_the_same_sources_are_evicted(tmp_path):
+    cohort = app.compact(app.load_cohort_from_csv())
+    for key in ("aaa-1", "bbb-1", "aaa-2"):
+        cohort_cache.write_cache(tmp_path, key, cohort)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["aaa-2", "bbb-1"]
+
+
+def test_partly_deleted_entry_is_a_miss(tmp_path):
+    entry = cohort_cache.write_cache(tmp_path, "k", app.compact(app.load_cohort_from_csv()))
+    next(entry.glob("notes_*.npy")).unlink()  # as if evicted between the manifest and the arrays
+    assert cohort_cache.read_cache(entry) is None
+
+
+def test_existing_entry_is_kept_not_rewritten(tmp_path):
+    cohort = app.compact(app.load_cohort_from_csv())
+    entry = cohort_cache.write_cache(tmp_path, "k", cohort)
+    mapped = cohort_cache.read_cache(entry)
+    before = {p.name: p.stat().st_ino for p in entry.iterdir()}
+    cohort_cache.write_cache(tmp_path, "k", cohort)
+    assert {p.name: p.stat().st_ino for p in entry.iterdir()} == before
+    assert [p.name for p in tmp_path.iterdir()] == ["k"]
+    assert mapped.to_data() == cohort.to_data()
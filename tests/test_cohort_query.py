@@ -0,0 +1,121 @@
+import math
+import operator
+import random
+
+import pytest
+
+from cohort_query import NoteTable, parse
+from compact_cohort import CompactCohort
+from med_index import MedIndex
+
+LAB_FIELDS, SYM_FIELDS = ["eos", "fev1"], ["wheeze"]
+MEDS = ["BUDESONIDE 180 MCG INHALER", "SYMBICORT 160-4.5", "ALBUTEROL HFA", "PREDNISONE 10 MG", "DUPIXENT 300 MG"]
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le, "=": operator.eq, "!=": operator.ne}
+
+
+def synthetic(seed=0, n_patients=60):
+    rng = random.Random(seed)
+    maybe = lambda v: None if rng.random() < 0.15 else v
+    data = {"patients": {}, "labs": {}, "demo": {}, "meds": {}, "meds_err": None, "bio": {}}
+    for p in range(n_patients):
+        pid = f"p{p:03d}"
+        notes = sorted(float(rng.randrange(0, 400)) for _ in range(rng.randint(1, 8)))
+        data["patients"][pid] = {"notes": [{"date": d, "text": "t"} for d in notes], "min_date": notes[0], "max_date": notes[-1]}
+        labs = sorted(float(rng.randrange(0, 400)) for _ in range(rng.randint(0, 5)))
+        if labs:
+            data["labs"][pid] = [{"date": d, "eos": maybe(rng.choice((0.1, 0.2, 0.3, 0.45, 0.8))),
+                                  "fev1": maybe(round(rng.uniform(1, 4), 1)), "wheeze": maybe(rng.randint(0, 1))}
+                                 for d in labs]
+        data["demo"][pid] = {"AGE": maybe(float(rng.randrange(18, 90))), "SEX": rng.choice("MF"), "BMI": maybe(25.0)}
+        meds = sorted(float(rng.randrange(0, 400)) for _ in range(rng.randint(0, 6)))
+        data["meds"][pid] = [{"date": d, "meds": rng.sample(MEDS, rng.randint(1, 2))} for d in meds] + \
+                            ([{"date": None, "meds": [MEDS[0]]}] if rng.random() < 0.2 else [])
+    return data
+
+
+def brute_force(data, index, clauses):
+    """(pid, note) of every note matching the clauses, checked one note at a time."""
+    out = []
+    for pid, P in data["patients"].items():
+        labs = data["labs"].get(pid, [])
+        for i, n in enumerate(P["notes"]):
+            nd = n["date"]
+            lab = min(labs, key=lambda r: abs(r["date"] - nd)) if labs else {}  # min keeps the first tie
+            values = {"note_date": nd, "lab_date": lab.get("date"), **{k: lab.get(k) for k in LAB_FIELDS + SYM_FIELDS},
+                      "AGE": data["demo"][pid]["AGE"], "BMI": data["demo"][pid]["BMI"]}
+            ok = True
+            for c in clauses:
+                if "field" in c:
+                    v = values[c["field"]]
+                    ok = v is not None and OPS[c["op"]](v, c["value"])
+                else:
+                    names = {index.vocab[k] for k in index.match(c["med"]).tolist()}
+                    ok = any(r["date"] is not None and abs(r["date"] - nd) <= c["within"] and names & set(r["meds"])
+                             for r in data["meds"][pid])
+                if not ok:
+                    break
+            if ok:
+                out.append((pid, i))
+    return out
+
+
+@pytest.fixture(scope="module")
+def cohort():
+    data = synthetic()
+    compact = CompactCohort.from_data(data, LAB_FIELDS, SYM_FIELDS)
+    index = MedIndex(compact)
+    return data, index, NoteTable(compact, index)
+
+
+def random_query(rng):
+    clauses = []
+    for _ in range(rng.randint(1, 3)):
+        kind = rng.random()
+        if kind < 0.6:
+            field = rng.choice(["eos", "fev1", "wheeze", "AGE", "BMI", "note_date", "lab_date"])
+            value = {"eos": (0.2, 0.3, 0.45), "fev1": (1.5, 2.5), "wheeze": (0, 1), "AGE": (40, 65),
+                     "BMI": (25,), "note_date": (100, 250), "lab_date": (50, 300)}[field]
+            clauses.append(f"{field} {rng.choice(list(OPS))} {rng.choice(value)}")
+        else:
+            clauses.append(f"on {rng.choice(['ICS', 'biologic', 'symbicort', 'albuterol', 'OCS'])} within {rng.choice([0, 7, 30, 90])}")
+    return " and ".join(clauses)
+
+
+def test_queries_match_brute_force(cohort):
+    data, index, table = cohort
+    rng = random.Random(1)
+    for _ in range(300):
+        q = random_query(rng)
+        res = table.search(q, limit=10 ** 6)
+        assert [(n["pid"], n["note"]) for n in res["notes"]] == brute_force(data, index, parse(q, table.fields)), q
+        assert res["total"] == len(res["notes"])
+
+
+def test_values_are_those_of_the_closest_lab(cohort):
+    data, _, table = cohort
+    res = table.search("eos >= 0", limit=5)
+    for n in res["notes"]:
+        labs = data["labs"][n["pid"]]
+        nd = data["patients"][n["pid"]]["notes"][n["note"]]["date"]
+        lab = min(labs, key=lambda r: abs(r["date"] - nd))
+        assert n["values"] == {"eos": lab["eos"], "lab_date": lab["date"]}
+
+
+def test_parse():
+    fields = ["Absolute Eosinophils", "exacerbation_current", "exacerbation_previous", "AGE"]
+    assert parse("eosinophils > 0.3 and on ICS within 14", fields) == [
+        {"field": "Absolute Eosinophils", "op": ">", "value": 0.3}, {"med": "ICS", "within": 14}]
+    assert parse("meds albuterol", fields) == [{"med": "albuterol", "within": 30}]
+    assert parse("on an ICS within ±30 days", fields) == [{"med": "ICS", "within": 30}]
+    with pytest.raises(ValueError, match="ambiguous"):
+        parse("exacerbation = 1", fields)
+    with pytest.raises(ValueError, match="unknown field"):
+        parse("weight > 3", fields)
+    with pytest.raises(ValueError, match="cannot parse"):
+        parse("eos is high", fields)
+
+
+def test_unknown_medication_is_an_error(cohort):
+    _, _, table = cohort
+    with pytest.raises(ValueError, match="no medication matches"):
+        table.search("on warfarin")
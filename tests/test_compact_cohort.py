@@ -0,0 +1,37 @@
+import numpy as np
+
+import app
+from compact_cohort import CompactCohort
+
+LAB_FIELDS, SYM_FIELDS = ["FEV1", "IgE"], ["wheeze", "cough"]
+DATA = {
+    "patients": {
+        "p1": {"notes": [{"date": 1.0, "text": "héllo (world)"}, {"date": 3.5, "text": ""}], "min_date": 1.0, "max_date": 3.5},
+        "p2": {"notes": [{"date": -2.0, "text": "only note"}], "min_date": -2.0, "max_date": -2.0},
+    },
+    "labs": {
+        "p1": [{"date": 1.0, "FEV1": 2.5, "IgE": "<2", "wheeze": 1, "cough": None},
+               {"date": 4.0, "FEV1": None, "IgE": 150.0, "wheeze": 0, "cough": 1}],
+    },
+    "demo": {"p1": {"AGE": 41.0, "SEX": "F", "BMI": "n/a"}, "p2": {"AGE": None, "SEX": "", "BMI": 22.5}},
+    "meds": {"p1": [{"date": 2.0, "meds": ["budesonide", "albuterol"]}, {"date": None, "meds": ["budesonide"]}], "p2": []},
+    "meds_err": None,
+    "bio": {"p1": [{"date": 2.0, "drug": "x"}]},
+}
+
+
+def test_round_trips_to_the_dict_records():
+    assert CompactCohort.from_data(DATA, LAB_FIELDS, SYM_FIELDS).to_data() == DATA
+
+
+def test_round_trips_the_sample_cohort():
+    data = app.load_cohort_from_csv()
+    assert app.compact(data).to_data() == data
+
+
+def test_shared_vocabulary_and_accessors():
+    c = CompactCohort.from_data(DATA, LAB_FIELDS, SYM_FIELDS)
+    assert c.vocab == ["budesonide", "albuterol"]
+    assert c.n_notes("p1") == 2 and "p3" not in c
+    assert c.note_text("p1", 0) == "héllo (world)"
+    assert np.isnan(c.arrays["meds_date"][1])
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+import app
+
+SIZES = [(1, 1), (5, 7), (16, 40), (64, 64), (app.PRETTY_FIRST_CHUNK, app.PRETTY_CHUNK)]
+PIECES = list("abcAB  ,.;()-•\n\t0") + ["HPI", "Review of Systems", "Medications", "Allergies", "ASSESSMENT AND PLAN",
+                                        "Chief Complaint(s)", " - ", ".,", ",,", "..", "physical exam"]
+
+
+@pytest.fixture(scope="module")
+def notes():
+    data = app.load_cohort_from_csv()
+    return [n["text"] for P in data["patients"].values() for n in P["notes"]]
+
+
+def joined(text, first, size):
+    return "".join(app.iter_friendly_text(text, first, size))
+
+
+def test_sample_notes_stream_to_the_friendly_text(notes):
+    for text in notes:
+        want = app.make_friendly_text(text)
+        for first, size in SIZES:
+            assert joined(text, first, size) == want
+
+
+def test_noisy_text_streams_to_the_friendly_text(notes):
+    rng = random.Random(0)
+    for _ in range(800):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 400)))
+        for first, size in SIZES[:4]:
+            assert joined(text, first, size) == app.make_friendly_text(text), repr(text)
+    for _ in range(50):
+        chars = list(" ".join(rng.choices(notes, k=4)))
+        for _ in range(30):
+            chars.insert(rng.randrange(len(chars) + 1), rng.choice(PIECES))
+        text = "".join(chars)
+        assert joined(text, 256, 1024) == app.make_friendly_text(text)
+
+
+def test_first_piece_is_small():
+    text = "Chief complaint: cough. " + "word " * 50000
+    first = next(app.iter_friendly_text(text))
+    assert len(first) < 2 * app.PRETTY_FIRST_CHUNK
+    assert "".join(app.iter_friendly_text(text)) == app.make_friendly_text(text)
+    assert list(app.iter_friendly_text(None)) == []
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import app
+from med_index import CLASS_NAMES, MedIndex, normalize
+
+QUERIES = ["ICS", "ics/laba", "biologic", "OCS", "symbicort", "advair", "Budesonide", "albuterol sulfate",
+           "montelukast 10", "fluticasone", "ondansetron", "hcl", "pf", "mg", "0.9", "zz", "no such drug", ""]
+
+
+@pytest.fixture(scope="module")
+def cohort():
+    return app.compact(app.load_cohort_from_csv())
+
+
+@pytest.fixture(scope="module")
+def index(cohort):
+    return MedIndex(cohort)
+
+
+def brute_match(vocab, query):
+    """match() by scanning the whole vocabulary."""
+    q = query.strip().lower()
+    if not q:
+        return []
+    info = [normalize(m) for m in vocab]
+    if q in {c.lower() for c in CLASS_NAMES} and any(q in map(str.lower, i["classes"]) for i in info):
+        return [c for c, i in enumerate(info) if q in map(str.lower, i["classes"])]
+    want = normalize(q)
+    hits = []
+    for c, (m, i) in enumerate(zip(vocab, info)):
+        text = f"{m.lower()}\n{i['key']}"
+        if (want["ingredients"] and set(want["ingredients"]) <= set(i["ingredients"])) \
+                or q in text or (want["key"] and want["key"] in text):
+            hits.append(c)
+    return hits
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_match_and_records_equal_a_full_scan(cohort, index, query):
+    codes = brute_match(cohort.vocab, query)
+    assert index.match(query).tolist() == codes
+    off, meds_codes = np.asarray(cohort.arrays["meds_off"]), np.asarray(cohort.arrays["meds_codes"])
+    records = [r for r in range(len(off) - 1) if set(meds_codes[off[r]:off[r + 1]].tolist()) & set(codes)]
+    assert index.records(index.match(query)).tolist() == records
+    res = index.search(query)
+    assert res["n_records"] == len(records)
+    assert res["n_patients"] == len({int(cohort.arrays["meds_pid"][r]) for r in records})
+
+
+def test_normalize():
+    assert normalize("SYMBICORT 160-4.5 MCG/ACTUATION HFA AEROSOL INHALER") == \
+        {"key": "budesonide+formoterol", "ingredients": ["budesonide", "formoterol"], "classes": ["ICS", "ICS/LABA", "LABA"]}
+    assert normalize("ONDANSETRON HCL 4 MG TABLET")["key"] == "ondansetron hcl"
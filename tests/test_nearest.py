@@ -0,0 +1,31 @@
+import math
+import random
+
+from compact_cohort import nearest_by_date
+
+
+def linear_scan(dates, target):
+    """The page's former closest-record loop: undated records are at distance 0, ties keep the first."""
+    best, best_dist = None, math.inf
+    for i, d in enumerate(dates):
+        d = target if d != d else d
+        if abs(d - target) < best_dist:
+            best, best_dist = i, abs(d - target)
+    return best
+
+
+def test_matches_linear_scan():
+    rng = random.Random(0)
+    for _ in range(500):
+        # duplicate dates, exact hits, and undated records (sorted last, as the loaders emit them)
+        dated = sorted(rng.choice(range(-20, 40, rng.choice((1, 3, 7)))) for _ in range(rng.randint(0, 12)))
+        dates = dated + [math.nan] * rng.choice((0, 0, 1, 2))
+        targets = [rng.uniform(-30, 50) for _ in range(5)] + [float(d) for d in dated[:3]]
+        assert nearest_by_date(dates, targets) == [linear_scan(dates, t) for t in targets], dates
+
+
+def test_edge_cases():
+    assert nearest_by_date([], [1.0, 2.0]) == [None, None]
+    assert nearest_by_date([math.nan, math.nan], [5.0]) == [0]
+    assert nearest_by_date([1.0, 3.0], [2.0]) == [0]  # a tie goes to the earlier record
+    assert nearest_by_date([1.0, 1.0, 5.0], [2.0]) == [0]
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+import app
+from note_search import NoteSearch
+
+
+@pytest.fixture(scope="module")
+def cohort():
+    return app.compact(app.load_cohort_from_csv())
+
+
+def test_builds_and_finds_a_note(tmp_path, cohort):
+    index = NoteSearch(tmp_path, cohort)
+    index.ensure_built(background=False)
+    assert index.ready and index.error is None
+    word = next(w for w in cohort.note_text(cohort.pids[0], 0).split() if w.isalpha() and len(w) > 4)
+    assert index.search(word)["total"] > 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_can_build_while_the_parent_holds_the_lock(tmp_path, cohort):
+    index = NoteSearch(tmp_path, cohort)
+    with index._build_lock:  # as if the parent's build thread were running at fork
+        pid = os.fork()
+        if pid == 0:
+            index.after_fork()
+            index.ensure_built(background=False)
+            os._exit(0 if index.ready else 1)
+        _, status = os.waitpid(pid, 0)
+    assert status == 0 and index.ready
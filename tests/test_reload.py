@@ -0,0 +1,61 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    """Copies of the three source CSVs, with app pointed at them."""
+    paths = {}
+    for name, attr in (("notes", "CSV_FILE_NOTES"), ("labs", "CSV_FILE_LABS"), ("meds", "MEDS_CSV")):
+        paths[name] = tmp_path / f"{name}.csv"
+        shutil.copy(getattr(app, attr), paths[name])
+        monkeypatch.setattr(app, attr, paths[name])
+    monkeypatch.setattr(app, "USE_COHORT_CACHE", False)
+    return paths
+
+
+def state(cohort):
+    return cohort.data.to_data(), cohort.patient_ids, {pid: cohort.patient_payload(pid).etag for pid in cohort.patient_ids}
+
+
+def full_load():
+    return app.Cohort(app.compact(app.load_cohort_from_csv()))
+
+
+def edit(path, fn):
+    df = pd.read_csv(path, dtype={"PATIENTHASHMRN": str}, low_memory=False)
+    fn(df).to_csv(path, index=False)
+
+
+def reloaded(reloader):
+    assert reloader.poll() is False  # the first sighting waits for the file to settle
+    assert reloader.poll() is True
+    return reloader.store.get()
+
+
+def test_partial_reload_equals_a_full_load(sources):
+    reloader = app.Reloader(None)
+    reloader.store = app.DataStore(reloader.load)
+    first = reloader.store.get()
+    assert reloader.poll() is False
+    pid0, pid1 = first.patient_ids[:2]
+
+    def set_text(df):
+        df.loc[df.PATIENTHASHMRN == pid0, "DEIDENTIFIED_TEXT"] = "edited note text"
+        return df
+    edit(sources["notes"], set_text)
+    after_notes = reloaded(reloader)
+    assert after_notes is not first
+    assert state(after_notes) == state(full_load())
+
+    def set_age(df):
+        df.loc[df.PATIENTHASHMRN == pid1, "AGE"] = 99
+        return df
+    edit(sources["labs"], set_age)
+    edit(sources["meds"], lambda df: df[df.PATIENTHASHMRN != pid0])
+    after_both = reloaded(reloader)
+    assert state(after_both) == state(full_load())
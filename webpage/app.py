@@ -1,12 +1,19 @@
 # app.py
-from flask import Flask, render_template_string
+from flask import Flask, render_template, request
+from functools import lru_cache
 import pandas as pd
 import json
 from pathlib import Path
 import re
 import os
+import sys
 from pathlib import Path
 
+# shared with the main app one directory up: pre-compressed payloads + hashed static assets
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from payload import Payload, send_payload  # noqa: E402
+from static_assets import StaticAssets  # noqa: E402
+
 CSV_FILE_NOTES = Path(os.getenv("CSV_FILE_NOTES", "Asthma_Symp.csv"))
 CSV_FILE_LABS  = Path(os.getenv("CSV_FILE_LABS",  "symptom_patient_merged.csv"))
 # -----------------------------
@@ -451,753 +458,29 @@ def build_bio_events(flat_list, valid_patients):
 BIO_EVENTS = build_bio_events(Patient_bio_used_with_data, set(PATIENTS.keys()))
 
 # -----------------------------
-# Template (Ocean palette + larger padding/background)
+# Page: templates/timeline.html + static/timeline.{css,js}; the data is a generated data.js,
+# so the browser caches it under its content hash instead of re-downloading it in every page
 # -----------------------------
-TEMPLATE = """
-<!doctype html>
-<html lang="en">
-<head>
-  <meta charset="utf-8">
-  <title>Patient Timeline & Biological Propriety (Offline)</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <style>
-    :root{
-      /* Fixed Ocean palette */
-      --border:#cfe0f5; --muted:#eef4ff; --bg:#f1f7ff; --pagebg:#f7fbff; --text:#0b1220;
-      --accent:#0ea5e9; --primary:#2563eb; --red:#f43f5e;
-      --good:#10b981; --bad:#ef4444; --unk:#64748b;
-      --tile1:#e0f2fe; --tile1b:#93c5fd;
-      --tile2:#e2e8f0; --tile2b:#94a3b8;
-      --tile3:#e8f5e9; --tile3b:#86efac;
-      --purple:#6366f1; --purpleD:#4f46e5;
-    }
-    body{ font-family: Arial, sans-serif; color:var(--text); background:var(--pagebg); margin:0; padding:24px; }
-    h2,h3{ margin:8px 0; }
-    .small{ color:#555; font-size:13px; }
-
-    .row{ display:flex; gap:28px; align-items:flex-start; }
-    .left{ flex:0 0 58%; display:flex; flex-direction:column; gap:14px; }
-    .right{ flex:1; display:flex; flex-direction:column; gap:14px; }
-
-    .card{ border:1px solid var(--border); border-radius:14px; background:#fff; padding:16px; box-shadow:0 2px 6px rgba(15,23,42,.06); }
-    .card.resizable{ resize:both; overflow:auto; min-width:280px; min-height:180px; }
-    .panel-head{ display:flex; justify-content:space-between; align-items:center; padding-bottom:10px; margin-bottom:12px; border-bottom:1px solid var(--border); }
-    .panel-title{ font-size:20px; font-weight:700; letter-spacing:.2px; }
-
-    .box{ height:440px; overflow-y:auto; padding:14px; background:var(--bg); border:1px solid var(--border); border-radius:10px; white-space:pre-wrap; line-height:1.45; font-family:'Times New Roman', serif; font-size:16px; }
-    .box.resizable{ resize:vertical; min-height:180px; }
-
-    .controls{ display:flex; gap:10px; flex-wrap:wrap; align-items:center; }
-    .controls-stack{ display:flex; flex-direction:column; gap:6px; }
-    select{ padding:8px 10px; border-radius:10px; border:1px solid #cbd5e1; background:#fff; }
-    button{ padding:10px 16px; border:1px solid #bbb; background:#fff; border-radius:10px; cursor:pointer; }
-    button.primary{ background:var(--primary); color:#fff; border-color:var(--primary); }
-    button.ghost{ background:#fff; }
-    .btn-purple{ background:var(--purple); color:#fff; border:1px solid var(--purple); }
-    .btn-purple:hover{ background:var(--purpleD); border-color:var(--purpleD); }
-
-    /* Annotator badge/input */
-    .annotator { display:flex; align-items:center; gap:10px; }
-    .badge { background:var(--muted); border:1px solid var(--border); color:#0b1220; padding:6px 10px; border-radius:999px; font-weight:700; }
-    .annotator input { padding:8px 10px; border-radius:10px; border:1px solid #cbd5e1; }
-
-    /* Biologic section */
-    .bio-group{ display:flex; flex-direction:column; gap:8px; border:1px solid var(--border); border-radius:10px; padding:10px; background:var(--muted); }
-    .bio-line{ display:flex; gap:14px; align-items:center; flex-wrap:wrap; }
-    .bio-line label{ font-weight:600; }
-    .bio-line input[type="radio"]{ transform:scale(1.05); }
-    .bio-extra{ display:none; gap:12px; align-items:center; flex-wrap:wrap; }
-    .bio-extra input[type="date"]{ padding:8px 10px; border-radius:8px; border:1px solid #cbd5e1; }
-
-    /* Timeline */
-    #timeline-section{ border:1px solid var(--border); border-radius:14px; padding:10px 14px; background:#fff; margin:10px 0 12px 0; box-shadow:0 1px 4px rgba(15,23,42,.05); }
-    .timeline{ position:relative; height:68px; border-top:4px solid var(--accent); border-radius:2px; margin:12px 6px 6px 6px; }
-    .dot{ width:14px; height:14px; border-radius:50%; position:absolute; transform:translateX(-50%); }
-    .dot.blue{ background:#175b82; border:2px solid #0b2f41; }
-    .dot.red{ background:var(--red); border:2px solid #9a1212; }
-    .dot.bio{ width:12px; height:12px; background:var(--good); border:2px solid #065f46; border-radius:2px; transform:translateX(-50%) rotate(45deg); }
-    .date-label{ position:absolute; top:28px; transform:translateX(-50%); font-size:12px; color:#111; white-space:nowrap; background:#fff; padding:1px 3px; border-radius:3px; border:1px solid #eee; }
-
-    /* Demographics */
-    .demog-grid{ display:grid; grid-template-columns:repeat(3,1fr); gap:12px; }
-    .tile{ border-radius:14px; padding:14px; }
-    .tile h4{ margin:0 0 6px 0; font-size:14px; color:#334155; text-align:left; }
-    .tile .value{ font-size:28px; font-weight:600; text-align:left; }
-
-    /* Tables */
-    .labs-table{ width:100%; border-collapse:collapse; }
-    .labs-table th, .labs-table td{ border:1px solid #e5e7eb; padding:12px 14px; text-align:left; }
-    .labs-table thead th{ background:var(--muted); font-size:14px; }
-    .labs-table tbody td, .labs-table tbody th{ font-size:16px; }
-
-    /* Symptoms */
-    .sym-grid{ display:grid; grid-template-columns:40px 40px 1fr; gap:8px 12px; align-items:center; }
-    .sym-head{ font-weight:700; }
-    .icon{ display:inline-block; width:20px; height:20px; line-height:20px; text-align:center; font-weight:800; font-size:16px; }
-    .icon.good{ color:var(--good); } .icon.bad{ color:var(--bad); } .icon.unk{ color:var(--unk); }
-
-    .header-line{ display:flex; justify-content:space-between; align-items:flex-start; margin-bottom:6px; }
-    .patient-id{ font-weight:700; font-size:16px; }
-    .muted{ color:#666; }
-    textarea.notes{ width:100%; min-height:120px; resize:vertical; padding:12px; border:1px solid var(--border); border-radius:10px; font-size:14px; line-height:1.45; }
-  </style>
-</head>
-<body>
-  <div class="header-line">
-    <div>
-      <div class="patient-id">Patient: <span id="patient-id"></span>
-        <span class="small muted" id="patient-pos"></span>
-        <span class="small muted" id="bio-flag"></span>
-      </div>
-      <div class="annotator" id="annotator-ui"></div>
-    </div>
-    <div class="controls-stack">
-      <div class="controls">
-        <button id="prev-patient-btn">⬅️ Previous Patient</button>
-        <select id="patient-select"></select>
-        <button id="next-patient-btn">Next Patient ➡️</button>
-      </div>
-      <div class="controls">
-        <button class="ghost" id="prev-btn">⬅️ Previous Text</button>
-        <button class="ghost" id="next-btn">Next Text ➡️</button>
-      </div>
-    </div>
-  </div>
-
-  <div id="timeline-section">
-    <div class="small"><strong>Time Line</strong>: blue = notes; red = selected; <span style="color:#065f46;">green diamonds</span> = biologic use (added)</div>
-    <div id="timeline" class="timeline"></div>
-  </div>
-
-  <div class="row">
-    <div class="left">
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Note Text</div>
-          <button id="friendly-btn" class="btn-purple">👁 Friendly View</button>
-        </div>
-        <div id="text-box" class="box resizable"></div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Annotator Note & Biologic Form</div>
-        </div>
-        <textarea id="free-note" class="notes" placeholder="Write your note..."></textarea>
-
-        <!-- Biologic section -->
-        <div class="bio-group" style="margin-top:10px;">
-          <div class="bio-line">
-            <label>Biologic use (y/n):</label>
-            <label><input type="radio" name="bioUse" id="bioUseNo" value="no" checked> No</label>
-            <label><input type="radio" name="bioUse" id="bioUseYes" value="yes"> Yes</label>
-          </div>
-
-          <div id="bio-yes-extra" class="bio-extra">
-            <label>Start: <input type="date" id="bioStart"></label>
-            <label>End: <input type="date" id="bioEnd"></label>
-          </div>
-
-          <div id="bio-no-extra" class="bio-extra" style="display:flex;">
-            <div class="bio-line">
-              <label>Is patient a candidate for biologic therapy? (y/n):</label>
-              <label><input type="radio" name="bioCand" id="bioCandNo" value="no" checked> No</label>
-              <label><input type="radio" name="bioCand" id="bioCandYes" value="yes"> Yes</label>
-            </div>
-          </div>
-        </div>
-
-        <div class="controls" style="margin-top:10px;">
-          <button class="primary" id="save-annotation">Save Annotation</button>
-          <button id="export-txt" class="ghost">💾 Save to TXT</button>
-        </div>
-        <div class="small muted">Saved locally in your browser (offline).</div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Annotations </div>
-        </div>
-        <div id="no-anns" class="small">No annotations yet.</div>
-        <div style="overflow-x:auto; display:none;" id="ann-table-wrap">
-          <table class="labs-table">
-            <thead>
-              <tr>
-                <th>PATIENTHASHMRN</th>
-                <th>Note Date</th>
-                <th>Biologic Use</th>
-                <th>Date Range</th>
-                <th>Candidate?</th>
-                <th>Free Note</th>
-                <th>Annotator</th>
-                <th>Action</th>
-              </tr>
-            </thead>
-            <tbody id="ann-body"></tbody>
-          </table>
-        </div>
-      </div>
-    </div>
-
-    <div class="right">
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Demographics</div>
-        </div>
-        <div id="demo-content" class="demog-grid"></div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Spirometry & Labs (closest to selected note)</div>
-        </div>
-        <div id="lab-content"></div>
-      </div>
-
-      <div class="card resizable">
-        <div class="panel-head">
-          <div class="panel-title">Symptoms (from symptom_patient_merged.csv)</div>
-        </div>
-        <div class="small" style="margin-bottom:8px;">
-          <span class="icon good">✓</span> present (1) &nbsp;&nbsp;
-          <span class="icon bad">✕</span> absent (0) &nbsp;&nbsp;
-          <span class="icon unk">?</span> unknown
-        </div>
-        <div id="sym-content"></div>
-      </div>
-    </div>
-  </div>
-
-<script>
-  // --------- Embedded data ----------
-  const PATIENTS = {{ patients_json|safe }};
-  const LABS = {{ labs_json|safe }};
-  const DEMO = {{ demo_json|safe }};
-  const LAB_FIELDS = {{ lab_fields_json|safe }};
-  const SYM_GROUPS = {{ sym_groups_json|safe }};
-  const SYM_ORDER = {{ sym_order_json|safe }};
-  const REF_RANGES = {{ ref_ranges_json|safe }};
-  const BIO = {{ bio_json|safe }};  // { pid: [dates...] }
-
-  const PATIENT_IDS = Object.keys(PATIENTS);
-  let currentPatient = PATIENT_IDS[0] || "";
-  let pos = 0;
-  let friendlyMode = false;
-  function lockBioRadioForPatient(){
-    const yes = document.getElementById("bioUseYes");
-    const no  = document.getElementById("bioUseNo");
-    const hasBio = Array.isArray(BIO[currentPatient]) && BIO[currentPatient].length > 0;
-
-    if (hasBio){
-      // Lock to YES
-      yes.checked = true;  no.checked = false;
-      yes.disabled = true; no.disabled = true;
-
-      // Show date range inputs, hide candidate UI
-      document.getElementById("bio-yes-extra").style.display = "flex";
-      document.getElementById("bio-no-extra").style.display  = "none";
-    } else {
-      // Lock to NO
-      yes.checked = false; no.checked = true;
-      yes.disabled = true; no.disabled = true;   // <— lock to false, per your request
-
-      // Hide date range inputs, show candidate UI
-      document.getElementById("bio-yes-extra").style.display = "none";
-      document.getElementById("bio-no-extra").style.display  = "flex";
-    }
-  }
-  /* ---------- Annotator name (with Change button) ---------- */
-  function getAnnotator(){ return localStorage.getItem("annotator_name") || ""; }
-  function setAnnotator(name){ localStorage.setItem("annotator_name", name); }
-  function renderAnnotatorUI(){
-    const host = document.getElementById("annotator-ui");
-    host.innerHTML = "";
-    const name = getAnnotator();
-    if (name){
-      const badge = document.createElement("div");
-      badge.className = "badge";
-      badge.textContent = "Annotator: " + name;
-      const changeBtn = document.createElement("button");
-      changeBtn.className = "ghost";
-      changeBtn.textContent = "Change";
-      changeBtn.onclick = () => {
-        const v = prompt("Set annotator name:", name);
-        if (v === null) return; // cancel
-        const trimmed = (v || "").trim();
-        if (!trimmed){ alert("Annotator cannot be empty."); return; }
-        setAnnotator(trimmed);
-        renderAnnotatorUI();
-      };
-      host.appendChild(badge);
-      host.appendChild(changeBtn);
-      return;
-    }
-    const inp = document.createElement("input");
-    inp.id = "annotator-input";
-    inp.placeholder = "Your name (saved)";
-    const btn = document.createElement("button");
-    btn.className = "primary";
-    btn.textContent = "Set";
-    btn.onclick = () => {
-      const v = (document.getElementById("annotator-input").value || "").trim();
-      if (!v){ alert("Please enter annotator name."); return; }
-      setAnnotator(v);
-      renderAnnotatorUI();
-    };
-    host.appendChild(inp);
-    host.appendChild(btn);
-  }
-
-  /* ---------- Helpers ---------- */
-  function el(tag, attrs={}, text=null){ const e=document.createElement(tag); Object.entries(attrs).forEach(([k,v])=>e.setAttribute(k,v)); if(text!==null) e.textContent=text; return e; }
-  const titleCase = s => s.replace(/\\b\\w/g, c => c.toUpperCase());
-
-  /* ---------- Patient nav ---------- */
-  function renderPatientSelect(){
-    const sel=document.getElementById("patient-select"); sel.innerHTML="";
-    PATIENT_IDS.forEach(pid=>{ const o=el("option",{},pid); o.value=pid; if(pid===currentPatient) o.selected=true; sel.appendChild(o); });
-    sel.onchange=()=>switchPatient(sel.value);
-  }
-  function renderHeader(){
-    document.getElementById("patient-id").textContent=currentPatient;
-    const total=PATIENTS[currentPatient]?.notes?.length||0;
-    document.getElementById("patient-pos").textContent= total ? ` (note ${pos+1} of ${total})` : "";
-    const biolist = BIO[currentPatient] || [];
-    document.getElementById("bio-flag").textContent = biolist.length ? ` | Biologic use: ${biolist.length} date(s)` : "";
-  }
-
-  /* ---------- Text & timeline ---------- */
-  function renderText(){
-    const note = PATIENTS[currentPatient].notes[pos];
-    const box  = document.getElementById("text-box");
-    const btn  = document.getElementById("friendly-btn");
-    const txt  = friendlyMode && note.pretty ? note.pretty : (note.text || "");
-    box.textContent = txt;
-    box.scrollTop = 0;
-    btn.textContent = friendlyMode ? "🔤 Raw View" : "👁 Friendly View";
-  }
-  function renderTimeline(){
-    const section = document.getElementById("timeline-section");
-    const tl = document.getElementById("timeline");
-    tl.innerHTML="";
-    const P = PATIENTS[currentPatient];
-    const count = (P.notes || []).length;
-    const B = BIO[currentPatient] || [];
-
-    if (count <= 1 && B.length === 0){ section.style.display="none"; return; }
-    section.style.display="block";
-
-    // Extend min/max to include biologic-use dates
-    let minD = P.min_date, maxD = P.max_date;
-    if (B.length){
-      const bmin = Math.min.apply(null, B);
-      const bmax = Math.max.apply(null, B);
-      if (bmin < minD) minD = bmin;
-      if (bmax > maxD) maxD = bmax;
-    }
-    const span = (maxD - minD) || 1;
-
-    const slots = {};
-    // notes
-    (P.notes||[]).forEach((n,i)=>{
-      const pct = ((n.date - minD) / span) * 100;
-      const key = Math.round(pct*10)/10;
-      const stack = (slots[key]||0); slots[key] = stack + 1;
-
-      const d=el("div",{class:"dot "+(i===pos?"red":"blue")});
-      d.style.left = pct + "%";
-      d.style.top  = (-6 - stack*16) + "px";
-      d.title = "ENCDATEDIFFNO: " + n.date;
-      d.onclick = ()=>{ pos=i; renderAllForNote(); };
-      tl.appendChild(d);
-
-      const lab=el("div",{class:"date-label"});
-      lab.style.left = pct + "%";
-      lab.textContent = String(n.date);
-      tl.appendChild(lab);
-    });
-
-    // biologic-use markers (green diamonds)
-    B.forEach((bd)=>{
-      const pct = ((bd - minD) / span) * 100;
-      const key = Math.round(pct*10)/10;
-      const stack = (slots[key]||0); slots[key] = stack + 1;
-
-      const m=el("div",{class:"dot bio"});
-      m.style.left = pct + "%";
-      m.style.top  = (-6 - stack*16) + "px";
-      m.title = "Biologic use date: " + bd;
-
-      // Optional: jump to the closest note when clicking the bio marker
-      m.onclick = ()=>{
-        let bestI = 0, bestDist = Infinity;
-        (P.notes||[]).forEach((n,i)=>{
-          const dist = Math.abs((n.date ?? bd) - bd);
-          if (dist < bestDist){ bestDist = dist; bestI = i; }
-        });
-        pos = bestI;
-        renderAllForNote();
-      };
-      tl.appendChild(m);
-    });
-  }
-
-  /* ---------- Labs, demo, symptoms ---------- */
-  function valText(v){
-    if (v===null || typeof v==="undefined" || v==="") return "—";
-    if (typeof v === "number") return (Math.abs(v - Math.trunc(v)) < 1e-9) ? String(Math.trunc(v)) : String(Number(v.toFixed(3)));
-    return String(v);
-  }
-  function sexText(v){
-    if (v===null || v===undefined || v==="") return "—";
-    const s=String(v).trim().toLowerCase();
-    if (s==="0" || s==="0.0") return "Female";
-    if (s==="1" || s==="1.0") return "Male";
-    return s.toUpperCase() in {"F":1,"M":1} ? (s.toUpperCase()==="F"?"Female":"Male") : s;
-  }
-  function renderDemographics(){
-    const d=DEMO[currentPatient]||{};
-    const host=document.getElementById("demo-content"); host.innerHTML="";
-    const tiles=[
-      {title:"Age", value:d.AGE,  bg:"var(--tile1)", bd:"var(--tile1b)"},
-      {title:"Sex", value:sexText(d.SEX),  bg:"var(--tile2)", bd:"var(--tile2b)"},
-      {title:"BMI", value:d.BMI,  bg:"var(--tile3)", bd:"var(--tile3b)"},
-    ];
-    tiles.forEach(t=>{
-      const div=document.createElement("div");
-      div.className="tile";
-      div.style.background=t.bg;
-      div.style.border=`1px solid ${t.bd}`;
-      const h4=document.createElement("h4"); h4.textContent=t.title;
-      const v=document.createElement("div"); v.className="value";
-      v.textContent=(t.value==null||t.value==="")?"—":String(t.value);
-      div.appendChild(h4); div.appendChild(v); host.appendChild(div);
-    });
-  }
-  function closestLabRec(pid, targetDate){
-    const arr=LABS[pid]||[]; let best=null, bestDist=Infinity;
-    for(const r of arr){ const d=(r.date==null? targetDate : r.date); const dist=Math.abs(d-targetDate); if(dist<bestDist){ best=r; bestDist=dist; } }
-    return best;
-  }
-  function renderLabsForCurrentNote(){
-    const pid=currentPatient;
-    const targetDate=PATIENTS[pid].notes[pos].date;
-    const best=closestLabRec(pid, targetDate);
-    const host=document.getElementById("lab-content");
-    if(!best){ host.innerHTML='<div class="small muted">No lab/spirometry record for this patient.</div>'; return; }
-
-    let html=`
-      <table class="labs-table">
-        <thead>
-          <tr><th>Lab Result</th><th>Your Value</th><th>Typical Reference Range (Adults)</th></tr>
-        </thead>
-        <tbody>
-          <tr><th>Closest DATE_DIF</th><td>${valText(best.date)}</td><td>—</td></tr>
-    `;
-    LAB_FIELDS.forEach(f=>{
-      const v = best.hasOwnProperty(f)? best[f] : null;
-      const rawRef = (REF_RANGES && REF_RANGES[f]) ? REF_RANGES[f] : "—";
-      const ref = (()=>{
-        const low = String(rawRef).toLowerCase();
-        if (low.includes("varies") || low.includes("no single")) return "—";
-        const tokens = String(rawRef).match(/\\d+(?:\\.\\d+)?%?/g) || [];
-        if (tokens.length === 0) return "—";
-        if (tokens.length === 1) return tokens[0];
-        return tokens.slice(0,2).join(" - ");
-      })();
-      html += `<tr><th>${f}</th><td>${valText(v)}</td><td>${ref}</td></tr>`;
-    });
-    html += "</tbody></table>";
-    host.innerHTML = html;
-  }
-  function iconHTML(v){
-    if (v===1 || v==="1") return '<span class="icon good">✓</span>';
-    if (v===0 || v==="0") return '<span class="icon bad">✕</span>';
-    return '<span class="icon unk">?</span>';
-  }
-  function renderSymptoms(){
-    const pid=currentPatient;
-    const targetDate=PATIENTS[pid].notes[pos].date;
-    const best=closestLabRec(pid, targetDate);
-    const host=document.getElementById("sym-content"); host.innerHTML="";
-    if(!best){ host.innerHTML='<div class="small muted">No symptom row found for this date.</div>'; return; }
-
-    const wrap=el("div",{class:"sym-grid"});
-    wrap.appendChild(el("div",{class:"sym-head"},"Previ."));
-    wrap.appendChild(el("div",{class:"sym-head"},"Curr."));
-    wrap.appendChild(el("div",{class:"sym-head"},"Symptom"));
-
-    const SYM_ORDER = {{ sym_order_json|safe }};
-    const SYM_GROUPS = {{ sym_groups_json|safe }};
-
-    SYM_ORDER.forEach(base=>{
-      const group=SYM_GROUPS[base]; if(!group) return;
-      const rawLabel=base.replaceAll("_"," ").replace("general asthma symptoms worsening current","general asthma symptoms worsening");
-      const label=titleCase(rawLabel);
-
-      const pv=(group.previous && (group.previous in best))? best[group.previous] : null;
-      const cv=(group.current  && (group.current  in best))? best[group.current ] : null;
-
-      const pcell=el("div"); pcell.innerHTML = iconHTML(pv);
-      const ccell=el("div"); ccell.innerHTML = iconHTML(cv);
-
-      wrap.appendChild(pcell);
-      wrap.appendChild(ccell);
-      wrap.appendChild(el("div",{},label));
-    });
-    host.appendChild(wrap);
-  }
-
-  /* ---------- Annotation storage ---------- */
-  function loadPatientAnnotations(pid){
-    try { return JSON.parse(localStorage.getItem("ann_"+pid)) || []; } catch(e){ return []; }
-  }
-  function savePatientAnnotations(pid, arr){
-    try { localStorage.setItem("ann_"+pid, JSON.stringify(arr)); } catch(e){}
-  }
-
-  // Robust delete: by ts if present, else fingerprint
-  function deleteAnnotation(pid, ts, fp){
-    const arr = loadPatientAnnotations(pid);
-
-    // If timestamp present, use it
-    if (ts) {
-      const newArr = arr.filter(r => String(r.ts || "") !== String(ts || ""));
-      savePatientAnnotations(pid, newArr);
-      return;
-    }
-    // Fallback: fingerprint (works for legacy rows)
-    let removed = false;
-    const newArr = arr.filter(r => {
-      if (removed) return true;
-      const match =
-        String(r.date)            === String(fp.date) &&
-        String(r.annotator||"")   === String(fp.annotator||"") &&
-        String(r.note||"")        === String(fp.note||"") &&
-        String(!!r.bioUse)        === String(!!fp.bioUse) &&
-        String(r.bioStart||"")    === String(fp.bioStart||"") &&
-        String(r.bioEnd||"")      === String(fp.bioEnd||"") &&
-        (fp.bioUse ? true : String(!!(r.bioCand)) === String(!!(fp.bioCand)));
-      if (match) { removed = true; return false; }
-      return true;
-    });
-    savePatientAnnotations(pid, newArr);
-  }
-
-  function loadAllAnnotations(){
-    const out=[];
-    for (let i=0;i<localStorage.length;i++){
-      const k = localStorage.key(i);
-      if (k && k.startsWith("ann_")){
-        try{
-          const pid = k.slice(4);
-          const arr = JSON.parse(localStorage.getItem(k) || "[]");
-          arr.forEach(r => out.push({...r, pid}));
-        }catch(e){}
-      }
-    }
-    out.sort((a,b)=> (b.ts||0)-(a.ts||0) || (b.date||0)-(a.date||0));
-    return out;
-  }
-  function renderAnnTable(){
-    const anns=loadAllAnnotations();
-    const wrap=document.getElementById("ann-table-wrap");
-    const empty=document.getElementById("no-anns");
-    const body=document.getElementById("ann-body");
-    if(anns.length===0){ wrap.style.display="none"; empty.style.display="block"; body.innerHTML=""; return; }
-    empty.style.display="none"; wrap.style.display="block"; body.innerHTML="";
-    anns.forEach(a=>{
-      const tr=el("tr");
-      tr.appendChild(el("td",{}, a.pid));
-      tr.appendChild(el("td",{}, String(a.date)));
-      tr.appendChild(el("td",{}, a.bioUse ? "Yes" : "No"));
-      const dr = (a.bioUse && (a.bioStart||a.bioEnd)) ? `${a.bioStart||""} - ${a.bioEnd||""}` : "—";
-      tr.appendChild(el("td",{}, dr));
-      tr.appendChild(el("td",{}, (a.bioUse ? "—" : (a.bioCand ? "Yes" : "No"))));
-      tr.appendChild(el("td",{}, a.note || ""));
-      tr.appendChild(el("td",{}, a.annotator || "—"));
-
-      const delTd = el("td");
-      const btn = el("button", {
-        type:"button",
-        class:"ghost ann-del",
-        "data-pid": a.pid,
-        "data-ts":  String(a.ts || ""),
-        "data-date": String(a.date ?? ""),
-        "data-annotator": a.annotator || "",
-        "data-note": a.note || "",
-        "data-bious": a.bioUse ? "1" : "0",
-        "data-biostart": a.bioUse ? (a.bioStart || "") : "",
-        "data-bioend":   a.bioUse ? (a.bioEnd   || "") : "",
-        "data-biocand":  a.bioUse ? "" : (a.bioCand ? "1" : "0")
-      }, "🗑 Remove");
-      delTd.appendChild(btn);
-      tr.appendChild(delTd);
-
-      body.appendChild(tr);
-    });
-  }
-
-  /* ---------- Export to TXT ---------- */
-  function downloadTxt(filename, text){
-    const blob = new Blob([text], {type:"text/plain"});
-    const url = URL.createObjectURL(blob);
-    const a = document.createElement("a");
-    a.href = url; a.download = filename; a.click();
-    URL.revokeObjectURL(url);
-  }
-  function exportAnnotations(){
-    const who = getAnnotator();
-    if (!who){ alert("Please set the annotator name first."); return; }
-    const anns = loadAllAnnotations();
-    let lines = [];
-    lines.push(`Annotator: ${who}`);
-    lines.push(`Exported: ${new Date().toISOString()}`);
-    lines.push("");
-    anns.forEach(a=>{
-      lines.push(`PATIENT: ${a.pid}`);
-      lines.push(`NoteDate: ${a.date}`);
-      lines.push(`BiologicUse: ${a.bioUse ? "Yes" : "No"}`);
-      if (a.bioUse){
-        lines.push(`DateRange: ${a.bioStart||""} - ${a.bioEnd||""}`);
-      } else {
-        lines.push(`Candidate: ${a.bioCand ? "Yes" : "No"}`);
-      }
-      if (a.note) lines.push(`Note: ${a.note}`);
-      lines.push(`---`);
-    });
-    downloadTxt(`${who}_annotations.txt`, lines.join("\\n"));
-  }
-
-  /* ---------- Navigation ---------- */
-  function nextNote(){ pos=(pos+1)%PATIENTS[currentPatient].notes.length; renderAllForNote(); }
-  function prevNote(){ pos=(pos-1+PATIENTS[currentPatient].notes.length)%PATIENTS[currentPatient].notes.length; renderAllForNote(); }
-  function nextPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i+1)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
-  function prevPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i-1+PATIENT_IDS.length+PATIENT_IDS.length)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
-  function switchPatient(pid){
-    currentPatient=pid; pos=0;
-    document.getElementById("free-note").value="";
-    // reset biologic UI to defaults
-    document.getElementById("bioUseNo").checked = true;
-    document.getElementById("bioUseYes").checked = false;
-    document.getElementById("bio-yes-extra").style.display = "none";
-    document.getElementById("bio-no-extra").style.display  = "flex";
-    document.getElementById("bioCandNo").checked = true;
-    document.getElementById("bioCandYes").checked = false;
-    document.getElementById("bioStart").value = "";
-    document.getElementById("bioEnd").value = "";
-    lockBioRadioForPatient();
-    renderAll();
-  }
-
-  /* ---------- Render orchestration ---------- */
-  function renderAll(){
-    renderAnnotatorUI();
-    renderPatientSelect(); renderHeader(); 
-    lockBioRadioForPatient(); // <— add this
-    renderText(); renderTimeline();
-    renderAnnTable(); renderDemographics(); renderLabsForCurrentNote(); renderSymptoms();
-  }
-  function renderAllForNote(){
-    renderHeader(); renderText(); renderTimeline();
-    renderLabsForCurrentNote(); renderSymptoms();
-  }
-
-  /* ---------- Boot ---------- */
-  document.addEventListener("DOMContentLoaded", ()=>{
-    if (PATIENT_IDS.length===0){ alert("No eligible patients (filtered by labs CSV)."); return; }
-    renderAll();
-
-    document.getElementById("next-btn").onclick=(e)=>{ e.preventDefault(); nextNote(); };
-    document.getElementById("prev-btn").onclick=(e)=>{ e.preventDefault(); prevNote(); };
-    document.getElementById("next-patient-btn").onclick=(e)=>{ e.preventDefault(); nextPatient(); };
-    document.getElementById("prev-patient-btn").onclick=(e)=>{ e.preventDefault(); prevPatient(); };
-    document.getElementById("friendly-btn").onclick=()=>{ friendlyMode=!friendlyMode; renderText(); };
-
-    // Biologic UI toggles
-    const useNo = document.getElementById("bioUseNo");
-    const useYes = document.getElementById("bioUseYes");
-    useNo.onchange = () => { if (useNo.checked){ document.getElementById("bio-yes-extra").style.display="none"; document.getElementById("bio-no-extra").style.display="flex"; } };
-    useYes.onchange = () => { if (useYes.checked){ document.getElementById("bio-yes-extra").style.display="flex"; document.getElementById("bio-no-extra").style.display="none"; } };
-
-    // Save annotation
-    document.getElementById("save-annotation").onclick=(e)=>{
-      e.preventDefault();
-      const annotator = getAnnotator();
-      if (!annotator){ alert("Please set the annotator name first."); return; }
-
-      const P = PATIENTS[currentPatient];
-      const note = P.notes[pos];
-      const textNote = document.getElementById("free-note").value || "";
-
-      const bioUse   = document.getElementById("bioUseYes").checked;
-      const bioStart = document.getElementById("bioStart").value || "";
-      const bioEnd   = document.getElementById("bioEnd").value || "";
-      const bioCand  = document.getElementById("bioCandYes").checked;
-
-      const rec = {
-        date: note.date,
-        note: textNote,
-        annotator: annotator,
-        bioUse: !!bioUse,
-        bioStart: bioUse ? bioStart : "",
-        bioEnd:   bioUse ? bioEnd   : "",
-        bioCand:  bioUse ? null : !!bioCand,
-        ts: Date.now()
-      };
-      const arr = loadPatientAnnotations(currentPatient);
-      arr.unshift(rec);
-      savePatientAnnotations(currentPatient, arr);
-      renderAnnTable();
-      alert("Annotation saved.");
-    };
-
-    // Export txt
-    document.getElementById("export-txt").onclick=(e)=>{ e.preventDefault(); exportAnnotations(); };
-
-    // Delete buttons (event delegation)
-    document.getElementById("ann-body").addEventListener("click", (e)=>{
-      const btn = e.target.closest(".ann-del");
-      if (!btn) return;
-      e.preventDefault();
-      const pid = btn.getAttribute("data-pid");
-      const ts  = btn.getAttribute("data-ts");
-
-      const fp = {
-        date: btn.dataset.date,
-        annotator: btn.dataset.annotator || "",
-        note: btn.dataset.note || "",
-        bioUse: btn.dataset.bious === "1",
-        bioStart: btn.dataset.biostart || "",
-        bioEnd: btn.dataset.bioend || "",
-        bioCand: btn.dataset.biocand === "" ? null : (btn.dataset.biocand === "1")
-      };
+ASSETS = StaticAssets(app, Path(__file__).resolve().parent / "static")
+APP_DATA = {
+    "patients": PATIENTS,
+    "labs": LABS_BY_PATIENT,
+    "demo": DEMO_BY_PATIENT,
+    "lab_fields": LAB_COLUMNS_SHOW,
+    "sym_groups": SYM_GROUPS,
+    "sym_order": SYM_ORDER,
+    "ref_ranges": REF_RANGES,
+    "bio": BIO_EVENTS,
+}
+ASSETS.add("data.js", ("window.APP_DATA = " + json.dumps(APP_DATA, ensure_ascii=False) + ";\n").encode("utf-8"))
 
-      if (!pid) return;
-      if (confirm("Remove this annotation?")){
-        deleteAnnotation(pid, ts, fp);
-        renderAnnTable();
-      }
-    });
-  });
-</script>
-</body>
-</html>
-"""
+@lru_cache(maxsize=8)
+def page_payload(script_root, assets_version):
+    return Payload(render_template("timeline.html").encode("utf-8"), mimetype="text/html")
 
 @app.route("/")
 def ui():
-    return render_template_string(
-        TEMPLATE,
-        patients_json=json.dumps(PATIENTS, ensure_ascii=False),
-        labs_json=json.dumps(LABS_BY_PATIENT, ensure_ascii=False),
-        demo_json=json.dumps(DEMO_BY_PATIENT, ensure_ascii=False),
-        lab_fields_json=json.dumps(LAB_COLUMNS_SHOW),
-        sym_groups_json=json.dumps(SYM_GROUPS),
-        sym_order_json=json.dumps(SYM_ORDER),
-        ref_ranges_json=json.dumps(REF_RANGES),
-        bio_json=json.dumps(BIO_EVENTS),
-    )
+    return send_payload(page_payload(request.script_root, ASSETS.version))
 
 def main():
     app.run(debug=True)
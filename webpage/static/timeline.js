@@ -0,0 +1,509 @@
+// --------- Data (data.js, generated by app.py at startup) ----------
+const PATIENTS = APP_DATA.patients;
+const LABS = APP_DATA.labs;
+const DEMO = APP_DATA.demo;
+const LAB_FIELDS = APP_DATA.lab_fields;
+const SYM_GROUPS = APP_DATA.sym_groups;
+const SYM_ORDER = APP_DATA.sym_order;
+const REF_RANGES = APP_DATA.ref_ranges;
+const BIO = APP_DATA.bio;  // { pid: [dates...] }
+
+const PATIENT_IDS = Object.keys(PATIENTS);
+let currentPatient = PATIENT_IDS[0] || "";
+let pos = 0;
+let friendlyMode = false;
+function lockBioRadioForPatient(){
+  const yes = document.getElementById("bioUseYes");
+  const no  = document.getElementById("bioUseNo");
+  const hasBio = Array.isArray(BIO[currentPatient]) && BIO[currentPatient].length > 0;
+
+  if (hasBio){
+    // Lock to YES
+    yes.checked = true;  no.checked = false;
+    yes.disabled = true; no.disabled = true;
+
+    // Show date range inputs, hide candidate UI
+    document.getElementById("bio-yes-extra").style.display = "flex";
+    document.getElementById("bio-no-extra").style.display  = "none";
+  } else {
+    // Lock to NO
+    yes.checked = false; no.checked = true;
+    yes.disabled = true; no.disabled = true;   // <— lock to false, per your request
+
+    // Hide date range inputs, show candidate UI
+    document.getElementById("bio-yes-extra").style.display = "none";
+    document.getElementById("bio-no-extra").style.display  = "flex";
+  }
+}
+/* ---------- Annotator name (with Change button) ---------- */
+function getAnnotator(){ return localStorage.getItem("annotator_name") || ""; }
+function setAnnotator(name){ localStorage.setItem("annotator_name", name); }
+function renderAnnotatorUI(){
+  const host = document.getElementById("annotator-ui");
+  host.innerHTML = "";
+  const name = getAnnotator();
+  if (name){
+    const badge = document.createElement("div");
+    badge.className = "badge";
+    badge.textContent = "Annotator: " + name;
+    const changeBtn = document.createElement("button");
+    changeBtn.className = "ghost";
+    changeBtn.textContent = "Change";
+    changeBtn.onclick = () => {
+      const v = prompt("Set annotator name:", name);
+      if (v === null) return; // cancel
+      const trimmed = (v || "").trim();
+      if (!trimmed){ alert("Annotator cannot be empty."); return; }
+      setAnnotator(trimmed);
+      renderAnnotatorUI();
+    };
+    host.appendChild(badge);
+    host.appendChild(changeBtn);
+    return;
+  }
+  const inp = document.createElement("input");
+  inp.id = "annotator-input";
+  inp.placeholder = "Your name (saved)";
+  const btn = document.createElement("button");
+  btn.className = "primary";
+  btn.textContent = "Set";
+  btn.onclick = () => {
+    const v = (document.getElementById("annotator-input").value || "").trim();
+    if (!v){ alert("Please enter annotator name."); return; }
+    setAnnotator(v);
+    renderAnnotatorUI();
+  };
+  host.appendChild(inp);
+  host.appendChild(btn);
+}
+
+/* ---------- Helpers ---------- */
+function el(tag, attrs={}, text=null){ const e=document.createElement(tag); Object.entries(attrs).forEach(([k,v])=>e.setAttribute(k,v)); if(text!==null) e.textContent=text; return e; }
+const titleCase = s => s.replace(/\b\w/g, c => c.toUpperCase());
+
+/* ---------- Patient nav ---------- */
+function renderPatientSelect(){
+  const sel=document.getElementById("patient-select"); sel.innerHTML="";
+  PATIENT_IDS.forEach(pid=>{ const o=el("option",{},pid); o.value=pid; if(pid===currentPatient) o.selected=true; sel.appendChild(o); });
+  sel.onchange=()=>switchPatient(sel.value);
+}
+function renderHeader(){
+  document.getElementById("patient-id").textContent=currentPatient;
+  const total=PATIENTS[currentPatient]?.notes?.length||0;
+  document.getElementById("patient-pos").textContent= total ? ` (note ${pos+1} of ${total})` : "";
+  const biolist = BIO[currentPatient] || [];
+  document.getElementById("bio-flag").textContent = biolist.length ? ` | Biologic use: ${biolist.length} date(s)` : "";
+}
+
+/* ---------- Text & timeline ---------- */
+function renderText(){
+  const note = PATIENTS[currentPatient].notes[pos];
+  const box  = document.getElementById("text-box");
+  const btn  = document.getElementById("friendly-btn");
+  const txt  = friendlyMode && note.pretty ? note.pretty : (note.text || "");
+  box.textContent = txt;
+  box.scrollTop = 0;
+  btn.textContent = friendlyMode ? "🔤 Raw View" : "👁 Friendly View";
+}
+function renderTimeline(){
+  const section = document.getElementById("timeline-section");
+  const tl = document.getElementById("timeline");
+  tl.innerHTML="";
+  const P = PATIENTS[currentPatient];
+  const count = (P.notes || []).length;
+  const B = BIO[currentPatient] || [];
+
+  if (count <= 1 && B.length === 0){ section.style.display="none"; return; }
+  section.style.display="block";
+
+  // Extend min/max to include biologic-use dates
+  let minD = P.min_date, maxD = P.max_date;
+  if (B.length){
+    const bmin = Math.min.apply(null, B);
+    const bmax = Math.max.apply(null, B);
+    if (bmin < minD) minD = bmin;
+    if (bmax > maxD) maxD = bmax;
+  }
+  const span = (maxD - minD) || 1;
+
+  const slots = {};
+  // notes
+  (P.notes||[]).forEach((n,i)=>{
+    const pct = ((n.date - minD) / span) * 100;
+    const key = Math.round(pct*10)/10;
+    const stack = (slots[key]||0); slots[key] = stack + 1;
+
+    const d=el("div",{class:"dot "+(i===pos?"red":"blue")});
+    d.style.left = pct + "%";
+    d.style.top  = (-6 - stack*16) + "px";
+    d.title = "ENCDATEDIFFNO: " + n.date;
+    d.onclick = ()=>{ pos=i; renderAllForNote(); };
+    tl.appendChild(d);
+
+    const lab=el("div",{class:"date-label"});
+    lab.style.left = pct + "%";
+    lab.textContent = String(n.date);
+    tl.appendChild(lab);
+  });
+
+  // biologic-use markers (green diamonds)
+  B.forEach((bd)=>{
+    const pct = ((bd - minD) / span) * 100;
+    const key = Math.round(pct*10)/10;
+    const stack = (slots[key]||0); slots[key] = stack + 1;
+
+    const m=el("div",{class:"dot bio"});
+    m.style.left = pct + "%";
+    m.style.top  = (-6 - stack*16) + "px";
+    m.title = "Biologic use date: " + bd;
+
+    // Optional: jump to the closest note when clicking the bio marker
+    m.onclick = ()=>{
+      let bestI = 0, bestDist = Infinity;
+      (P.notes||[]).forEach((n,i)=>{
+        const dist = Math.abs((n.date ?? bd) - bd);
+        if (dist < bestDist){ bestDist = dist; bestI = i; }
+      });
+      pos = bestI;
+      renderAllForNote();
+    };
+    tl.appendChild(m);
+  });
+}
+
+/* ---------- Labs, demo, symptoms ---------- */
+function valText(v){
+  if (v===null || typeof v==="undefined" || v==="") return "—";
+  if (typeof v === "number") return (Math.abs(v - Math.trunc(v)) < 1e-9) ? String(Math.trunc(v)) : String(Number(v.toFixed(3)));
+  return String(v);
+}
+function sexText(v){
+  if (v===null || v===undefined || v==="") return "—";
+  const s=String(v).trim().toLowerCase();
+  if (s==="0" || s==="0.0") return "Female";
+  if (s==="1" || s==="1.0") return "Male";
+  return s.toUpperCase() in {"F":1,"M":1} ? (s.toUpperCase()==="F"?"Female":"Male") : s;
+}
+function renderDemographics(){
+  const d=DEMO[currentPatient]||{};
+  const host=document.getElementById("demo-content"); host.innerHTML="";
+  const tiles=[
+    {title:"Age", value:d.AGE,  bg:"var(--tile1)", bd:"var(--tile1b)"},
+    {title:"Sex", value:sexText(d.SEX),  bg:"var(--tile2)", bd:"var(--tile2b)"},
+    {title:"BMI", value:d.BMI,  bg:"var(--tile3)", bd:"var(--tile3b)"},
+  ];
+  tiles.forEach(t=>{
+    const div=document.createElement("div");
+    div.className="tile";
+    div.style.background=t.bg;
+    div.style.border=`1px solid ${t.bd}`;
+    const h4=document.createElement("h4"); h4.textContent=t.title;
+    const v=document.createElement("div"); v.className="value";
+    v.textContent=(t.value==null||t.value==="")?"—":String(t.value);
+    div.appendChild(h4); div.appendChild(v); host.appendChild(div);
+  });
+}
+function closestLabRec(pid, targetDate){
+  const arr=LABS[pid]||[]; let best=null, bestDist=Infinity;
+  for(const r of arr){ const d=(r.date==null? targetDate : r.date); const dist=Math.abs(d-targetDate); if(dist<bestDist){ best=r; bestDist=dist; } }
+  return best;
+}
+function renderLabsForCurrentNote(){
+  const pid=currentPatient;
+  const targetDate=PATIENTS[pid].notes[pos].date;
+  const best=closestLabRec(pid, targetDate);
+  const host=document.getElementById("lab-content");
+  if(!best){ host.innerHTML='<div class="small muted">No lab/spirometry record for this patient.</div>'; return; }
+
+  let html=`
+    <table class="labs-table">
+      <thead>
+        <tr><th>Lab Result</th><th>Your Value</th><th>Typical Reference Range (Adults)</th></tr>
+      </thead>
+      <tbody>
+        <tr><th>Closest DATE_DIF</th><td>${valText(best.date)}</td><td>—</td></tr>
+  `;
+  LAB_FIELDS.forEach(f=>{
+    const v = best.hasOwnProperty(f)? best[f] : null;
+    const rawRef = (REF_RANGES && REF_RANGES[f]) ? REF_RANGES[f] : "—";
+    const ref = (()=>{
+      const low = String(rawRef).toLowerCase();
+      if (low.includes("varies") || low.includes("no single")) return "—";
+      const tokens = String(rawRef).match(/\d+(?:\.\d+)?%?/g) || [];
+      if (tokens.length === 0) return "—";
+      if (tokens.length === 1) return tokens[0];
+      return tokens.slice(0,2).join(" - ");
+    })();
+    html += `<tr><th>${f}</th><td>${valText(v)}</td><td>${ref}</td></tr>`;
+  });
+  html += "</tbody></table>";
+  host.innerHTML = html;
+}
+function iconHTML(v){
+  if (v===1 || v==="1") return '<span class="icon good">✓</span>';
+  if (v===0 || v==="0") return '<span class="icon bad">✕</span>';
+  return '<span class="icon unk">?</span>';
+}
+function renderSymptoms(){
+  const pid=currentPatient;
+  const targetDate=PATIENTS[pid].notes[pos].date;
+  const best=closestLabRec(pid, targetDate);
+  const host=document.getElementById("sym-content"); host.innerHTML="";
+  if(!best){ host.innerHTML='<div class="small muted">No symptom row found for this date.</div>'; return; }
+
+  const wrap=el("div",{class:"sym-grid"});
+  wrap.appendChild(el("div",{class:"sym-head"},"Previ."));
+  wrap.appendChild(el("div",{class:"sym-head"},"Curr."));
+  wrap.appendChild(el("div",{class:"sym-head"},"Symptom"));
+
+
+  SYM_ORDER.forEach(base=>{
+    const group=SYM_GROUPS[base]; if(!group) return;
+    const rawLabel=base.replaceAll("_"," ").replace("general asthma symptoms worsening current","general asthma symptoms worsening");
+    const label=titleCase(rawLabel);
+
+    const pv=(group.previous && (group.previous in best))? best[group.previous] : null;
+    const cv=(group.current  && (group.current  in best))? best[group.current ] : null;
+
+    const pcell=el("div"); pcell.innerHTML = iconHTML(pv);
+    const ccell=el("div"); ccell.innerHTML = iconHTML(cv);
+
+    wrap.appendChild(pcell);
+    wrap.appendChild(ccell);
+    wrap.appendChild(el("div",{},label));
+  });
+  host.appendChild(wrap);
+}
+
+/* ---------- Annotation storage ---------- */
+function loadPatientAnnotations(pid){
+  try { return JSON.parse(localStorage.getItem("ann_"+pid)) || []; } catch(e){ return []; }
+}
+function savePatientAnnotations(pid, arr){
+  try { localStorage.setItem("ann_"+pid, JSON.stringify(arr)); } catch(e){}
+}
+
+// Robust delete: by ts if present, else fingerprint
+function deleteAnnotation(pid, ts, fp){
+  const arr = loadPatientAnnotations(pid);
+
+  // If timestamp present, use it
+  if (ts) {
+    const newArr = arr.filter(r => String(r.ts || "") !== String(ts || ""));
+    savePatientAnnotations(pid, newArr);
+    return;
+  }
+  // Fallback: fingerprint (works for legacy rows)
+  let removed = false;
+  const newArr = arr.filter(r => {
+    if (removed) return true;
+    const match =
+      String(r.date)            === String(fp.date) &&
+      String(r.annotator||"")   === String(fp.annotator||"") &&
+      String(r.note||"")        === String(fp.note||"") &&
+      String(!!r.bioUse)        === String(!!fp.bioUse) &&
+      String(r.bioStart||"")    === String(fp.bioStart||"") &&
+      String(r.bioEnd||"")      === String(fp.bioEnd||"") &&
+      (fp.bioUse ? true : String(!!(r.bioCand)) === String(!!(fp.bioCand)));
+    if (match) { removed = true; return false; }
+    return true;
+  });
+  savePatientAnnotations(pid, newArr);
+}
+
+function loadAllAnnotations(){
+  const out=[];
+  for (let i=0;i<localStorage.length;i++){
+    const k = localStorage.key(i);
+    if (k && k.startsWith("ann_")){
+      try{
+        const pid = k.slice(4);
+        const arr = JSON.parse(localStorage.getItem(k) || "[]");
+        arr.forEach(r => out.push({...r, pid}));
+      }catch(e){}
+    }
+  }
+  out.sort((a,b)=> (b.ts||0)-(a.ts||0) || (b.date||0)-(a.date||0));
+  return out;
+}
+function renderAnnTable(){
+  const anns=loadAllAnnotations();
+  const wrap=document.getElementById("ann-table-wrap");
+  const empty=document.getElementById("no-anns");
+  const body=document.getElementById("ann-body");
+  if(anns.length===0){ wrap.style.display="none"; empty.style.display="block"; body.innerHTML=""; return; }
+  empty.style.display="none"; wrap.style.display="block"; body.innerHTML="";
+  anns.forEach(a=>{
+    const tr=el("tr");
+    tr.appendChild(el("td",{}, a.pid));
+    tr.appendChild(el("td",{}, String(a.date)));
+    tr.appendChild(el("td",{}, a.bioUse ? "Yes" : "No"));
+    const dr = (a.bioUse && (a.bioStart||a.bioEnd)) ? `${a.bioStart||""} - ${a.bioEnd||""}` : "—";
+    tr.appendChild(el("td",{}, dr));
+    tr.appendChild(el("td",{}, (a.bioUse ? "—" : (a.bioCand ? "Yes" : "No"))));
+    tr.appendChild(el("td",{}, a.note || ""));
+    tr.appendChild(el("td",{}, a.annotator || "—"));
+
+    const delTd = el("td");
+    const btn = el("button", {
+      type:"button",
+      class:"ghost ann-del",
+      "data-pid": a.pid,
+      "data-ts":  String(a.ts || ""),
+      "data-date": String(a.date ?? ""),
+      "data-annotator": a.annotator || "",
+      "data-note": a.note || "",
+      "data-bious": a.bioUse ? "1" : "0",
+      "data-biostart": a.bioUse ? (a.bioStart || "") : "",
+      "data-bioend":   a.bioUse ? (a.bioEnd   || "") : "",
+      "data-biocand":  a.bioUse ? "" : (a.bioCand ? "1" : "0")
+    }, "🗑 Remove");
+    delTd.appendChild(btn);
+    tr.appendChild(delTd);
+
+    body.appendChild(tr);
+  });
+}
+
+/* ---------- Export to TXT ---------- */
+function downloadTxt(filename, text){
+  const blob = new Blob([text], {type:"text/plain"});
+  const url = URL.createObjectURL(blob);
+  const a = document.createElement("a");
+  a.href = url; a.download = filename; a.click();
+  URL.revokeObjectURL(url);
+}
+function exportAnnotations(){
+  const who = getAnnotator();
+  if (!who){ alert("Please set the annotator name first."); return; }
+  const anns = loadAllAnnotations();
+  let lines = [];
+  lines.push(`Annotator: ${who}`);
+  lines.push(`Exported: ${new Date().toISOString()}`);
+  lines.push("");
+  anns.forEach(a=>{
+    lines.push(`PATIENT: ${a.pid}`);
+    lines.push(`NoteDate: ${a.date}`);
+    lines.push(`BiologicUse: ${a.bioUse ? "Yes" : "No"}`);
+    if (a.bioUse){
+      lines.push(`DateRange: ${a.bioStart||""} - ${a.bioEnd||""}`);
+    } else {
+      lines.push(`Candidate: ${a.bioCand ? "Yes" : "No"}`);
+    }
+    if (a.note) lines.push(`Note: ${a.note}`);
+    lines.push(`---`);
+  });
+  downloadTxt(`${who}_annotations.txt`, lines.join("\n"));
+}
+
+/* ---------- Navigation ---------- */
+function nextNote(){ pos=(pos+1)%PATIENTS[currentPatient].notes.length; renderAllForNote(); }
+function prevNote(){ pos=(pos-1+PATIENTS[currentPatient].notes.length)%PATIENTS[currentPatient].notes.length; renderAllForNote(); }
+function nextPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i+1)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
+function prevPatient(){ const i=PATIENT_IDS.indexOf(currentPatient); const j=(i-1+PATIENT_IDS.length+PATIENT_IDS.length)%PATIENT_IDS.length; switchPatient(PATIENT_IDS[j]); }
+function switchPatient(pid){
+  currentPatient=pid; pos=0;
+  document.getElementById("free-note").value="";
+  // reset biologic UI to defaults
+  document.getElementById("bioUseNo").checked = true;
+  document.getElementById("bioUseYes").checked = false;
+  document.getElementById("bio-yes-extra").style.display = "none";
+  document.getElementById("bio-no-extra").style.display  = "flex";
+  document.getElementById("bioCandNo").checked = true;
+  document.getElementById("bioCandYes").checked = false;
+  document.getElementById("bioStart").value = "";
+  document.getElementById("bioEnd").value = "";
+  lockBioRadioForPatient();
+  renderAll();
+}
+
+/* ---------- Render orchestration ---------- */
+function renderAll(){
+  renderAnnotatorUI();
+  renderPatientSelect(); renderHeader(); 
+  lockBioRadioForPatient(); // <— add this
+  renderText(); renderTimeline();
+  renderAnnTable(); renderDemographics(); renderLabsForCurrentNote(); renderSymptoms();
+}
+function renderAllForNote(){
+  renderHeader(); renderText(); renderTimeline();
+  renderLabsForCurrentNote(); renderSymptoms();
+}
+
+/* ---------- Boot ---------- */
+document.addEventListener("DOMContentLoaded", ()=>{
+  if (PATIENT_IDS.length===0){ alert("No eligible patients (filtered by labs CSV)."); return; }
+  renderAll();
+
+  document.getElementById("next-btn").onclick=(e)=>{ e.preventDefault(); nextNote(); };
+  document.getElementById("prev-btn").onclick=(e)=>{ e.preventDefault(); prevNote(); };
+  document.getElementById("next-patient-btn").onclick=(e)=>{ e.preventDefault(); nextPatient(); };
+  document.getElementById("prev-patient-btn").onclick=(e)=>{ e.preventDefault(); prevPatient(); };
+  document.getElementById("friendly-btn").onclick=()=>{ friendlyMode=!friendlyMode; renderText(); };
+
+  // Biologic UI toggles
+  const useNo = document.getElementById("bioUseNo");
+  const useYes = document.getElementById("bioUseYes");
+  useNo.onchange = () => { if (useNo.checked){ document.getElementById("bio-yes-extra").style.display="none"; document.getElementById("bio-no-extra").style.display="flex"; } };
+  useYes.onchange = () => { if (useYes.checked){ document.getElementById("bio-yes-extra").style.display="flex"; document.getElementById("bio-no-extra").style.display="none"; } };
+
+  // Save annotation
+  document.getElementById("save-annotation").onclick=(e)=>{
+    e.preventDefault();
+    const annotator = getAnnotator();
+    if (!annotator){ alert("Please set the annotator name first."); return; }
+
+    const P = PATIENTS[currentPatient];
+    const note = P.notes[pos];
+    const textNote = document.getElementById("free-note").value || "";
+
+    const bioUse   = document.getElementById("bioUseYes").checked;
+    const bioStart = document.getElementById("bioStart").value || "";
+    const bioEnd   = document.getElementById("bioEnd").value || "";
+    const bioCand  = document.getElementById("bioCandYes").checked;
+
+    const rec = {
+      date: note.date,
+      note: textNote,
+      annotator: annotator,
+      bioUse: !!bioUse,
+      bioStart: bioUse ? bioStart : "",
+      bioEnd:   bioUse ? bioEnd   : "",
+      bioCand:  bioUse ? null : !!bioCand,
+      ts: Date.now()
+    };
+    const arr = loadPatientAnnotations(currentPatient);
+    arr.unshift(rec);
+    savePatientAnnotations(currentPatient, arr);
+    renderAnnTable();
+    alert("Annotation saved.");
+  };
+
+  // Export txt
+  document.getElementById("export-txt").onclick=(e)=>{ e.preventDefault(); exportAnnotations(); };
+
+  // Delete buttons (event delegation)
+  document.getElementById("ann-body").addEventListener("click", (e)=>{
+    const btn = e.target.closest(".ann-del");
+    if (!btn) return;
+    e.preventDefault();
+    const pid = btn.getAttribute("data-pid");
+    const ts  = btn.getAttribute("data-ts");
+
+    const fp = {
+      date: btn.dataset.date,
+      annotator: btn.dataset.annotator || "",
+      note: btn.dataset.note || "",
+      bioUse: btn.dataset.bious === "1",
+      bioStart: btn.dataset.biostart || "",
+      bioEnd: btn.dataset.bioend || "",
+      bioCand: btn.dataset.biocand === "" ? null : (btn.dataset.biocand === "1")
+    };
+
+    if (!pid) return;
+    if (confirm("Remove this annotation?")){
+      deleteAnnotation(pid, ts, fp);
+      renderAnnTable();
+    }
+  });
+});